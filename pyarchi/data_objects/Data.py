@@ -1,4 +1,6 @@
-from astropy.io import fits
+from contextlib import contextmanager
+from multiprocessing import Pool
+
 import numpy as np
 
 from pyarchi.masks_creation import create_circular_mask, create_shape_mask
@@ -12,6 +14,9 @@ from pyarchi.utils import get_optimized_mask
 from pyarchi.utils import create_logger
 
 from .Star_class import Star
+from .Frames import Frames, FrameCache, SharedFrames
+from .chunk_photometry import gather_points, photometry_chunk, init_worker, worker_chunk
+from .Metadata import DRPMetadata, OFFICIAL_CURVES
 
 logger = create_logger("Data")
 
@@ -27,7 +32,7 @@ class Data:
         roll_ang:
             rotation angle for all the images.
         imgs:
-            all the images in the fits file.
+            :class:`~pyarchi.data_objects.Frames.Frames` object, with read-only access to the images in the fits file.
         stars:
             List in which all elements are a "Star" object that holds information of one star.
         mask_type:
@@ -36,8 +41,14 @@ class Data:
             detection mode used
         init_detection_mode:
             initial detection mode
+        metadata:
+            :class:`~pyarchi.data_objects.Metadata.DRPMetadata` object with the information from the DRP files. It is
+            only loaded once, and kept between runs over the same visit.
         mjd_time:
             mjd time of the observations
+        virtual_grid:
+            If set, the photometry with a background grid is made over the original images, using the mask points
+            inside each pixel as weights, instead of increasing the images
     """
 
     def __init__(self, filename):
@@ -51,6 +62,7 @@ class Data:
         self.init_detection_mode = ""
         self.used_file = filename
         self.bg_grid = 0
+        self.virtual_grid = 0
 
         # data loaded from the fits file
         self.roll_ang = None
@@ -59,20 +71,27 @@ class Data:
         self.offsets = None
         self.image_number = None
         self.forbidden_regions = []
+        self._forbidden_mask = None
+        self.metadata = None
 
         # misc
         self._stars = []
-        self._image_dict = {}
+        self._image_cache = FrameCache()
         self.low_mem = 0
         self.calc_uncert = False
         self.uncertainties_params = {}  # to estimate the uncertainties for our data
 
+        # optimization session
+        self._session = None
+        self._tracked = False
+        self._shared_frames = None
+
     def _reset(self):
         """
         Resets the object to its initial state. "Cleaning" all data previously stored in here.
 
         It's called when the parameters are loaded on :function:`pyarchi.main.initial_loads.Data.load_parameters`.
-        Keep in mind that the reset routine does not re-enable the disabled stars.
+        Keep in mind that the reset routine does not re-enable the disabled stars, nor removes the DRP metadata.
         Returns
         -------
 
@@ -93,8 +112,10 @@ class Data:
         self._imgs = None
         self.offsets = None
         self.forbidden_regions = []
+        self._forbidden_mask = None
 
-        self._image_dict = {}
+        self._image_cache = FrameCache()
+        self._tracked = False
 
         # misc
         for star in self._stars:
@@ -125,6 +146,96 @@ class Data:
 
         return on_call
 
+    @contextmanager
+    def optimization_session(self):
+        """
+        Context manager for the optimization process, where this object is loaded with many factors over the same
+        data. Inside it, the first call to :meth:`load_parameters` loads everything. The following ones, with the same
+        configuration, only create the masks of the new factor: the images, the DRP metadata and the stars, with their
+        initial positions, are kept.
+
+        If the trajectories of all stars, found by the previous run, cover every image, they are also kept and the
+        star tracking is not repeated (see :attr:`is_tracked`).
+
+        Sessions can be nested: the inner ones use the data of the outermost session, which is the one that ends it.
+        """
+        if self._session is not None:
+            yield self
+            return
+
+        self._session = {}
+        try:
+            yield self
+        finally:
+            self._session = None
+
+    @contextmanager
+    def shared_frames(self, enabled=True, **kwargs):
+        """
+        Context manager that decodes the images of the SubArray file once, into shared memory, with a
+        :class:`~pyarchi.data_objects.Frames.SharedFrames`. Inside it, this object (and all copies of it sent to other
+        processes) reads the images from the shared memory, instead of opening the file. If the shared memory can't be
+        created, the images are read from the file, as usual.
+
+        Parameters
+        ----------
+        enabled:
+            If False, nothing is done
+        kwargs:
+            Configuration used to find the SubArray file
+        """
+        if not enabled:
+            yield self
+            return
+
+        try:
+            self._shared_frames = SharedFrames(path_finder(mode="subarray", **kwargs))
+        except Exception as exc:
+            logger.warning("Could not share the images between processes: {}".format(exc))
+            yield self
+            return
+
+        try:
+            yield self
+        finally:
+            self._shared_frames.close()
+            self._shared_frames = None
+
+    def _in_session(self, **kwargs):
+        """
+        Checks if the data loaded in the optimization session can be used with this configuration
+        """
+        if self._session is None or self._error_flag or "kwargs" not in self._session:
+            return False
+
+        previous = self._session["kwargs"]
+        if previous.keys() != kwargs.keys():
+            return False
+
+        return all(np.array_equal(previous[key], kwargs[key]) for key in kwargs)
+
+    def _reload_masks(self, factor, **kwargs):
+        """
+        Removes the masks and the photometry of all stars and creates the masks of a new factor, keeping everything
+        else loaded. The trajectories of the stars are kept if they cover all images.
+
+        Returns
+        -------
+        -1:
+            Errors were found during runtime
+        0:
+            Everything went without problems
+        """
+        self._tracked = all(len(star.positions) >= self.image_number for star in self._stars)
+
+        for star in self._stars:
+            star.remove_data(keep_positions=self._tracked)
+
+        if self._initialize_masks(factor, **kwargs) == -1:
+            self._error_flag = 1
+            return -1
+        return 0
+
     def load_parameters(self, factor=None, **kwargs):
         """
         Loads all the necessary information from the .fits files. Launches the routines to find the initial
@@ -133,9 +244,12 @@ class Data:
         Before running the internal parameters, as well as the star's ones are removed. This was made in order to
         minimize loading data from disk. However, keep in mind that the reset routine does not re-enable stars. So, if a
         star was disabled in this object, then it will stay that way unless a new object is instantiated.
+
+        Inside an :meth:`optimization_session`, only the masks are created again if the configuration did not change.
         Parameters
         ----------
         factor
+            Mask factor. If a list is passed, the masks of all factors are stored as concentric layers
         kwargs
 
         Returns
@@ -146,12 +260,16 @@ class Data:
             Everything went without problems
 
         """
+        if self._in_session(**kwargs):
+            return self._reload_masks(factor, **kwargs)
+
         self._reset()
         self.base_folder = kwargs["base_folder"]
         self.init_detection_mode = kwargs['initial_detect']
         self.detect_mode = kwargs["detect_mode"]
         self.mask_type = kwargs["method"]
         self.bg_grid = kwargs["grid_bg"]
+        self.virtual_grid = kwargs.get("virtual_grid", 0)
         self.low_mem = kwargs["low_memory"]
         self.calc_uncert = kwargs["uncertainties"]
 
@@ -165,7 +283,11 @@ class Data:
         else:
             init_image = self.get_image(0)
 
-            self.forbidden_regions = np.where(np.isnan(init_image))
+            self._forbidden_mask = np.isnan(init_image)
+            self.forbidden_regions = np.where(self._forbidden_mask)
+
+        if self._session is not None:
+            self._session["kwargs"] = kwargs
         return 0
 
     @_verify_validity
@@ -174,6 +296,10 @@ class Data:
         Controls the data treatment process for each image. Updates the masks for each star and calculates the flux
         passing through our mask. Afterwards the mask is validated to see if we have overlaps with the forbidden region,
         i.e., if the mask is over the  NaN areas of the image.
+
+        If the virtual_grid is active, the increased images are never created: each mask is reduced to the original
+        grid, where each pixel holds the number of mask points inside it, and applied to the original image. This
+        gives the same flux as the background grid, with a fraction of the memory and operations.
         Parameters
         ----------
         image_number
@@ -187,29 +313,189 @@ class Data:
         """
 
         scaling_factor = self.bg_grid / 200 if self.bg_grid else 1
+        use_virtual = self.virtual_grid and scaling_factor != 1
+
+        if use_virtual:
+            final_img = np.divide(self._imgs[image_number], scaling_factor ** 2)
+
         for star in self._stars:
             if not star.is_active:
                 continue
 
             star.update_mask(scaling_factor, image_number)
 
-            final_img = self.get_image(image_number)
-            try:
-                final_result = np.multiply(star.latest_mask, final_img)
-            except Exception as e:
-                print(image_number)
-                print(star, star.latest_mask.shape, final_img.shape)
-                raise e
+            if use_virtual:
+                star_mask = star.masks.latest_sparse.reduced(scaling_factor)
+            else:
+                star_mask = star.masks.latest_sparse
+                final_img = self.get_image(image_number)
 
-            photom = np.nansum(final_result)
+            star.add_photom(star_mask.apply(final_img))
 
-            star.add_photom(photom)
+            if star.has_layers:
+                self._update_layers(star, final_img, use_virtual, scaling_factor)
+            elif star.has_profile:
+                self._update_profile(star, image_number, use_virtual, scaling_factor)
 
         self._validate_forbidden_region(image_number)
 
+    def _update_layers(self, star, image, use_virtual, scaling_factor):
+        """
+        Calculates the flux of each of the star's concentric layers, for the latest image, and checks which ones
+        overlap the forbidden region
+        """
+        x_change, y_change = star.masks.latest_shift
+
+        values = []
+        out_bounds = []
+        for layer in star.layers:
+            layer = layer.shifted(x_change, y_change)
+            out_bounds.append(layer.overlaps(self._forbidden_mask))
+
+            if use_virtual:
+                layer = layer.reduced(scaling_factor)
+            values.append(layer.apply(image))
+
+        star.add_layer_photom(values, out_bounds)
+
+    def _update_profile(self, star, image_number, use_virtual, scaling_factor):
+        """
+        Calculates the flux of each radial bin of the star's curve of growth, for the latest image, and checks which
+        ones overlap the forbidden region
+        """
+        rows, cols, _ = star.profile.mask.points()
+        shift = np.asarray(star.masks.latest_shift)[np.newaxis, :]
+
+        if use_virtual:
+            images, ratio = self._imgs[image_number][np.newaxis], int(scaling_factor)
+        else:
+            images, ratio, scaling_factor = self.get_image(image_number)[np.newaxis], 1, 1
+
+        values, forbidden = self._gather_points(images, rows, cols, shift, ratio, scaling_factor)
+
+        star.add_layer_photom(star.profile.bin_flux(values)[0], star.profile.bin_any(forbidden))
+
+    @_verify_validity
+    def update_stars_batch(self, chunk_size=256, processes=1):
+        """
+        Calculates the flux of all stars, for all images, at once. Can only be used when the positions of the stars
+        were already calculated for every image, i.e. when the tracking does not depend on the images (static and
+        offsets). Gives the same results as calling :meth:`update_stars` and :meth:`calculate_uncertainties` for each
+        image.
+
+        For each star, the points of the first mask are shifted to every image and the values of those points are
+        gathered from the original images, in chunks of images, and summed. With a background grid, each point of the
+        big grid is read from the pixel that contains it, so the increased images are never created. The concentric
+        layers of the stars, if multiple factors are in use, are calculated in the same way.
+
+        Since the chunks are independent, they can be calculated in parallel by a pool of processes, each one with its
+        own memory-map of the SubArray file. The results are merged afterwards, in the order of the images.
+
+        Parameters
+        ----------
+        chunk_size:
+            Number of images that are read from disk at once
+        processes:
+            Number of processes used to calculate the chunks. If it's 1, everything runs in this process
+
+        Returns
+        -------
+
+        """
+        scaling_factor = self.bg_grid / 200 if self.bg_grid else 1
+        ratio = int(scaling_factor)
+
+        active_stars = [star for star in self._stars if star.is_active]
+        all_shifts = [star.update_all_masks(self.image_number) for star in active_stars]
+
+        # for each star, the first mask followed by the layers, if multiple factors are in use
+        all_points = [
+            [star.masks.first_sparse.points()] + [layer.points() for layer in (star.layers or [])]
+            for star in active_stars
+        ]
+        profiles = [star.profile for star in active_stars]  # radial bins of the stars with a curve of growth
+
+        if processes > 1:
+            # smaller chunks, if needed, so that all processes have work to do
+            chunk_size = max(min(chunk_size, -(-self.image_number // processes)), 1)
+        chunks = [
+            (start, min(start + chunk_size, self.image_number)) for start in range(0, self.image_number, chunk_size)
+        ]
+
+        if processes > 1:
+            with Pool(
+                processes,
+                initializer=init_worker,
+                initargs=(
+                    self._imgs.path, self._imgs.step, all_points, profiles, ratio, scaling_factor, self._forbidden_mask
+                ),
+            ) as pool:
+                tasks = [(start, stop, [shifts[start:stop] for shifts in all_shifts]) for start, stop in chunks]
+                results = dict(pool.starmap(worker_chunk, tasks))
+        else:
+            results = {
+                start: photometry_chunk(
+                    self._imgs[start:stop],
+                    [shifts[start:stop] for shifts in all_shifts],
+                    all_points,
+                    profiles,
+                    ratio,
+                    scaling_factor,
+                    self._forbidden_mask,
+                )
+                for start, stop in chunks
+            }
+
+        ordered = [results[start] for start, _ in chunks]
+        fluxes = []
+
+        for star_index, star in enumerate(active_stars):
+            star_results = [chunk_results[star_index] for chunk_results in ordered]
+
+            star_fluxes = np.concatenate([result[0] for result in star_results])
+            out_frames = np.concatenate([result[1] for result in star_results])
+
+            star.import_photom(list(star_fluxes[:, 0]))
+            fluxes.append(star_fluxes[:, 0])
+
+            for image_number in np.where(out_frames[:, 0])[0]:
+                star.out_bounds(int(image_number))
+
+            if star.has_layers:
+                star.import_layer_photom(star_fluxes[:, 1:], out_frames[:, 1:].any(axis=0))
+            elif star.has_profile:
+                star.import_layer_photom(
+                    np.concatenate([result[2] for result in star_results]),
+                    np.any([result[3] for result in star_results], axis=0),
+                )
+
+        if self.calc_uncert:
+            params = self.uncertainties_params
+            for star_index, star in enumerate(active_stars):
+                npix = star.masks.normalized_points
+                flux = fluxes[star_index]
+                star.import_uncertainties(
+                    list(
+                        np.sqrt(
+                            flux
+                            + params["bg"] * npix
+                            + npix * params["nstack"] * params["cron"] ** 2
+                            + params["dark"] * npix
+                        )
+                    )
+                )
+
+    def _gather_points(self, images, rows, cols, shifts, ratio, scaling_factor):
+        """
+        Reads the values of the mask points from a set of images. See
+        :func:`~pyarchi.data_objects.chunk_photometry.gather_points`
+        """
+        return gather_points(images, rows, cols, shifts, ratio, scaling_factor, self._forbidden_mask)
+
     def get_image(self, number):
         """
-        Ask for a given image. If the background grid is in use, returns the increased image
+        Ask for a given image. If the background grid is in use, returns the increased image. The returned images are
+        read-only, so they must be copied before changing their values.
         
         Parameters
         ----------
@@ -222,13 +508,57 @@ class Data:
             Desired image
         """
         if number == "all":
-            return list(self._image_dict.values()) if self._image_dict else self._imgs
+            return self._image_cache.values() if len(self._image_cache) else self._imgs
 
         if self.low_mem or self.bg_grid:
-            self._increase_imgs(number)
-            return self._image_dict[number].copy()
+            return self._image_cache.get(number, self._increase_imgs)
         else:
-            return self._imgs[number].copy()
+            return self._imgs[number]
+
+    def get_window(self, number, center, half_size):
+        """
+        Returns a window of the image, centered in the given position. If the background grid is in use, only the
+        window is increased, instead of the entire image. The window is cut at the image edges.
+
+        Parameters
+        ----------
+        number : int
+            Image number
+        center:
+            Row and column, in the grid of the masks, of the center of the window
+        half_size: int
+            Number of points between the center and the edges of the window
+
+        Returns
+        -------
+        window: numpy array
+            Points of the image inside the window
+        corner:
+            Row and column, in the grid of the masks, of the first point of the window
+        maximum: float
+            Maximum value of the entire image, in the same grid
+        """
+        ratio = int(self.bg_grid / 200) if self.bg_grid else 1
+        image = self._imgs[number]
+        height, width = image.shape[0] * ratio, image.shape[1] * ratio
+
+        row_start = min(max(int(round(center[0])) - half_size, 0), height)
+        row_end = min(max(int(round(center[0])) + half_size + 1, 0), height)
+        col_start = min(max(int(round(center[1])) - half_size, 0), width)
+        col_end = min(max(int(round(center[1])) + half_size + 1, 0), width)
+
+        if ratio == 1:
+            return np.array(image[row_start:row_end, col_start:col_end]), (row_start, col_start), np.nanmax(image)
+
+        # native pixels that hold the window
+        native = image[row_start // ratio: -(-row_end // ratio), col_start // ratio: -(-col_end // ratio)]
+        window = np.divide(change_grid(native, ratio), ratio ** 2)
+
+        offset_row = row_start - (row_start // ratio) * ratio
+        offset_col = col_start - (col_start // ratio) * ratio
+        window = window[offset_row: offset_row + row_end - row_start, offset_col: offset_col + col_end - col_start]
+
+        return window, (row_start, col_start), np.nanmax(image) / ratio ** 2
 
     def reload_images(self, **kwargs):
         """
@@ -256,77 +586,76 @@ class Data:
 
         """
 
-        self._image_dict = {}
+        # The low memory mode only keeps the last two images, unless a different limit is configured
+        max_frames = kwargs.get("cache_frames", 0) or (2 if self.low_mem else 0)
+        max_bytes = kwargs.get("cache_memory", 0) * 1024 ** 2
+        self._image_cache = FrameCache(max_frames, max_bytes)
 
         logger.info("Extracting official pipeline Lightcurve information")
         try:
-            default_path = path_finder(mode="default", **kwargs)
             subarray_path = path_finder(mode="subarray", **kwargs)
         except:
             self._error_flag = 1
             logger.critical("Could not find paths to DRP outputs")
             return -1
-        try:
-            hdulist = fits.open(default_path)
-        except IOError:
-            logger.error("Official Lightcurve file not found")
-            self._error_flag = 1
-            return -1
-        else:
-            with hdulist:
-                self.roll_ang = hdulist[1].data["ROLL_ANGLE"]
-                self.mjd_time = hdulist[1].data["MJD_TIME"]
-                self.offsets = list(
-                    zip(hdulist[1].data["CENTROID_X"], hdulist[1].data["CENTROID_Y"])
-                )
 
-                self.intended_loc = [hdulist[1].data["LOCATION_X"][0], hdulist[1].data["LOCATION_Y"][0]]
+        if self.metadata is None or not self.metadata.is_same_visit(**kwargs):
+            try:
+                self.metadata = DRPMetadata(**kwargs)
+            except IOError:
+                logger.error("Official Lightcurve file not found")
+                self._error_flag = 1
+                return -1
+            except:
+                self._error_flag = 1
+                logger.critical("Could not find paths to DRP outputs")
+                return -1
 
-                if self.calc_uncert:
-                    possible_curves = ["DEFAULT", "OPTIMAL", "RSUP", "RINF"]
-                    possible_curves.remove(kwargs["official_curve"])
-                    darks = []
+        # with a frame_decimation, only one of every step images is used (e.g. by the successive halving optimization)
+        step = kwargs.get("frame_decimation", 1)
+
+        metadata = self.metadata
+        self.roll_ang = metadata.roll_ang[::step]
+        self.mjd_time = metadata.mjd_time[::step]
+        self.offsets = metadata.offsets[::step]
+        self.intended_loc = metadata.intended_loc
+
+        if self.calc_uncert:
+            if len(metadata.available_curves) != len(OFFICIAL_CURVES):
+                self._error_flag = 1
+                logger.critical("Could not find paths to DRP outputs")
+                return -1
+
+            darks = []
+            for curve in metadata.available_curves:
+                def_points = np.pi * (metadata.header("AP_RADI", curve)) ** 2
+                darks.append(metadata.column("DARK", curve)[::step] / def_points)
+
+                if curve == metadata.official_curve:
+                    self.uncertainties_params["bg"] = metadata.column("BACKGROUND", curve)[::step] / def_points
+
+            self.uncertainties_params["dark"] = np.median(darks, axis=0)
+            self.uncertainties_params["t_exp"] = metadata.header("EXPTIME")
+            self.uncertainties_params["nstack"] = metadata.header("NEXP")
 
-                    def_points = np.pi * (hdulist[1].header["AP_RADI"]) ** 2
-                    self.uncertainties_params["bg"] = (
-                        hdulist[1].data["BACKGROUND"] / def_points
-                    )
-                    curr_dark = hdulist[1].data["DARK"] / def_points
-                    darks.append(curr_dark)
-
-                    for curve in possible_curves:
-                        try:
-                            default_path = path_finder(mode="default", off_curve=curve, **kwargs)
-                        except:
-                            self._error_flag = 1
-                            logger.critical("Could not find paths to DRP outputs")
-                            return -1
-                        with fits.open(default_path) as file:
-                            def_points = (
-                                np.pi * (file[1].header["AP_RADI"]) ** 2
-                            )  # pylint: disable=no-member
-                            curr_dark = (
-                                file[1].data["DARK"] / def_points
-                            )  # pylint: disable=no-member
-                            darks.append(curr_dark)
-
-                    self.uncertainties_params["dark"] = np.median(darks, axis=0)
-                    self.uncertainties_params["t_exp"] = hdulist[1].header["EXPTIME"]
-                    self.uncertainties_params["nstack"] = hdulist[1].header["NEXP"]
         try:
-            hdulist = fits.open(subarray_path)
+            if self._shared_frames is not None and self._shared_frames.path == subarray_path:
+                frames = self._shared_frames
+            else:
+                frames = Frames(subarray_path)
+
+            if step != 1:
+                frames = frames.decimated(step)
         except IOError:
             logger.error("Subarray file not found")
             self._error_flag = 1
             return -1
         else:
-            with hdulist:
-                imgs = hdulist[1].data
-                self._imgs = imgs
-                self.image_number = self._imgs.shape[0]
-                self.image_size = self._imgs[0].shape[::-1]  # to follow the X and Y convention
-                if self.calc_uncert:
-                    self.uncertainties_params["cron"] = 1.96 * hdulist[2].data["RON"]
+            self._imgs = frames
+            self.image_number = len(self._imgs)
+            self.image_size = self._imgs.shape[::-1]  # to follow the X and Y convention
+            if self.calc_uncert:
+                self.uncertainties_params["cron"] = 1.96 * self._imgs.column(2, "RON")[::step]
 
     @_verify_validity
     def _init_pos(self, **kwargs):
@@ -353,7 +682,7 @@ class Data:
                 star.disable()
 
         self._stars = centers_from_fits(
-            primary, secondary, self._stars, self.roll_ang[0], self.offsets[0], **kwargs
+            primary, secondary, self._stars, self.roll_ang[0], self.offsets[0], metadata=self.metadata, **kwargs
         )
 
 
@@ -400,7 +729,10 @@ class Data:
         Parameters
         ----------
         factor:
-            Scaling factor - integer if this is called during the optimizaton process. Otherwise should be a list
+            Scaling factor - integer if this is called during the optimizaton process. Otherwise should be a dict.
+            If a list of factors is passed, the masks of all of them are created and stored as concentric layers. If
+            it's a dict with a list of radii for each star, the curve of growth of the circular masks is calculated,
+            while the shape masks are stored as concentric layers of their own factors
 
         size_grid_change:
             size of the big grid
@@ -415,14 +747,141 @@ class Data:
             logger.fatal("Process was aborted due to previous errors")
             return -1
 
+        if isinstance(factor, (list, tuple, np.ndarray)):
+            return self._create_layers(sorted(factor), scaling_factor, **kwargs)
+
+        if isinstance(factor, dict) and any(isinstance(val, (list, tuple, np.ndarray)) for val in factor.values()):
+            return self._create_profiles(factor, scaling_factor, **kwargs)
+
+        full_dict = self._masks_dict(factor, scaling_factor, **kwargs)
+        if full_dict == -1:
+            return -1
+
+        for key, mask in full_dict.items():
+            process_flag = self._stars[key].add_initial_mask(
+                mask, factor, scaling_factor, kwargs["low_memory"]
+            )
+
+            if process_flag == -1:
+                return -1
+
+        return 0
+
+    def _create_layers(self, factors, scaling_factor, **kwargs):
+        """
+        Creates the masks of all factors for each star, which are stored as concentric layers. Used to calculate the
+        flux of all factors in a single run.
+
+        Parameters
+        ----------
+        factors:
+            List of factors, in ascending order
+        scaling_factor:
+            size of the big grid
+
+        Returns
+        -------
+
+        """
+        all_masks = self._masks_dict(list(factors), scaling_factor, **kwargs)
+        if all_masks == -1:
+            return -1
+
+        for key, masks in all_masks.items():
+            process_flag = self._stars[key].add_initial_layers(
+                masks, factors, scaling_factor, kwargs["low_memory"]
+            )
+
+            if process_flag == -1:
+                return -1
+
+        return 0
+
+    def _create_profiles(self, radii, scaling_factor, **kwargs):
+        """
+        Creates the masks of a different list of factors for each star, calculated in a single run. The stars with a
+        circular mask get the mask with the largest of its radii and a
+        :class:`~pyarchi.data_objects.Mask.RadialProfile`, from which the flux of all the other radii is calculated.
+        The stars with a shape mask get the masks of their factors as concentric layers, as in :meth:`_create_layers`.
+
+        Parameters
+        ----------
+        radii:
+            Dictionary where the keys are the number of the star and the values the list of radii (or factors)
+        scaling_factor:
+            size of the big grid
+
+        Returns
+        -------
+
+        """
         if "+" not in kwargs["method"]:
             primary = secondary = kwargs["method"]
         else:
             primary, secondary = kwargs["method"].split("+")
 
-        circle_result = create_circular_mask(
-            self.get_image(0), self._stars, factor, primary, secondary
-        )
+        largest = {key: np.max(np.abs(values)) for key, values in radii.items()}
+
+        # the circular masks only need the largest radius, the shape masks need every (valid) factor
+        star_factors = {}
+        for key, values in radii.items():
+            valid = sorted({value for value in np.atleast_1d(values).tolist() if value > 0})
+            is_circle = (primary if key == "0" else secondary) == "circle"
+            star_factors[key] = valid if valid and not is_circle else largest[key]
+
+        full_dict = self._masks_dict(star_factors, scaling_factor, **kwargs)
+        if full_dict == -1:
+            return -1
+
+        shape = self.get_image(0).shape
+
+        for key, mask in full_dict.items():
+            star = self._stars[key]
+
+            if (primary if key == 0 else secondary) == "circle":
+                if star.add_initial_mask(mask, largest, scaling_factor, kwargs["low_memory"]) == -1:
+                    return -1
+                star.add_initial_profile(shape, list(radii[str(key)]))
+
+            elif isinstance(mask, list):
+                if star.add_initial_layers(mask, star_factors[str(key)], scaling_factor, kwargs["low_memory"]) == -1:
+                    return -1
+
+            elif star.add_initial_mask(mask, largest, scaling_factor, kwargs["low_memory"]) == -1:
+                return -1
+
+        return 0
+
+    def _masks_dict(self, factor, scaling_factor, **kwargs):
+        """
+        Creates the initial mask of each star, for one factor. If a list of factors is passed, the masks of all of them
+        are created. The contours of the shape masks are only found once, and increased to all factors at once
+
+        Returns
+        -------
+        full_dict:
+            Dictionary where the keys are the number of the star and the values the corresponding mask, or the list with
+            the mask of each factor
+        """
+        if "+" not in kwargs["method"]:
+            primary = secondary = kwargs["method"]
+        else:
+            primary, secondary = kwargs["method"].split("+")
+
+        if isinstance(factor, list):
+            circle_result = {}
+            for value in factor:
+                single_result = create_circular_mask(self.get_image(0), self._stars, value, primary, secondary)
+                if single_result == -1:
+                    circle_result = -1
+                    break
+
+                for key, mask in single_result.items():
+                    circle_result.setdefault(key, []).append(mask)
+        else:
+            circle_result = create_circular_mask(
+                self.get_image(0), self._stars, factor, primary, secondary
+            )
         if circle_result == -1:
             logger.fatal("Could not create mask using the 'CIRCLE' method. ")
             return -1
@@ -438,15 +897,7 @@ class Data:
         full_dict = circle_result.copy()
         full_dict.update(shape_result)
 
-        for key, mask in full_dict.items():
-            process_flag = self._stars[key].add_initial_mask(
-                mask, factor, scaling_factor, kwargs["low_memory"]
-            )
-
-            if process_flag == -1:
-                return -1
-
-        return 0
+        return full_dict
 
     def calculate_uncertainties(self, index):
         """
@@ -482,7 +933,7 @@ class Data:
             if not star.is_active:
                 continue
 
-            if star.latest_mask[self.forbidden_regions].any() != 0:
+            if star.masks.latest_sparse.overlaps(self._forbidden_mask):
                 star.out_bounds(image_number)
 
     def disable_star(self, star_number):
@@ -499,30 +950,34 @@ class Data:
         """
         self._stars[star_number].disable()
 
-    @_verify_validity
-    def _increase_imgs(self, index):
+    def enable_stars(self):
         """
-        Increases the size of all images before the process starts
-        Returns
-        -------
+        Enables all stars that were disabled with :meth:`disable_star`
+        """
+        for star in self._stars:
+            star.enable()
 
+    def _increase_imgs(self, index):
         """
+        Increases the size of the desired image. The image is decoded from the memory-mapped cube when needed. Used
+        to fill the image cache, which decides how many of the increased images are kept in memory.
 
-        if index not in self._image_dict:
-            ratio = self.bg_grid / 200
-            if ratio == 0:
-                im = self._imgs[0].copy()
-            else:
-                im = np.divide(change_grid(self._imgs[0].copy(), ratio), ratio ** 2)
+        Parameters
+        ----------
+        index: int
+            Image number
 
-            self._imgs = self._imgs[1:]
+        Returns
+        -------
+        image: numpy array
+            Image in the background grid
+        """
 
-            self._image_dict[index] = im
+        ratio = self.bg_grid / 200
+        if ratio == 0:
+            return np.array(self._imgs[index])
 
-            if self.low_mem:
-                self._image_dict = {
-                    key: val for key, val in self._image_dict.items() if key > index - 2
-                }
+        return np.divide(change_grid(self._imgs[index], ratio), ratio ** 2)
 
     # Properties of the class
     @property
@@ -537,6 +992,36 @@ class Data:
         else:
             return []
 
+    @property
+    def cache_stats(self):
+        """
+        Usage counters (hits, misses, evictions and memory) of the cache that holds the images in the background grid
+        """
+        return self._image_cache.stats
+
+    @property
+    def is_tracked(self):
+        """
+        True if the positions of all stars, in every image, were kept from a previous run of the optimization session.
+        In this case, the star tracking does not have to be repeated
+        """
+        return self._tracked
+
+    @property
+    def subarray_path(self):
+        """
+        Path to the SubArray file, so that other processes can open the images on their own
+        """
+        return self._imgs.path
+
+    @property
+    def frame_step(self):
+        """
+        Distance, in the SubArray file, between consecutive images in use. It's larger than one if the images were
+        decimated, with the frame_decimation value given by the successive halving of the optimization
+        """
+        return self._imgs.step
+
     @property
     def abort_process(self):
         """
@@ -0,0 +1,335 @@
+import copy
+import os
+import shutil
+from collections import OrderedDict
+from multiprocessing.shared_memory import SharedMemory
+
+from astropy.io import fits
+import numpy as np
+
+from pyarchi.utils import create_logger
+
+logger = create_logger("frames")
+
+# folder of the shared memory, on Linux. It can be much smaller than the RAM, e.g. 64 MB inside Docker
+SHARED_MEMORY_FOLDER = "/dev/shm"
+
+
+def scaled_dtype(bitpix, bscale, bzero):
+    """
+    Data type of the images after BSCALE/BZERO are applied, the same as the one given by astropy: the integer images
+    whose BZERO only shifts the sign bit (e.g. BITPIX=16 and BZERO=32768) are unsigned integers, the other integer
+    images are floats (float32 up to 16 bits, float64 above) and the float images keep their precision
+
+    Parameters
+    ----------
+    bitpix: int
+        BITPIX of the HDU
+    bscale:
+        BSCALE of the HDU
+    bzero:
+        BZERO of the HDU
+
+    Returns
+    -------
+    dtype: numpy dtype
+    """
+    if bitpix < 0:
+        return np.dtype("float{}".format(-bitpix))
+
+    if bscale == 1:
+        if bitpix == 8 and bzero == -128:
+            return np.dtype("int8")
+        if bitpix > 8 and bzero == 1 << (bitpix - 1):
+            return np.dtype("uint{}".format(bitpix))
+
+    return np.dtype("float64" if bitpix > 16 else "float32")
+
+
+class Frames:
+    """
+        Read-only access to the images stored in the SubArray file. The cube is memory-mapped, so that the images are
+        only read from disk (and scaled, if the file uses BSCALE/BZERO) when they are asked for. The returned images are
+        read-only views, which means that the resident memory does not grow with the number of frames of the visit.
+        The scaled images have the same data type as the ones read by astropy (see :func:`scaled_dtype`).
+
+        Parameters
+        ---------------
+        path:
+            Path to the SubArray fits file
+        extension:
+            HDU in which the images are stored
+
+        Attributes
+        ---------------
+        step:
+            Distance, in the file, between consecutive images of this object (see :meth:`decimated`)
+    """
+
+    def __init__(self, path, extension=1):
+        self.path = path
+        self.step = 1
+        self._extension = extension
+        self._hdulist = fits.open(path, memmap=True, do_not_scale_image_data=True)
+
+        header = self._hdulist[extension].header
+        self._bscale = header.get("BSCALE", 1)
+        self._bzero = header.get("BZERO", 0)
+        self._dtype = scaled_dtype(header["BITPIX"], self._bscale, self._bzero)
+        if self._dtype.kind in "iu":  # value with only the sign bit set, in the scaled data type
+            limits = np.iinfo(self._dtype)
+            self._sign_bit = self._dtype.type(limits.min if self._dtype.kind == "i" else limits.max // 2 + 1)
+
+        self._cube = self._hdulist[extension].data
+
+    def __getitem__(self, index):
+        """
+        Decodes a single image from the memory-mapped cube
+
+        Parameters
+        ----------
+        index: int
+            Image number
+
+        Returns
+        -------
+        image: numpy array
+            Read-only image
+        """
+        image = self._cube[index]
+
+        if self.is_scaled and self._dtype.kind in "iu":
+            # BZERO is the offset of the sign bit, so adding it (with wrapping) only flips that bit
+            image = image.astype(self._dtype) ^ self._sign_bit
+        elif self.is_scaled:
+            image = image.astype(self._dtype)
+            image *= self._bscale
+            image += self._bzero
+        else:
+            image = image.view(np.ndarray)
+
+        image.flags.writeable = False
+        return image
+
+    def __len__(self):
+        return self._cube.shape[0]
+
+    def decimated(self, step):
+        """
+        Copy of this object that only has one of every step images, e.g. for a faster, approximate, optimization. The
+        images are not copied: both objects read the same memory-map (or shared memory)
+        """
+        frames = copy.copy(self)
+        frames.step = self.step * step
+        frames._cube = self._cube[::step]
+        return frames
+
+    def column(self, extension, name):
+        """
+        Returns one column of a binary table stored in the same file, e.g. the RON values of the SubArray file
+        """
+        return self._hdulist[extension].data[name]
+
+    @property
+    def is_scaled(self):
+        """
+            True if the images need to be scaled with BSCALE/BZERO when decoded
+        """
+        return self._bscale != 1 or self._bzero != 0
+
+    @property
+    def shape(self):
+        """
+            Shape of a single image
+        """
+        return self._cube.shape[1:]
+
+
+class SharedFrames(Frames):
+    """
+        Copy of the images of the SubArray file in shared memory. The images are decoded once, by the process that
+        creates this object, and other processes use the same memory, without copying it: forked processes inherit it,
+        while the others attach to it by name.
+
+        The memory is released by the process that created it, with :meth:`close`. If the shared memory folder does
+        not have enough free space for the images, a MemoryError is raised before the memory is created: on Linux, the
+        creation succeeds even if the space is missing and writing the images would kill the process (SIGBUS).
+
+        Parameters
+        ---------------
+        path:
+            Path to the SubArray fits file
+        extension:
+            HDU in which the images are stored
+    """
+
+    def __init__(self, path, extension=1):
+        super().__init__(path, extension)
+
+        first = super().__getitem__(0)
+        dtype = first.dtype.newbyteorder("=")
+        shape = (super().__len__(),) + first.shape
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+
+        if os.path.isdir(SHARED_MEMORY_FOLDER):
+            free = shutil.disk_usage(SHARED_MEMORY_FOLDER).free
+            if size > free:
+                self._hdulist.close()
+                raise MemoryError(
+                    "the images need {:.1f} MB and {} only has {:.1f} MB free".format(
+                        size / 1024 ** 2, SHARED_MEMORY_FOLDER, free / 1024 ** 2
+                    )
+                )
+
+        self._memory = SharedMemory(create=True, size=size)
+        self._owner = True
+        self._shape = shape
+
+        cube = np.ndarray(shape, dtype=dtype, buffer=self._memory.buf)
+        for index in range(shape[0]):
+            cube[index] = super().__getitem__(index)
+
+        # the images were already decoded
+        self._cube = cube
+        self._bscale, self._bzero = 1, 0
+
+    def __getstate__(self):
+        return {
+            "path": self.path,
+            "extension": self._extension,
+            "name": self._memory.name,
+            "shape": self._shape,
+            "step": self.step,
+            "dtype": self._cube.dtype.str,
+        }
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.step = state["step"]
+        self._extension = state["extension"]
+        self._hdulist = fits.open(self.path, memmap=True, do_not_scale_image_data=True)
+        self._bscale, self._bzero = 1, 0
+
+        self._memory = SharedMemory(name=state["name"])
+        self._owner = False
+        self._shape = state["shape"]
+
+        cube = np.ndarray(self._shape, dtype=np.dtype(state["dtype"]), buffer=self._memory.buf)
+        self._cube = cube[::self.step]
+
+    def close(self):
+        """
+        Releases the shared memory. It's only removed by the process that created it
+        """
+        self._cube = None
+        try:
+            self._memory.close()
+        except BufferError:  # images from this memory are still in use, it's freed when they are released
+            pass
+
+        if self._owner:
+            self._memory.unlink()
+
+
+class FrameCache:
+    """
+        Holds the images that were already prepared (e.g. increased to the background grid), keyed by the image number.
+        When the cache grows over one of its limits, the least recently used images are removed from memory.
+
+        Parameters
+        ---------------
+        max_frames:
+            Maximum number of images kept in memory. If it's zero, there is no limit
+        max_bytes:
+            Maximum memory, in bytes, used by the stored images. If it's zero, there is no limit
+    """
+
+    def __init__(self, max_frames=0, max_bytes=0):
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+
+        self._images = OrderedDict()
+        self._nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, index, loader):
+        """
+        Returns the image, preparing it with the loader if it's not stored in the cache
+
+        Parameters
+        ----------
+        index: int
+            Image number
+        loader:
+            Function that receives the image number and returns the prepared image
+
+        Returns
+        -------
+        image: numpy array
+            Read-only image
+        """
+        if index in self._images:
+            self.hits += 1
+            self._images.move_to_end(index)
+            return self._images[index]
+
+        self.misses += 1
+        image = loader(index)
+        image.flags.writeable = False
+
+        self._images[index] = image
+        self._nbytes += image.nbytes
+        self._evict()
+
+        return image
+
+    def _evict(self):
+        """
+        Removes the least recently used images until the cache respects its limits. The latest image is always kept
+        """
+        while len(self._images) > 1 and (
+            (self.max_frames and len(self._images) > self.max_frames)
+            or (self.max_bytes and self._nbytes > self.max_bytes)
+        ):
+            _, image = self._images.popitem(last=False)
+            self._nbytes -= image.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Removes all images from the cache. The counters are not reset
+        """
+        self._images.clear()
+        self._nbytes = 0
+
+    def values(self):
+        return list(self._images.values())
+
+    def __contains__(self, index):
+        return index in self._images
+
+    def __len__(self):
+        return len(self._images)
+
+    @property
+    def nbytes(self):
+        """
+            Memory used by the stored images
+        """
+        return self._nbytes
+
+    @property
+    def stats(self):
+        """
+            Dictionary with the usage counters of the cache
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stored": len(self._images),
+            "MB": self._nbytes / 1024 ** 2,
+        }
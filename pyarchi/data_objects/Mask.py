@@ -4,9 +4,289 @@ from pyarchi.utils import create_logger
 logger = create_logger("masks")
 
 
+class SparseMask:
+    """
+        Compact representation of a mask: instead of an array with the size of the entire image, only the bounding box
+        of the mask is stored, together with the stencil of the mask inside the box. The photometry is a sum over the
+        box, instead of over the entire image.
+
+        The box can go over the image edges, in which case it wraps around to the other side, as done by np.roll.
+
+        Parameters
+        ---------------
+        shape:
+            Shape of the full image
+        corner:
+            Row and column, in the full image, of the first point of the box
+        stencil:
+            Boolean array with the points of the box that belong to the mask. If the mask is not binary, holds the
+            value of each point.
+    """
+
+    def __init__(self, shape, corner, stencil):
+        self.shape = tuple(shape)
+        self.corner = (int(corner[0]) % self.shape[0], int(corner[1]) % self.shape[1])
+        self.stencil = stencil
+
+    @classmethod
+    def from_dense(cls, mask):
+        """
+        Creates the sparse mask from an array with the size of the entire image
+
+        Parameters
+        ----------
+        mask:
+            Dense mask
+
+        Returns
+        -------
+            :class:`SparseMask`
+        """
+        rows, cols = np.nonzero(mask)
+        if rows.size == 0:
+            return cls(mask.shape, (0, 0), np.zeros((0, 0), dtype=bool))
+
+        box = (slice(rows.min(), rows.max() + 1), slice(cols.min(), cols.max() + 1))
+        values = mask[box]
+
+        stencil = values != 0
+        if not np.all(values[stencil] == 1):
+            stencil = np.array(values, dtype=float)
+
+        return cls(mask.shape, (rows.min(), cols.min()), stencil)
+
+    def shifted(self, x_change, y_change):
+        """
+        Returns a new mask, moved by the specified number of points. The stencil is shared between both masks
+
+        Parameters
+        ----------
+        x_change
+            change in the x direction (rows)
+        y_change
+            change in the y direction (columns)
+        """
+        return SparseMask(self.shape, (self.corner[0] + x_change, self.corner[1] + y_change), self.stencil)
+
+    def reduced(self, decrease_factor):
+        """
+        Returns the mask in the small grid, where each point holds the number of mask points inside the
+        corresponding block of the big grid. The box is extended to the block limits before reducing it.
+
+        Parameters
+        ----------
+        decrease_factor:
+            Ratio between the big and the small grid
+        """
+        from pyarchi.masks_creation import reduce_grid
+
+        decrease_factor = int(decrease_factor)
+        small_shape = (self.shape[0] // decrease_factor, self.shape[1] // decrease_factor)
+
+        if self.is_wrapped or self.shape[0] % decrease_factor or self.shape[1] % decrease_factor:
+            return SparseMask(small_shape, (0, 0), reduce_grid(self.to_dense(), decrease_factor))
+
+        row_start = self.corner[0] - self.corner[0] % decrease_factor
+        col_start = self.corner[1] - self.corner[1] % decrease_factor
+        row_end = self.corner[0] + self.stencil.shape[0]
+        col_end = self.corner[1] + self.stencil.shape[1]
+
+        padded = np.zeros(
+            (
+                -(-(row_end - row_start) // decrease_factor) * decrease_factor,
+                -(-(col_end - col_start) // decrease_factor) * decrease_factor,
+            )
+        )
+        padded[self.corner[0] - row_start: row_end - row_start, self.corner[1] - col_start: col_end - col_start] = (
+            self.stencil
+        )
+
+        return SparseMask(
+            small_shape,
+            (row_start // decrease_factor, col_start // decrease_factor),
+            reduce_grid(padded, decrease_factor),
+        )
+
+    @property
+    def is_binary(self):
+        return self.stencil.dtype == bool
+
+    @property
+    def is_wrapped(self):
+        """
+            True if the box goes over the image edges
+        """
+        return (
+            self.corner[0] + self.stencil.shape[0] > self.shape[0]
+            or self.corner[1] + self.stencil.shape[1] > self.shape[1]
+        )
+
+    @property
+    def box(self):
+        """
+        Index that selects the bounding box from an image with the full shape
+        """
+        if not self.is_wrapped:
+            return (
+                slice(self.corner[0], self.corner[0] + self.stencil.shape[0]),
+                slice(self.corner[1], self.corner[1] + self.stencil.shape[1]),
+            )
+
+        rows = (self.corner[0] + np.arange(self.stencil.shape[0])) % self.shape[0]
+        cols = (self.corner[1] + np.arange(self.stencil.shape[1])) % self.shape[1]
+        return np.ix_(rows, cols)
+
+    def window(self, image):
+        """
+        Returns the points of the image that are inside the bounding box
+        """
+        return image[self.box]
+
+    def apply(self, image):
+        """
+        Sums the flux of the image inside the mask. NaNs are ignored
+        """
+        window = self.window(image)
+
+        if self.is_binary:
+            return np.nansum(window[self.stencil], dtype=np.float64)
+        return np.nansum(np.multiply(self.stencil, window))
+
+    def points(self):
+        """
+        Returns the rows and columns, in the full image, of the mask points, ordered as inside the box. The values
+        can be larger than the image size if the box wraps around the edges.
+
+        Returns
+        -------
+        rows, cols:
+            Position of each point
+        weights:
+            Value of each point, or None if the mask is binary
+        """
+        box_rows, box_cols = np.nonzero(self.stencil)
+        weights = None if self.is_binary else self.stencil[box_rows, box_cols]
+
+        return box_rows + self.corner[0], box_cols + self.corner[1], weights
+
+    def overlaps(self, region):
+        """
+        Checks if the mask overlaps a boolean image, e.g. the region with NaNs
+        """
+        return bool(np.any(np.logical_and(self.window(region), self.stencil)))
+
+    def to_dense(self):
+        """
+        Expands the mask to an array with the size of the entire image
+        """
+        mask = np.zeros(self.shape)
+        mask[self.box] = self.stencil
+        return mask
+
+    @property
+    def size(self):
+        """
+            Number of points in the mask
+        """
+        return int(np.count_nonzero(self.stencil))
+
+
+class RadialProfile:
+    """
+        Curve of growth of a circular mask. The points of the largest circle are split into radial bins, one for each
+        of the requested radii, so that the flux inside any of those radii is the cumulative sum of the bins up to it.
+        The masks of the smaller circles never have to be created.
+
+        A point belongs to a circle if its squared distance to the center is not larger than the squared radius, which
+        is the same rule used by :func:`~pyarchi.masks_creation.circular_mask.create_circular_mask`.
+
+        Parameters
+        ---------------
+        mask:
+            :class:`SparseMask` with the points of the largest circle
+        bins:
+            Radial bin of each point of the mask, in the order given by :meth:`SparseMask.points`
+        edges:
+            Squared radius of each bin, in ascending order
+    """
+
+    def __init__(self, mask, bins, edges):
+        self.mask = mask
+        self.bins = bins
+        self.edges = edges
+
+    @classmethod
+    def from_center(cls, shape, center, radii):
+        """
+        Creates the profile of a star
+
+        Parameters
+        ----------
+        shape:
+            Shape of the image
+        center:
+            Row and column of the center of the star
+        radii:
+            Radii in which the flux will be calculated
+        """
+        from pyarchi.masks_creation import radial_distance
+
+        edges = np.unique(np.asarray(radii, dtype=float) ** 2)
+        corner, distances = radial_distance(shape, center, np.sqrt(edges[-1]))
+
+        stencil = distances <= edges[-1]
+        bins = np.searchsorted(edges, distances[stencil], side="left")
+
+        return cls(SparseMask(shape, corner, stencil), bins, edges)
+
+    def index(self, radius):
+        """
+        Returns the bin of the radius. If the radius is not one of the profile radii, the closest smaller one is used
+        """
+        return max(int(np.searchsorted(self.edges, radius ** 2, side="right")) - 1, 0)
+
+    def bin_flux(self, values):
+        """
+        Sums the values of the mask points inside each radial bin. NaNs are ignored
+
+        Parameters
+        ----------
+        values:
+            Array with the number of images as rows and the number of mask points as columns
+
+        Returns
+        -------
+            Array with the number of images as rows and the number of bins as columns
+        """
+        values = np.nan_to_num(np.atleast_2d(values).astype(np.float64), nan=0.0)
+
+        binned = np.zeros((values.shape[0], self.edges.size))
+        for index in range(self.edges.size):
+            binned[:, index] = values[:, self.bins == index].sum(axis=1)
+        return binned
+
+    def bin_any(self, values):
+        """
+        For each radial bin, checks if any of its points is True, e.g. if it overlaps the forbidden region
+        """
+        values = np.atleast_2d(values).any(axis=0)
+        return np.bincount(self.bins[values], minlength=self.edges.size) > 0
+
+    @property
+    def size(self):
+        """
+            Number of radial bins
+        """
+        return self.edges.size
+
+
 class Masks:
     """
-        Class used to hold the mask for each iteration, as well as some of some important methods
+        Class used to hold the mask for each iteration, as well as some of some important methods.
+
+        Every mask, after the first one, is the first mask shifted by an integer number of points. Thus, only the first
+        mask is stored, as a :class:`SparseMask`, together with the shift of each iteration. The masks are rebuilt when
+        asked for, which keeps the mask history at a few KB.
     """
 
     def __init__(self, mask_factor, grid_increase, initial_mask, low_memory=0):
@@ -14,11 +294,35 @@ class Masks:
         self._mask_factor = mask_factor
         self.grid_increase = grid_increase
 
-        self._masks = []
+        if not isinstance(initial_mask, SparseMask):
+            initial_mask = SparseMask.from_dense(initial_mask)
+
+        self._first = initial_mask
+        self._shifts = np.zeros((64, 2), dtype=int)
+        self._number_masks = 1
+        self._extra = {}  # masks that were added without being a shift of the first one
         self._low_mem = low_memory
 
-        self._mask_size = len(np.where(initial_mask != 0)[0])
-        self.add_mask(initial_mask)
+        self._mask_size = self._first.size
+
+    def _store(self, shift, mask=None):
+        """
+        Stores the shift of a new iteration. If the low memory mode is active, only two masks are stored: the initial
+        one and the latest.
+        """
+        if self._low_mem and self._number_masks == 2:
+            index = 1
+        else:
+            index = self._number_masks
+            if index == self._shifts.shape[0]:
+                self._shifts = np.concatenate([self._shifts, np.zeros_like(self._shifts)])
+            self._number_masks += 1
+
+        self._shifts[index] = shift
+        if mask is None:
+            self._extra.pop(index, None)
+        else:
+            self._extra[index] = mask
 
     def add_mask(self, mask):
         """
@@ -28,22 +332,21 @@ class Masks:
         Parameters
         ----------
         mask:
-            Mask to be added
+            Mask to be added. Either a dense array or a :class:`SparseMask`
 
         Returns
         -------
 
         """
+        if not isinstance(mask, SparseMask):
+            mask = SparseMask.from_dense(mask)
 
-        if self._low_mem and len(self._masks) == 2:
-            self._masks[-1] = mask
-        else:
-            self._masks.append(mask)
+        self._store((0, 0), mask)
 
     def update_mask(self, x_change, y_change, image_number):
         """
             Changes the mask to the correct position in the new image. If the grid_bg is not None, then
-            the calculations are made with the bigger grid.
+            the calculations are made with the bigger grid. Only the shift, in relation to the first mask, is stored.
 
         Parameters
         ----------
@@ -60,39 +363,99 @@ class Masks:
 
         """
 
-        empty_mask = np.roll(self.first.copy(), x_change, axis=0)
-        empty_mask = np.roll(empty_mask, y_change, axis=1)
-
         if image_number != 0:  # no need to add again the mask for the first frame
-            self.add_mask(empty_mask)
+            self._store((x_change, y_change))
+
+    def set_trajectory(self, shifts):
+        """
+        Stores the shifts of all iterations at once, replacing the previous ones. If the low memory mode is active,
+        only the first and latest are kept.
+
+        Parameters
+        ----------
+        shifts:
+            Nx2 array with the shift of each mask, in relation to the first one
+        """
+        shifts = np.asarray(shifts, dtype=int)
+        if self._low_mem and shifts.shape[0] > 2:
+            shifts = shifts[[0, -1]]
+
+        self._shifts = shifts.copy()
+        self._number_masks = shifts.shape[0]
+        self._extra = {}
+
+    def get_sparse(self, item):
+        """
+        Rebuilds one of the stored masks, as a :class:`SparseMask`
+
+        Parameters
+        ----------
+        item: int
+            Index of the mask. Negative indexes are allowed
+        """
+        index = range(self._number_masks)[item]
+
+        if index in self._extra:
+            return self._extra[index]
+        if index == 0:
+            return self._first
+        return self._first.shifted(*self._shifts[index])
 
     @property
     def latest(self):
         """
             Returns the latest mask stored in the class
         """
-        return self._masks[-1]
+        return self.latest_sparse.to_dense()
 
     @property
     def first(self):
         """
             Returns the first mask
         """
-        return self._masks[0]
+        return self._first.to_dense()
+
+    @property
+    def latest_sparse(self):
+        """
+            Returns the latest mask stored in the class, as a :class:`SparseMask`
+        """
+        return self.get_sparse(-1)
+
+    @property
+    def first_sparse(self):
+        """
+            Returns the first mask, as a :class:`SparseMask`
+        """
+        return self._first
+
+    @property
+    def latest_shift(self):
+        """
+        Returns the shift of the latest mask, in relation to the first one
+        """
+        return self._shifts[self._number_masks - 1]
+
+    @property
+    def trajectory(self):
+        """
+        Returns a Nx2 array with the shift, in relation to the first mask, of each stored mask
+        """
+        return self._shifts[: self._number_masks].copy()
 
     @property
     def number_masks(self):
         """
         Return the number of masks stored in the obejct
         """
-        return len(self._masks)
+        return self._number_masks
 
     @property
     def all(self):
         """
         Return a list with all of the stored masks
         """
-        return self._masks.copy()
+        return [self.get_sparse(index).to_dense() for index in range(self._number_masks)]
 
     @property
     def factor(self):
@@ -103,17 +466,22 @@ class Masks:
 
     @property
     def size(self):
-        """ 
+        """
             Returns the number of pixels in the mask
         """
         return self._mask_size
 
     @property
-    def normalized_points(self): 
-        """ 
+    def normalized_points(self):
+        """
             Returns the number of points, normalized to the "normal" grid, with 200 by 200 px
         """
         return self._mask_size / self.grid_increase ** 2
 
+    def __len__(self):
+        return self._number_masks
+
     def __getitem__(self, item):
-        return self._masks[item]  # delegate to li.__getitem__
+        if isinstance(item, slice):
+            return [self.get_sparse(index).to_dense() for index in range(self._number_masks)[item]]
+        return self.get_sparse(item).to_dense()
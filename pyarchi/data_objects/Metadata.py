@@ -0,0 +1,152 @@
+from astropy.io import fits
+import numpy as np
+
+from pyarchi.utils import path_finder
+from pyarchi.utils import create_logger
+
+logger = create_logger("metadata")
+
+OFFICIAL_CURVES = ["DEFAULT", "OPTIMAL", "RSUP", "RINF"]
+
+# Columns and header keywords, of the official light curves, that are used by the pipeline
+CURVE_COLUMNS = [
+    "ROLL_ANGLE",
+    "MJD_TIME",
+    "CENTROID_X",
+    "CENTROID_Y",
+    "LOCATION_X",
+    "LOCATION_Y",
+    "BACKGROUND",
+    "DARK",
+    "FLUX",
+    "FLUXERR",
+]
+CURVE_KEYWORDS = ["AP_RADI", "EXPTIME", "NEXP"]
+
+CATALOGUE_COLUMNS = ["RA", "DEC", "MAG_CHEOPS"]
+CATALOGUE_KEYWORDS = ["CENT_RA", "CENT_DEC"]
+
+
+class DRPMetadata:
+    """
+        Holds all the information, from the DRP light curves and StarCatalogue, that is used by the pipeline. The
+        files are read only once, when the object is created, and every part of the pipeline (initial load, exports
+        and debug comparison) reads from here.
+
+        Parameters
+        ---------------
+        official_curve:
+            Name of the light curve used as the comparison basis
+        curves:
+            Dictionary with the name of the light curve as key. Each value is a dictionary with the "path" of the
+            file, the "columns" and the "header" values.
+        catalogue:
+            Information from the StarCatalogue. It's only loaded when needed.
+    """
+
+    def __init__(self, **kwargs):
+        self.base_folder = kwargs["base_folder"]
+        self.official_curve = kwargs["official_curve"]
+
+        self._kwargs = kwargs
+        self.curves = {}
+        self._catalogue = None
+
+        self._load_curve(self.official_curve)
+
+        for curve in OFFICIAL_CURVES:
+            if curve == self.official_curve:
+                continue
+            try:
+                self._load_curve(curve)
+            except Exception:
+                logger.warning("Could not load the {} light curve".format(curve))
+
+    def _load_curve(self, curve):
+        """
+        Reads the used columns and header values from one of the official light curves
+        """
+        default_path = path_finder(mode="default", off_curve=curve, **self._kwargs)
+
+        with fits.open(default_path) as hdulist:
+            names = [name.upper() for name in hdulist[1].columns.names]
+            columns = {
+                name: np.array(hdulist[1].data[name]) for name in CURVE_COLUMNS if name in names
+            }
+            header = {key: hdulist[1].header[key] for key in CURVE_KEYWORDS if key in hdulist[1].header}
+
+        self.curves[curve] = {"path": default_path, "columns": columns, "header": header}
+
+    def column(self, name, curve=None):
+        """
+        Returns one column of a light curve. If no curve is passed, uses the official one
+        """
+        curve = self.official_curve if curve is None else curve
+        return self.curves[curve]["columns"][name]
+
+    def header(self, key, curve=None):
+        """
+        Returns one header value of a light curve. If no curve is passed, uses the official one
+        """
+        curve = self.official_curve if curve is None else curve
+        return self.curves[curve]["header"][key]
+
+    def is_same_visit(self, **kwargs):
+        """
+        Checks if the metadata was loaded with the same configuration values
+        """
+        return (
+            self.base_folder == kwargs["base_folder"]
+            and self.official_curve == kwargs["official_curve"]
+            and self._kwargs["data_type"] == kwargs["data_type"]
+        )
+
+    @property
+    def available_curves(self):
+        return list(self.curves.keys())
+
+    @property
+    def roll_ang(self):
+        return self.column("ROLL_ANGLE")
+
+    @property
+    def mjd_time(self):
+        return self.column("MJD_TIME")
+
+    @property
+    def offsets(self):
+        return list(zip(self.column("CENTROID_X"), self.column("CENTROID_Y")))
+
+    @property
+    def intended_loc(self):
+        return [self.column("LOCATION_X")[0], self.column("LOCATION_Y")[0]]
+
+    @property
+    def flux(self):
+        return self.column("FLUX")
+
+    @property
+    def flux_err(self):
+        return self.column("FLUXERR")
+
+    @property
+    def curve_name(self):
+        """
+        Name of the official light curve, as written in the file name
+        """
+        return self.curves[self.official_curve]["path"].split("-")[-1].split("_")[0]
+
+    @property
+    def catalogue(self):
+        """
+        Dictionary with the used columns and header values of the StarCatalogue. Loaded on the first access
+        """
+        if self._catalogue is None:
+            stars_path = path_finder(mode="stars", **self._kwargs)
+
+            with fits.open(stars_path) as hdulist:
+                catalogue = {name: np.array(hdulist[1].data[name]) for name in CATALOGUE_COLUMNS}
+                catalogue.update({key: hdulist[1].header[key] for key in CATALOGUE_KEYWORDS})
+            self._catalogue = catalogue
+
+        return self._catalogue
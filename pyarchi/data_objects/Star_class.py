@@ -1,7 +1,8 @@
 from astropy.io import fits
 import numpy as np
 
-from .Mask import Masks
+from .Mask import Masks, SparseMask, RadialProfile
+from .Trajectory import Trajectory
 
 from pyarchi.utils import path_finder
 from pyarchi.utils import create_logger, CDPP
@@ -32,10 +33,17 @@ class Star:
             Designation of the star
         masks:
             Holds the mask used in each image.
+        layers:
+            When the flux of multiple factors is calculated in a single run, holds the concentric layers, as
+            :class:`~pyarchi.data_objects.Mask.SparseMask` objects, that are added to the mask of each factor
+        profile:
+            When the flux of multiple radii is calculated in a single run, holds the
+            :class:`~pyarchi.data_objects.Mask.RadialProfile` of the circular mask
         GP_data:
             Holds the GPs results
         positions:
-            position, in pixels, of the centroid. Always on coordinates of the [200,200] grid
+            position, in pixels, of the centroid in each image, stored in a
+            :class:`~pyarchi.data_objects.Trajectory.Trajectory`. Always on coordinates of the [200,200] grid
         init_pos:
             Initial position, in pixels, of the centroid. Always on coordinates of the [200,200] grid
 
@@ -58,7 +66,7 @@ class Star:
         # General star information
         self.number = Star.number
         self.__class__.number += 1
-        self.positions = [pos]
+        self.positions = Trajectory(pos)
         self.init_pos = pos.copy()
         self.dist_center = dist
 
@@ -72,6 +80,14 @@ class Star:
         self.masks = None
         self._GP_data = None
 
+        # multiple factors in a single run
+        self.layers = None
+        self.profile = None
+        self.layer_factors = []
+        self._layer_index = {}
+        self._layer_photom = []
+        self._layers_out = None
+
         # misc
         self._photom = []
         self._uncertainties = []
@@ -82,11 +98,13 @@ class Star:
 
         self.cdpp_type = cdpp_type
 
-    def enable_debug(self, **kwargs):
+    def enable_debug(self, metadata=None, **kwargs):
         """
-        Extracts the default data from  the FITS files
+        Extracts the default data from the DRP metadata. If it's not passed, the data is loaded from the FITS files
         Parameters
         ----------
+        metadata:
+            :class:`~pyarchi.data_objects.Metadata.DRPMetadata` object
         base_folder:
             path to folder in which the FITS files are located
 
@@ -95,21 +113,26 @@ class Star:
 
         """
 
-        try:
-            logger.info("Searching for the file")
-            default_path = path_finder(mode="default", **kwargs)
-        except:
-            logger.fatal("Could not find the path to the file", exc_info=True)
-            return -1
-
-        with fits.open(default_path) as hdulist:
-            self.default_lightcurve = hdulist[1].data["flux"]
-            self.DRP_uncert = hdulist[1].data["FLUXERR"]
+        if metadata is None:
+            try:
+                logger.info("Searching for the file")
+                default_path = path_finder(mode="default", **kwargs)
+            except:
+                logger.fatal("Could not find the path to the file", exc_info=True)
+                return -1
+
+            with fits.open(default_path) as hdulist:
+                self.default_lightcurve = hdulist[1].data["flux"]
+                self.DRP_uncert = hdulist[1].data["FLUXERR"]
+        else:
+            self.default_lightcurve = metadata.flux
+            self.DRP_uncert = metadata.flux_err
         self.debug = 1
 
-    def calculate_cdpp(self, time=None):
+    def calculate_cdpp(self, time=None, flux=None):
         """
-        Calculates the CDPP of the light curve, in order to quantify the results
+        Calculates the CDPP of the light curve, in order to quantify the results. If a flux is passed, e.g. from
+        :attr:`factor_curves`, it is used instead of the star's light curve
 
         Returns
         -------
@@ -128,12 +151,14 @@ class Star:
         if time is None:
             logger.fatal("Missing the time to use DRP's CDPP")
 
+        photom = self.photom if flux is None else flux
+
         if self.cdpp_type == "K2":
-            cv = CDPP(self.photom, time, sized, winlen, win, outl)
+            cv = CDPP(photom, time, sized, winlen, win, outl)
             cv_def = CDPP(self.default_lightcurve, time, sized, winlen, win, outl) if self.debug else None
 
         else:
-            cv = self.cdpp_type(self.photom, time)
+            cv = self.cdpp_type(photom, time)
             cv_def = self.cdpp_type(self.default_lightcurve, time) if self.debug else None
 
         return cv, cv_def
@@ -181,6 +206,97 @@ class Star:
 
         return 0
 
+    def add_initial_layers(self, masks, factors, scaling_factor, low_memory=0):
+        """
+        Initializes the Masks class with the mask of the largest factor and splits the masks of all factors into
+        concentric layers. The masks of successive factors are nested, so the flux of each factor is the sum of the
+        flux of all layers up to it.
+
+        Parameters
+        ----------
+        masks
+            Initial mask for each factor, ordered from the smallest to the largest factor
+        factors
+            Increase factors, in ascending order
+        scaling_factor
+            Size of the background grid
+        low_memory:
+            Mode in which only the necessary information is kept during the process
+        Returns
+        -------
+            0
+                If no error is found
+            -1
+                If one of the factors is a negative number
+        """
+        if factors[0] <= 0:
+            logger.fatal("Invalid mask factor")
+            return -1
+
+        self.masks = Masks(factors[-1], scaling_factor, masks[-1], low_memory)
+
+        self.layers = []
+        previous = np.zeros(masks[0].shape)
+        for mask in masks:
+            if np.any(mask < previous):
+                logger.warning("{} - The masks of the different factors are not nested".format(self.name))
+            self.layers.append(SparseMask.from_dense(mask - previous))
+            previous = mask
+
+        self.layer_factors = list(factors)
+        self._layer_index = {factor: index for index, factor in enumerate(factors)}
+        self._layer_photom = []
+        self._layers_out = np.zeros(len(self.layers), dtype=bool)
+
+        return 0
+
+    def add_initial_profile(self, shape, radii):
+        """
+        Creates the curve of growth of the star's circular mask, centered in the initial position. Each radial bin is
+        stored as a layer, so the flux of each radius is the sum of the bins up to it.
+
+        Parameters
+        ----------
+        shape
+            Shape of the image
+        radii
+            Radii in which the flux will be calculated
+        """
+        self.profile = RadialProfile.from_center(shape, self.positions[0], radii)
+
+        self.layer_factors = list(radii)
+        self._layer_index = {radius: self.profile.index(radius) for radius in radii}
+        self._layer_photom = []
+        self._layers_out = np.zeros(self.profile.size, dtype=bool)
+
+    def add_layer_photom(self, values, out_bounds):
+        """
+        Stores the flux of each layer, for one image
+
+        Parameters
+        ----------
+        values
+            Flux of each layer
+        out_bounds
+            For each layer, True if it overlaps the forbidden region
+        """
+        self._layer_photom.append(np.asarray(values))
+        self._layers_out = np.logical_or(self._layers_out, out_bounds)
+
+    def import_layer_photom(self, values, out_bounds):
+        """
+        Stores the flux of each layer, for all images at once
+
+        Parameters
+        ----------
+        values
+            Array with the number of images as rows and the number of layers as columns
+        out_bounds
+            For each layer, True if it overlaps the forbidden region in any image
+        """
+        self._layer_photom = list(values)
+        self._layers_out = np.asarray(out_bounds, dtype=bool)
+
     def change_init_pos(self, pos):
         """
         Change the star's initial position. Used when more than one initial center determination method is active
@@ -194,7 +310,7 @@ class Star:
         -------
 
         """
-        self.positions = [pos]
+        self.positions = Trajectory(pos)
         self.init_pos = pos.copy()
 
     def update_mask(self, scaling_factor, index):
@@ -216,16 +332,45 @@ class Star:
             return
 
         init_pos = self.init_pos
-        positions = self.positions[-1]
+        positions = self.positions.position(index)
 
         x_change = int(round(-init_pos[0] + positions[0]))
         y_change = int(round(-init_pos[1] + positions[1]))
 
         self.masks.update_mask(x_change, y_change, index)
 
-    def remove_data(self):
+    def update_all_masks(self, number_images):
+        """
+        Updates the masks for all images at once, using the positions that were already calculated. Gives the same
+        result as calling :meth:`update_mask` after each new position is added.
+
+        Parameters
+        ----------
+        number_images
+            Number of images in the data set
+
+        Returns
+        -------
+        shifts:
+            Nx2 array with the shift of the mask in each image
+        """
+        positions = np.asarray(self.positions, dtype=float)
+        frames = np.minimum(np.arange(number_images), positions.shape[0] - 1)
+
+        shifts = np.rint(positions[frames] - np.asarray(self.init_pos, dtype=float)).astype(int)
+        shifts[0] = 0  # the first image uses the initial mask
+
+        self.masks.set_trajectory(shifts)
+        return shifts
+
+    def remove_data(self, keep_positions=False):
         """
         Empty all information stored on this star. Used during the optimization process
+
+        Parameters
+        ----------
+        keep_positions:
+            If it's set, the positions of the star in each image are kept
         Returns
         -------
 
@@ -234,7 +379,14 @@ class Star:
         del self.masks
 
         self.masks = None
-        self.positions = [self.init_pos.copy()]
+        self.layers = None
+        self.profile = None
+        self.layer_factors = []
+        self._layer_index = {}
+        self._layer_photom = []
+        self._layers_out = None
+        if not keep_positions:
+            self.positions = Trajectory(self.init_pos)
         self._photom = []
         self._uncertainties = []
         self.out_bound = False  # True if the mask uses the empty zone
@@ -279,6 +431,15 @@ class Star:
         logger.info("Star {} was disabled".format(self.number))
         self._active = False
 
+    def enable(self):
+        """
+        Sets the flag to calculate the flux of this star again, after it was disabled.
+        Returns
+        -------
+
+        """
+        self._active = True
+
     def import_photom(self, photom):
         """
         Used when loading data from disk
@@ -333,6 +494,43 @@ class Star:
     def mask_norm_npoints(self):
         return self.masks.normalized_points
 
+    @property
+    def has_layers(self):
+        return self.layers is not None
+
+    @property
+    def has_profile(self):
+        return self.profile is not None
+
+    @property
+    def factor_curves(self):
+        """
+        Dictionary with the light curve of each factor, when multiple factors (or radii) were calculated in a single run
+        """
+        if not self._layer_photom:
+            return {}
+
+        cumulative = np.cumsum(np.asarray(self._layer_photom), axis=1)
+        return {factor: list(cumulative[:, index]) for factor, index in self._layer_index.items()}
+
+    @property
+    def factor_out_bounds(self):
+        """
+        Dictionary that tells, for each factor, if its mask overlapped the forbidden region
+        """
+        if self._layers_out is None:
+            return {}
+
+        cumulative = np.logical_or.accumulate(self._layers_out)
+        return {factor: bool(cumulative[index]) for factor, index in self._layer_index.items()}
+
+    @property
+    def mask_trajectory(self):
+        """
+        Returns a Nx2 array with the integer shift of the mask, in relation to the first one, in each image
+        """
+        return self.masks.trajectory
+
     @property
     def first_mask(self):
         return self.masks.first
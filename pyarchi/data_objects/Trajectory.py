@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class Trajectory:
+    """
+        Position of a star in each image. The positions are stored in a preallocated array, with the number of images
+        as rows, that grows when needed. It behaves as the list of positions: it's possible to append new positions and
+        to index, with negative indexes, the ones that were already calculated.
+
+        Parameters
+        ---------------
+        initial:
+            Position of the star in the first image
+        capacity:
+            Number of positions for which memory is allocated
+    """
+
+    def __init__(self, initial, capacity=1):
+        self._points = np.zeros((max(int(capacity), 1), 2))
+        self._points[0] = initial
+        self._size = 1
+
+    def reserve(self, capacity):
+        """
+        Makes sure that there is memory allocated for the given number of positions
+        """
+        if capacity > self._points.shape[0]:
+            points = np.zeros((int(capacity), 2))
+            points[: self._size] = self._points[: self._size]
+            self._points = points
+
+    def append(self, point):
+        """
+        Stores the position of the next image
+        """
+        if self._size == self._points.shape[0]:
+            self.reserve(2 * self._size)
+
+        self._points[self._size] = point
+        self._size += 1
+
+    def extend(self, points):
+        """
+        Stores the positions of the next images, at once
+
+        Parameters
+        ----------
+        points:
+            Array with the number of images as rows and the row and column of the star as columns
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.reserve(self._size + points.shape[0])
+
+        self._points[self._size: self._size + points.shape[0]] = points
+        self._size += points.shape[0]
+
+    def position(self, index):
+        """
+        Returns the position of the star in the given image. If the position of that image was not calculated, the
+        latest one is returned
+        """
+        return self._points[min(index, self._size - 1)]
+
+    @property
+    def array(self):
+        """
+        Returns a view, with the number of images as rows, of the positions that were already calculated
+        """
+        return self._points[: self._size]
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, item):
+        return self.array[item]
+
+    def __setitem__(self, item, value):
+        self.array[item] = value
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(self.array, dtype=dtype)
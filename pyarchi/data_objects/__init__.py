@@ -1,3 +1,6 @@
 from .Star_class import Star
 from .Mask import Masks
+from .Trajectory import Trajectory
+from .Frames import Frames, SharedFrames
+from .Metadata import DRPMetadata
 from .Data import Data
\ No newline at end of file
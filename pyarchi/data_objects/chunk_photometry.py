@@ -0,0 +1,127 @@
+import numpy as np
+
+from .Frames import Frames
+
+# State of each worker process of the parallel photometry, set once by init_worker
+_worker = {}
+
+
+def gather_points(images, rows, cols, shifts, ratio, scaling_factor, forbidden_mask):
+    """
+    Reads the values of the mask points from a set of images, after shifting the points to the position of each
+    image. The points are given in the mask grid, while the images are in the original grid.
+
+    Parameters
+    ----------
+    images:
+        Array with the images, in the original grid
+    rows, cols:
+        Position of the mask points, in the first image
+    shifts:
+        Shift of the mask, for each image
+    ratio:
+        Ratio between the mask grid and the image grid
+    scaling_factor:
+        Size of the background grid
+    forbidden_mask:
+        Boolean image, in the mask grid, with the forbidden region
+
+    Returns
+    -------
+    values:
+        Array with the number of images as rows and the number of points as columns
+    forbidden:
+        Boolean array, with the same shape, with the points over the forbidden region
+    """
+    height, width = forbidden_mask.shape
+
+    rows = (rows[np.newaxis, :] + shifts[:, [0]]) % height
+    cols = (cols[np.newaxis, :] + shifts[:, [1]]) % width
+
+    values = images[np.arange(images.shape[0])[:, np.newaxis], rows // ratio, cols // ratio]
+    if ratio != 1:
+        values = np.divide(values, scaling_factor ** 2)
+
+    return values, forbidden_mask[rows, cols]
+
+
+def photometry_chunk(images, all_shifts, all_points, profiles, ratio, scaling_factor, forbidden_mask):
+    """
+    Calculates the flux of all stars for a chunk of images
+
+    Parameters
+    ----------
+    images:
+        Array with the images of the chunk, in the original grid
+    all_shifts:
+        For each star, the shift of the mask in each image of the chunk
+    all_points:
+        For each star, the points of the first mask followed by the ones of each layer
+    profiles:
+        For each star, the :class:`~pyarchi.data_objects.Mask.RadialProfile` or None
+
+    Returns
+    -------
+        List with, for each star, the flux and out of bounds flags of each set of points (with the number of images as
+        rows) followed by the flux and out of bounds flags of the radial bins (or None if the star has no profile)
+    """
+    results = []
+    for shifts, points, profile in zip(all_shifts, all_points, profiles):
+        fluxes = np.zeros((images.shape[0], len(points)))
+        out_frames = np.zeros((images.shape[0], len(points)), dtype=bool)
+
+        for point_index, (rows, cols, weights) in enumerate(points):
+            values, forbidden = gather_points(images, rows, cols, shifts, ratio, scaling_factor, forbidden_mask)
+
+            if weights is None:
+                fluxes[:, point_index] = np.nansum(values, axis=1, dtype=np.float64)
+            else:
+                fluxes[:, point_index] = np.nansum(np.multiply(weights, values), axis=1)
+
+            out_frames[:, point_index] = forbidden.any(axis=1)
+
+        profile_flux = profile_out = None
+        if profile is not None:
+            rows, cols, _ = profile.mask.points()
+            values, forbidden = gather_points(images, rows, cols, shifts, ratio, scaling_factor, forbidden_mask)
+
+            profile_flux = profile.bin_flux(values)
+            profile_out = profile.bin_any(forbidden)
+
+        results.append((fluxes, out_frames, profile_flux, profile_out))
+
+    return results
+
+
+def init_worker(path, step, all_points, profiles, ratio, scaling_factor, forbidden_mask):
+    """
+    Prepares a worker process of the parallel photometry. The SubArray file is memory-mapped by each worker, so the
+    images are shared, through the page cache, by all processes. The masks are only sent once to each worker. If the
+    images were decimated, only one of every step images of the file is used.
+    """
+    frames = Frames(path)
+    _worker.update(
+        frames=frames if step == 1 else frames.decimated(step),
+        all_points=all_points,
+        profiles=profiles,
+        ratio=ratio,
+        scaling_factor=scaling_factor,
+        forbidden_mask=forbidden_mask,
+    )
+
+
+def worker_chunk(start, stop, all_shifts):
+    """
+    Calculates, inside a worker process, the flux of all stars for the images between start and stop
+    """
+    images = _worker["frames"][start:stop]
+
+    return start, photometry_chunk(
+        images,
+        all_shifts,
+        _worker["all_points"],
+        _worker["profiles"],
+        _worker["ratio"],
+        _worker["scaling_factor"],
+        _worker["forbidden_mask"],
+    )
@@ -11,7 +11,8 @@ from pyarchi.data_objects import Star
 logger = create_logger("initial_detection")
 
 
-def centers_from_fits(primary: str, secondary: str, stars: List, initial_angle: float, initial_offset: List, **kwargs):
+def centers_from_fits(primary: str, secondary: str, stars: List, initial_angle: float, initial_offset: List, metadata=None,
+                      **kwargs):
     """
     Using information stored on the fits files, we determine the centers positions. The centers are determined using
     relations between the differences in RA and DEC of all stars in relation to the known point : the central star.
@@ -33,6 +34,8 @@ def centers_from_fits(primary: str, secondary: str, stars: List, initial_angle:
         Rotation angle of the satellite for the first image
     initial_offset: list    
         DRP's estimation of the central star location
+    metadata:
+        :class:`~pyarchi.data_objects.Metadata.DRPMetadata` object. If it's None, the StarCatalogue is read from disk
     kwargs
         kwargs
         
@@ -60,20 +63,33 @@ def centers_from_fits(primary: str, secondary: str, stars: List, initial_angle:
 
     r_ang = initial_angle
 
-    stars_path = path_finder(mode="stars", **kwargs)
-
-    try:
-        hdulist = fits.open(stars_path)
-    except IOError:
-        logger.error("Star Catalogue file not found")
-        return -1
+    if metadata is not None:
+        try:
+            catalogue = metadata.catalogue
+        except IOError:
+            logger.error("Star Catalogue file not found")
+            return -1
+
+        cent_ra = catalogue["CENT_RA"]
+        cent_dec = catalogue["CENT_DEC"]
+        first_RA = catalogue["RA"]
+        first_DEC = catalogue["DEC"]
+        mags = catalogue["MAG_CHEOPS"]
     else:
-        with hdulist:
-            cent_ra = hdulist[1].header["CENT_RA"]
-            cent_dec = hdulist[1].header["CENT_DEC"]
-            first_RA = hdulist[1].data["RA"]
-            first_DEC = hdulist[1].data["DEC"]
-            mags = hdulist[1].data["MAG_CHEOPS"]
+        stars_path = path_finder(mode="stars", **kwargs)
+
+        try:
+            hdulist = fits.open(stars_path)
+        except IOError:
+            logger.error("Star Catalogue file not found")
+            return -1
+        else:
+            with hdulist:
+                cent_ra = hdulist[1].header["CENT_RA"]
+                cent_dec = hdulist[1].header["CENT_DEC"]
+                first_RA = hdulist[1].data["RA"]
+                first_DEC = hdulist[1].data["DEC"]
+                mags = hdulist[1].data["MAG_CHEOPS"]
 
     logger.info(
         "Extracted StarCatalogue's information; Starting the position analysis process"
@@ -1,3 +1,3 @@
-from .grid_conversion import change_grid
-from .circular_mask import create_circular_mask
+from .grid_conversion import change_grid, reduce_grid
+from .circular_mask import create_circular_mask, radial_distance
 from .shape_mask import create_shape_mask
@@ -45,8 +45,6 @@ def create_circular_mask(img, stars, radius, primary, secondary):
     if secondary == "circle":
         to_calculate += [star.number for star in stars[1:]]
 
-    xx, yy = np.mgrid[: img.shape[0], : img.shape[0]]
-
     masks_dict = {}
     for index in range(len(stars)):
         if index not in to_calculate:
@@ -57,19 +55,51 @@ def create_circular_mask(img, stars, radius, primary, secondary):
 
         if not isinstance(radius, (dict)):
             # if the radius if an integer then we use the same value for all stars -> used for optimizing the process
-            mask[
-                np.where((xx - coords[0]) ** 2 + (yy - coords[1]) ** 2 <= (radius) ** 2)
-            ] = 1
-
+            star_radius = radius
         else:
             # If we have an optimized radius we can use it to give value for each star in the list
-            mask[
-                np.where(
-                    (xx - coords[0]) ** 2 + (yy - coords[1]) ** 2
-                    <= (radius[str(index)]) ** 2
-                )
-            ] = 1
+            star_radius = radius[str(index)]
+
+        corner, distances = radial_distance(img.shape, coords, star_radius)
+        box = (
+            slice(corner[0], corner[0] + distances.shape[0]),
+            slice(corner[1], corner[1] + distances.shape[1]),
+        )
+        mask[box][distances <= star_radius ** 2] = 1
 
         masks_dict[index] = mask
 
     return masks_dict
+
+
+def radial_distance(shape, center, radius):
+    """
+    Calculates the squared distance to the center, for the points of the image that can be inside a circle with the
+    given radius. Only the bounding box of the circle is calculated, instead of the entire image.
+
+    Parameters
+    ----------
+    shape:
+        Shape of the image
+    center:
+        Row and column of the circle's center
+    radius:
+        Radius of the circle
+
+    Returns
+    -------
+    corner:
+        Row and column, in the image, of the first point of the box
+    distances:
+        Squared distance of each point of the box to the center
+    """
+    radius = abs(radius)
+
+    row_start = max(int(np.floor(center[0] - radius)), 0)
+    row_end = min(int(np.ceil(center[0] + radius)) + 1, shape[0])
+    col_start = max(int(np.floor(center[1] - radius)), 0)
+    col_end = min(int(np.ceil(center[1] + radius)) + 1, shape[1])
+
+    xx, yy = np.mgrid[row_start:max(row_end, row_start), col_start:max(col_end, col_start)]
+
+    return (row_start, col_start), (xx - center[0]) ** 2 + (yy - center[1]) ** 2
@@ -23,3 +23,29 @@ def change_grid(small_grid, increase_factor):
     tiled = np.repeat(tiled, increase_factor, axis=1)
 
     return tiled
+
+
+def reduce_grid(big_grid, decrease_factor):
+    """
+    Changes from the big grid to the small grid, summing all the points that fall inside the same pixel of the small
+    grid. It's the opposite of :func:`change_grid`.
+
+    For example, if we have a [600,600] mask and use a decrease_factor of 3, an array with the shape [200,200]
+    would be returned, where each value is the number of mask points inside the corresponding 3 by 3 block.
+    Parameters
+    ----------
+    big_grid:
+        Array in the big grid
+    decrease_factor:
+        How much we should decrease the array
+
+    Returns
+    -------
+
+    """
+    decrease_factor = int(decrease_factor)
+    rows, cols = big_grid.shape
+
+    blocks = big_grid.reshape(rows // decrease_factor, decrease_factor, cols // decrease_factor, decrease_factor)
+
+    return blocks.sum(axis=(1, 3))
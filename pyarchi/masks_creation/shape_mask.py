@@ -2,7 +2,7 @@ import cv2
 import numpy as np
 
 from pyarchi.data_objects.Mask import logger
-from pyarchi.utils import shape_analysis, shape_increase
+from pyarchi.utils import shape_analysis, shape_increase, shape_layers
 
 
 def create_shape_mask(im, stars, increase_factor, scaling_factor, primary, secondary, bg_grid, repeat_removal=0):
@@ -18,7 +18,8 @@ def create_shape_mask(im, stars, increase_factor, scaling_factor, primary, secon
 
     increase_factor:
         Number of pixels added to the outside of the shape. For example, if factor = 1 then we add a layer of pixels
-        around the entire shape
+        around the entire shape. If a list of factors is passed, the mask of each one of them is created, from a
+        single detection of the contours. It can also be a dict, with the factor (or list of factors) of each star
 
     size_grid_change:
         SIze of the background grid in use
@@ -35,7 +36,8 @@ def create_shape_mask(im, stars, increase_factor, scaling_factor, primary, secon
     Returns
     -------
     masks_dict:
-        Dictionary where the keys are the number of the star and the values the corresponding mask
+        Dictionary where the keys are the number of the star and the values the corresponding mask, or the list with
+        the mask of each factor
     """
 
     if primary != "shape" and secondary != "shape":
@@ -48,30 +50,36 @@ def create_shape_mask(im, stars, increase_factor, scaling_factor, primary, secon
     if secondary == "shape":
         to_calculate += [star.number for star in stars[1:]]
 
-    all_masks, _, _ = shape_analysis(im, bg_grid, repeat_removal=repeat_removal)
+    all_sources, _, _ = shape_analysis(im, bg_grid, repeat_removal=repeat_removal)
 
-    if len(all_masks) != len(stars):  # we need to have the same number of masks and stars
+    if len(all_sources) != len(stars):  # we need to have the same number of masks and stars
         logger.fatal("Number of detected contours and stars does not add up")
-        logger.fatal(" \t Contours: {}; Stars:{}".format(len(all_masks), len(stars)))
+        logger.fatal(" \t Contours: {}; Stars:{}".format(len(all_sources), len(stars)))
 
         return -1
 
     mask_dict = {}
-    for mask in all_masks:
+    for source in all_sources:
 
         for index, star in enumerate(stars):
             if index not in to_calculate:
                 continue
             pos = star.init_pos.copy()
 
-            if mask[int(round(pos[0])), int(round(pos[1]))] != 0:
+            if source.contains(pos):
                 # since the contours are not ordered like the stars one must check if we have data from the contours in
                 # the specified position
+                mask = source.full_mask(im.shape)
 
-                if isinstance(increase_factor, (np.int64, int)):
-                    final_mask = shape_increase(mask, increase_factor)
+                if isinstance(increase_factor, dict):
+                    star_factor = increase_factor[str(star.number)]
                 else:
-                    final_mask = shape_increase(mask, increase_factor[str(star.number)])
+                    star_factor = increase_factor
+
+                if isinstance(star_factor, (list, tuple, np.ndarray)):
+                    final_mask = shape_layers(mask, star_factor)
+                else:
+                    final_mask = shape_increase(mask, star_factor)
                 mask_dict[index] = final_mask
 
     return mask_dict
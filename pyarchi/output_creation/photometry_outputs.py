@@ -115,7 +115,7 @@ def photom_plots(data_fits, master_folder, singular=None, **kwargs):
     fig_2.savefig(os.path.join(master_folder, "star_names"))
 
     if kwargs["debug"]:
-        data_fits.stars[0].enable_debug(**kwargs)
+        data_fits.stars[0].enable_debug(data_fits.metadata, **kwargs)
         cv, cv_def = data_fits.stars[0].calculate_cdpp(data_fits.mjd_time)
         fig = plt.figure()
 
@@ -53,8 +53,6 @@ def store_data(data_fits, job_number, singular=None, **kwargs):
     master_folder = handle_folders(len(data_fits.stars), job_number, **kwargs)
 
     if not data_fits.is_empty:
-        if data_fits.low_mem:
-            data_fits.reload_images(**kwargs)
         photo_SaveInfo(master_folder, data_fits)
         photom_plots(data_fits, master_folder, singular, **kwargs)
 
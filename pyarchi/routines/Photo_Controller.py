@@ -73,7 +73,7 @@ class Photo_controller:
                     return -1
 
             if func.__name__ == "__optimize":  # pylint: disable=no-member
-                return func(self)  # pylint: disable=not-callable
+                return func(self, *args)  # pylint: disable=not-callable
             else:
                 return func(self, *args, **kwargs)  # pylint: disable=not-callable
 
@@ -155,18 +155,24 @@ class Photo_controller:
         self.kwargs = new_dict
         self.data_fits.used_file = self.kwargs["base_folder"]
 
-    def optimize(self):
+    def optimize(self, resume=False):
         """
         Run the optimization routine without instantiating a new object.
+
+        Parameters
+        ----------
+        resume:
+            If True, continues the last optimization of this job from its checkpoint, e.g. after a crash or a
+            preemption. Only the factors that were not calculated before are calculated.
         Returns
         -------
 
         """
         self.kwargs["optimize"] = 1  # just making sure
-        self.__optimize()
+        self.__optimize(resume)
 
     @_check_parameters
-    def __optimize(self):
+    def __optimize(self, resume=False):
         """
         Optimization process. Called when the class is initialized
         Returns
@@ -183,6 +189,7 @@ class Photo_controller:
             data_f=Data('---'),
             job_number=self.job_number,
             max_process=self.kwargs["optim_processes"],
+            resume=resume,
             **self.kwargs
         )
         if vals == -1:
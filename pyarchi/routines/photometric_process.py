@@ -1,6 +1,6 @@
 from matplotlib import pyplot as plt
 import numpy as np
-from pyarchi.star_track import star_tracking_handler
+from pyarchi.star_track import star_tracking_handler, detection_pipeline
 from pathlib import Path
 from pyarchi.utils import my_timer
 from pyarchi.utils import create_logger
@@ -8,12 +8,32 @@ from pyarchi.utils import create_logger
 logger = create_logger("main")
 
 
+def can_batch(tracked=False, **kwargs):
+    """
+    Checks if the photometry can be made for all images at once, with
+    :meth:`~pyarchi.data_objects.Data.Data.update_stars_batch`. This is possible if the star tracking does not depend
+    on the images (static and offsets), or if the positions of the stars were already found (tracked), and no plots
+    are made for each image.
+    """
+    if not kwargs.get("batch_photometry", 1):
+        return False
+
+    if "dynam" in kwargs["detect_mode"].split("+") and not tracked:
+        return False
+
+    return not ((kwargs["plot_realtime"] or kwargs['save_gif']) and not kwargs["optimize"])
+
+
 @my_timer
 def photometry(data_fits, save_folder, **kwargs):
     """
     This function ensures that the entire process runs in the correct order. First the masks are updated and, afterwards,
     the centers for the next image are calculated.
 
+    If the star tracking does not depend on the images, the positions are calculated for all images and, afterwards,
+    the flux of all stars is calculated at once. The same happens if the positions were kept from a previous run of an
+    optimization session, without repeating the tracking.
+
     Parameters
     ------------------
     data_fits: Object of "Data" class that will hold the results of the analysis for each star
@@ -39,46 +59,73 @@ def photometry(data_fits, save_folder, **kwargs):
     else:
         plt.switch_backend("TkAgg")
 
-    for index in range(data_fits.image_number):
-        data_fits.update_stars(index)
-        data_fits.calculate_uncertainties(index)
+    # inside an optimization session, the positions of the stars may be kept from the previous run
+    tracked = data_fits.is_tracked
+
+    if can_batch(tracked, **kwargs):
+        if not tracked:
+            for index in range(data_fits.image_number):
+                points = star_tracking_handler(data_fits, index, **kwargs)
+
+                if points == -1:
+                    logger.fatal("Errors found during center determination")
+                    return -1
+
+        data_fits.update_stars_batch(kwargs.get("batch_frames", 256), kwargs.get("photometry_processes", 1))
 
         if data_fits.abort_process:
             logger.fatal("Errors found during run time")
             return -1
 
-        if (kwargs["plot_realtime"] or kwargs['save_gif']) and not kwargs["optimize"]:
-            pnt_mask = np.zeros(data_fits.stars[0].latest_mask.shape)
-            for star in data_fits.stars:
-                plt.contour(star.latest_mask)
+        return data_fits
 
-                positions = star.positions[-1]
+    # with a detection pipeline, the contours of the next images are found by other processes
+    with detection_pipeline(data_fits, **kwargs) as detections:
+        for index in range(data_fits.image_number):
+            data_fits.update_stars(index)
+            data_fits.calculate_uncertainties(index)
 
-                pnt_mask[int(positions[0]), int(positions[1])] = 3e7
+            if data_fits.abort_process:
+                logger.fatal("Errors found during run time")
+                return -1
 
-            img = data_fits.get_image(index).copy()
-            plt.imshow(img)
+            if (kwargs["plot_realtime"] or kwargs['save_gif']) and not kwargs["optimize"]:
+                pnt_mask = np.zeros(data_fits.stars[0].latest_mask.shape)
+                for star in data_fits.stars:
+                    plt.contour(star.latest_mask)
 
-            plt.contour(pnt_mask)
+                    positions = star.positions.position(index)
 
-            if kwargs['save_gif']:
-                save_folder = Path(save_folder)
-                if not save_folder.exists():
-                    logger.fatal("Save folder for the gif does not exist!")
-                    return -1
+                    pnt_mask[int(positions[0]), int(positions[1])] = 3e7
 
-                plt.savefig(save_folder / f'gif/images/{str(index)}.png')
-            if kwargs['plot_realtime']:
-                plt.pause(0.2)
+                img = data_fits.get_image(index).copy()
+                plt.imshow(img)
 
-            plt.clf()
+                plt.contour(pnt_mask)
 
-        # Update the star's positions for the next frame ##############
+                if kwargs['save_gif']:
+                    save_folder = Path(save_folder)
+                    if not save_folder.exists():
+                        logger.fatal("Save folder for the gif does not exist!")
+                        return -1
 
-        points = star_tracking_handler(data_fits, index, **kwargs)
+                    plt.savefig(save_folder / f'gif/images/{str(index)}.png')
+                if kwargs['plot_realtime']:
+                    plt.pause(0.2)
 
-        if points == -1:
-            logger.fatal("Errors found during center determination")
-            return -1
+                plt.clf()
+
+            # Update the star's positions for the next frame ##############
+            if tracked:
+                continue
+
+            points = star_tracking_handler(data_fits, index, detections, **kwargs)
+
+            if points == -1:
+                logger.fatal("Errors found during center determination")
+                return -1
+
+    if not kwargs["optimize"]:
+        logger.info("Image cache usage: {}".format(data_fits.cache_stats))
 
     return data_fits
@@ -1 +1,2 @@
-from .star_tracking_handler import star_tracking_handler
\ No newline at end of file
+from .star_tracking_handler import star_tracking_handler
+from .pipelined_detection import DetectionPipeline, detection_pipeline
@@ -1,7 +1,9 @@
 import cv2
 import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial.distance import cdist
 
-from pyarchi.utils import calculate_moments, shape_analysis
+from pyarchi.utils import calculate_moments, shape_analysis, label_sources
 
 from pyarchi.utils import create_logger
 
@@ -38,37 +40,134 @@ def create_predictions(Data_fits, img_number):
 
         rot_mat = Data_fits.get_rot_mat(((roll_ang_diff) * np.pi / 180), clockwise=True)
 
+        center = [100, 100]
+        if Data_fits.bg_grid != 0:
+            scaling_factor = Data_fits.bg_grid / 200
+            center = np.multiply(center, scaling_factor) + np.floor(scaling_factor / 2)
+
+        # all stars are rotated at once
+        pairs = np.array([star.positions.position(img_number) for star in Data_fits.stars])
+        coords = np.dot(pairs - center, rot_mat.T) + center
+
         for index in range(len(Data_fits.stars)):
-            center = [100, 100]
+            predicts[index] = list(coords[index])
 
-            if Data_fits.bg_grid != 0:
-                scaling_factor = Data_fits.bg_grid / 200
-                center = np.multiply(center, scaling_factor) + np.floor(
-                    scaling_factor / 2
-                )
+    return predicts
 
-            pair = Data_fits.stars[index].positions[-1].copy()
 
-            coords = np.dot(rot_mat, [[pair[0] - center[0]], [pair[1] - center[1]]])
+def match_centers(detected_centers, predictions, tolerance):
+    """
+    Associates the detected centers with the predicted positions of the stars, in a single step. A detection can only
+    be associated with a star if it's inside the tolerance, in both directions, of the prediction. Among those pairs,
+    the assignment is the one that minimizes the total distance between the detections and the predictions, so a
+    detection is never taken by a star if a closer one exists.
 
-            x = coords[0][0] + center[0]
-            y = coords[1][0] + center[1]
-            predicts[index] = [x, y]
+    Parameters
+    ----------
+    detected_centers:
+        List with the detected centers
+    predictions:
+        Dictionary with the predicted position of each star
+    tolerance:
+        Maximum distance, in each direction, between a detection and the prediction
 
+    Returns
+    -------
+    matches:
+        Dictionary where the keys are the stars and the values the index of the associated detection
+    unmatched_stars:
+        Stars without an associated detection
+    unmatched_detections:
+        Indexes of the detections without an associated star
+    """
+    keys = list(predictions.keys())
+    if len(detected_centers) == 0 or len(keys) == 0:
+        return {}, keys, list(range(len(detected_centers)))
 
-    return predicts
+    detected = np.asarray(detected_centers, dtype=float)
+    predicted = np.asarray([predictions[key] for key in keys], dtype=float)
+
+    cost = cdist(predicted, detected)
+    allowed = cdist(predicted, detected, metric="chebyshev") <= tolerance
 
+    # pairs outside the tolerance are never chosen if there is another option, and are removed afterwards
+    cost[~allowed] = cost.max() * len(keys) * len(detected) + 1
 
-def dynam_method(Data_fits, index, primary: str, secondary:str, repeat_removal: int):
+    star_rows, detection_cols = linear_sum_assignment(cost)
+
+    matches = {
+        keys[row]: int(col) for row, col in zip(star_rows, detection_cols) if allowed[row, col]
+    }
+    unmatched_stars = [key for key in keys if key not in matches]
+    unmatched_detections = sorted(set(range(len(detected))) - set(matches.values()))
+
+    return matches, unmatched_stars, unmatched_detections
+
+
+def windowed_centers(Data_fits, index, predictions, to_calculate, window):
+    """
+    Finds the center of each star only inside a small window around its predicted position, instead of searching the
+    entire image. The contours are found with the same threshold as in the entire image, and the star's center is the
+    one closest to the prediction. If no contour is found inside the window, the prediction is used.
+
+    Parameters
+    ----------
+    Data_fits:
+         :class:`pyarchi.main.initial_loads.Data` object.
+    index
+        image's number
+    predictions:
+        Dictionary with the predicted position of each star
+    to_calculate:
+        Numbers of the stars that are tracked with this method
+    window:
+        Number of pixels, in the original grid, between the prediction and the edges of the window
+
+    Returns
+    -------
+
+    """
+    scaling_factor = Data_fits.bg_grid / 200 if Data_fits.bg_grid != 0 else 1
+    half_size = int(window * scaling_factor)
+
+    for key, pred_position in predictions.items():
+        if Data_fits.stars[key].number not in to_calculate:
+            continue
+
+        image, corner, maximum = Data_fits.get_window(index + 1, pred_position, half_size)
+        sources = label_sources(image, scaling_factor, maximum)
+
+        if len(sources) == 0:
+            logger.warning("No masks found around star {} in image {}. Using its prediction".format(key, index))
+            Data_fits.stars[key].add_center(pred_position)
+            continue
+
+        centers, _ = calculate_moments(sources, Data_fits.bg_grid)
+        centers = np.add(centers, corner)
+
+        closest = np.argmin(np.sum((centers - pred_position) ** 2, axis=1))
+        Data_fits.stars[key].add_center(list(centers[closest]))
+
+
+def dynam_method(
+    Data_fits, index, primary: str, secondary:str, repeat_removal: int, window: int = 0, detections=None
+):
     """
     This function is used to calculate the position of the center of each contour. In order to do that
     we calculate the moments of the image, which allows us to derive it's "center of mass".
     All contours with less than 7 points are discarded and, to associate center to star we use the rotate_points
     function to predict the center's expected position. BY comparing the expected positions with the outputs of the
-    algorithm we can associate a center to each star.
+    algorithm we can associate a center to each star, with :func:`match_centers`. The stars without a detection and
+    the detections without a star are reported in the log.
 
     If the image processing routine is not able to detect any star, the it uses the predictions to shift the masks. 
 
+    If a window is passed, only the area around the predicted position of each star is searched, with
+    :func:`windowed_centers`. In this case, the repeat_removal option has no effect.
+
+    If a :class:`~pyarchi.star_track.pipelined_detection.DetectionPipeline` is passed, the contours of the next image
+    were already found by it, and only the association is made here.
+
     Parameters
     ----------
     Data_fits:
@@ -79,6 +178,12 @@ def dynam_method(Data_fits, index, primary: str, secondary:str, repeat_removal:
         Methodology to apply to the central star. If it's dynam then the central star is tracked using this method
     secondary:
         Methodology to apply to the outer stars. If it's dynam then they are tracked using this method
+    window:
+        Number of pixels between the predicted position and the edges of the searched area. If it's zero, the entire
+        image is searched
+    detections:
+        :class:`~pyarchi.star_track.pipelined_detection.DetectionPipeline` with the detections of the next images. If
+        it's None, the next image is detected here
 
     Returns
     -------
@@ -99,29 +204,35 @@ def dynam_method(Data_fits, index, primary: str, secondary:str, repeat_removal:
     if index + 1 < len(Data_fits.roll_ang):
 
         predictions = create_predictions(Data_fits, index)
-        im = Data_fits.get_image(
-            index + 1
-        )  # prepares the next frame for the detection routine
+        if window:
+            windowed_centers(Data_fits, index, predictions, to_calculate, window)
+            return 0
+
+        if detections is not None:
+            centers = detections.get(index + 1)
+        else:
+            im = Data_fits.get_image(
+                index + 1
+            )  # prepares the next frame for the detection routine
 
-        _, centers, _ = shape_analysis(im, Data_fits.bg_grid, repeat_removal)
+            _, centers, _ = shape_analysis(im, Data_fits.bg_grid, repeat_removal)
 
         if len(centers) == 0:
             logger.warning("No masks found in image {}. Using predictions to shift the masks".format(index))
             for key, pred in predictions.items():
                 Data_fits.stars[key].add_center(predictions[0])
 
-        for detected_center in centers:
-            for key, pred_position in predictions.items():
-                # calculate x,y coordinate of center
-                if np.isclose(
-                    detected_center[0], pred_position[0], atol=30 * scaling_factor
-                ) and np.isclose(
-                    detected_center[1], pred_position[1], atol=30 * scaling_factor
-                ):
-                    del predictions[key]
-                    if Data_fits.stars[key].number not in to_calculate:
-                        break
-
-                    Data_fits.stars[key].add_center(detected_center)
-                    break
+        matches, unmatched_stars, unmatched_detections = match_centers(
+            centers, predictions, tolerance=30 * scaling_factor
+        )
+
+        for key, detection in matches.items():
+            if Data_fits.stars[key].number in to_calculate:
+                Data_fits.stars[key].add_center(centers[detection])
+
+        lost = [key for key in unmatched_stars if Data_fits.stars[key].number in to_calculate]
+        if lost and len(centers) != 0:
+            logger.warning("Image {}: no detection found for the stars {}".format(index + 1, lost))
+        if unmatched_detections:
+            logger.debug("Image {}: {} detections not associated with any star".format(index + 1, len(unmatched_detections)))
     return 0
@@ -1,12 +1,31 @@
 import numpy as np
 
+from pyarchi.utils import rotate_positions
+
 
 def rotate_points(Data_fits, img_number, to_calculate):
+    """
+    Rotates the initial position of the stars by the rotation angle (difference between the angle of each image and the
+    one from the first image). The positions of all images after the current one are calculated at once.
+
+    Parameters
+    ----------
+    Data_fits
+         :class:`pyarchi.main.initial_loads.Data` object.
+    img_number
+        index of the image
+    to_calculate:
+        Numbers of the stars to rotate
+
+    Returns
+    -------
+    rotated:
+        Dictionary where the keys are the number of the star and the values an array with the rotated position in
+        each image, starting in the next one
+    """
+    rotated = {}
     if img_number + 1 < len(Data_fits.roll_ang):
-        rot_mat = Data_fits.get_rot_mat(
-            ((Data_fits.roll_ang[img_number + 1] - Data_fits.roll_ang[0]) * np.pi / 180),
-            clockwise=True,
-        )
+        angles = (np.asarray(Data_fits.roll_ang[img_number + 1:], dtype=float) - Data_fits.roll_ang[0]) * np.pi / 180
 
         scaling_factor = Data_fits.bg_grid / 200 if Data_fits.bg_grid != 0 else 1
 
@@ -15,17 +34,12 @@ def rotate_points(Data_fits, img_number, to_calculate):
         delta_pos = np.multiply(delta_pos, scaling_factor) + np.floor(scaling_factor / 2)
 
         for index, star in enumerate(Data_fits.stars):
-            if index not in to_calculate:
+            if index not in to_calculate or star.number not in to_calculate:
                 continue
 
-            pair = star.positions[0].copy()
-            coords = np.dot(rot_mat, [[pair[0] - delta_pos[0]], [pair[1] - delta_pos[1]]])
-
-            x = coords[0][0] + delta_pos[0]
-            y = coords[1][0] + delta_pos[1]
+            rotated[index] = rotate_positions(star.positions[0], delta_pos, angles, clockwise=True)
 
-            if star.number in to_calculate:
-                star.positions.append([x, y])
+    return rotated
 
 
 def offsets_method(Data_fits, index, primary, secondary):
@@ -33,6 +47,9 @@ def offsets_method(Data_fits, index, primary, secondary):
     This function expands the functionality of rotate_points. After rotating the points we calculate the offset
     experienced by the central star, by calculating the deviation between the center location from the last two images.
     The offset center for the central star is simply obtained from the fits files, without rotating the previous point.
+
+    Since the offsets and roll angles of all images are known, the positions of all the following images are
+    calculated in the first call. The next calls find the positions already stored.
     
     Parameters
     ---------------
@@ -61,34 +78,36 @@ def offsets_method(Data_fits, index, primary, secondary):
     scaling_factor = Data_fits.bg_grid / 200 if Data_fits.bg_grid != 0 else 1
 
     if index + 1 < len(Data_fits.roll_ang):
+        main_star = Data_fits.stars[0]
 
-        offsets = Data_fits.offsets[index + 1]
-        off_y = -Data_fits.intended_loc[0] + offsets[0]
-        off_x = -Data_fits.intended_loc[1] + offsets[1]
+        # the offsets of all images are known, so the positions of all the following images are calculated at once
+        offsets = np.asarray(Data_fits.offsets[index + 1:], dtype=float)
+        off_y = -Data_fits.intended_loc[0] + offsets[:, 0]
+        off_x = -Data_fits.intended_loc[1] + offsets[:, 1]
 
         if primary == "offsets":
-            central = [off_x + int(Data_fits.image_size[0]/2), off_y + int(Data_fits.image_size[1]/2)]
-            central = np.multiply(central, scaling_factor) + np.floor(scaling_factor / 2)
-            Data_fits.stars[0].add_center(central)
-            positions_main = Data_fits.stars[0].positions
+            if len(main_star.positions) <= index + 1:
+                central = np.column_stack(
+                    [off_x + int(Data_fits.image_size[0]/2), off_y + int(Data_fits.image_size[1]/2)]
+                )
+                central = np.multiply(central, scaling_factor) + np.floor(scaling_factor / 2)
+
+                main_star.positions.reserve(len(Data_fits.roll_ang))
+                main_star.positions.extend(central)
+            positions_main = np.asarray(main_star.positions)
 
         else:
-            positions_main = Data_fits.offsets
-
-        center_shift = [
-            positions_main[index + 1][0] - positions_main[0][0],
-            positions_main[index + 1][1] - positions_main[0][1],
-        ]
-
-        rotate_points(Data_fits, index, to_calculate)
-
-        for j in range(1, len(Data_fits.stars)):
-            if j in to_calculate:
-                Data_fits.stars[j].change_center(
-                    -1,
-                    [
-                        Data_fits.stars[j].positions[-1][0] + center_shift[0],
-                        Data_fits.stars[j].positions[-1][1] - center_shift[1],
-                    ],
-                )
+            positions_main = np.asarray(Data_fits.offsets, dtype=float)
+
+        center_shift = positions_main[index + 1:] - positions_main[0]
+
+        to_rotate = [j for j in to_calculate if len(Data_fits.stars[j].positions) <= index + 1]
+        rotated = rotate_points(Data_fits, index, to_rotate)
+
+        for j, star_positions in rotated.items():
+            star_positions[:, 0] += center_shift[:, 0]
+            star_positions[:, 1] -= center_shift[:, 1]
+
+            Data_fits.stars[j].positions.reserve(len(Data_fits.roll_ang))
+            Data_fits.stars[j].positions.extend(star_positions)
     return 0
@@ -0,0 +1,159 @@
+from collections import deque
+from contextlib import nullcontext
+from multiprocessing import Pool
+
+import numpy as np
+
+from pyarchi.data_objects import Frames
+from pyarchi.masks_creation import change_grid
+from pyarchi.utils import shape_analysis
+
+# State of each worker process of the detection pipeline, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(path, bg_grid, repeat_removal, step):
+    """
+    Prepares a worker process of the detection pipeline. The SubArray file is memory-mapped by each worker, so the
+    images are never sent between processes. If the images were decimated, only one of every step images is used.
+    """
+    frames = Frames(path)
+    _worker.update(
+        frames=frames if step == 1 else frames.decimated(step), bg_grid=bg_grid, repeat_removal=repeat_removal
+    )
+
+
+def _detect(number):
+    """
+    Finds, inside a worker process, the centers of all the contours of the given image. The image is increased to the
+    background grid in the same way as in :meth:`~pyarchi.data_objects.Data.Data.get_image`
+    """
+    image = np.array(_worker["frames"][number])
+
+    ratio = _worker["bg_grid"] / 200
+    if ratio != 0:
+        image = np.divide(change_grid(image, int(ratio)), ratio ** 2)
+
+    _, centers, _ = shape_analysis(image, _worker["bg_grid"], _worker["repeat_removal"])
+    return centers
+
+
+class DetectionPipeline:
+    """
+        Finds the contours of the images ahead of the *dynam* tracking. The detection of an image does not depend on
+        the positions of the stars, so it is made by a pool of processes while the main loop calculates the flux and
+        matches the previous detections. The number of images waiting to be used is bounded, so that the detections
+        never get too far ahead of the loop.
+
+        The images must be asked for in the same order as the given numbers.
+
+        Parameters
+        ---------------
+        path:
+            Path to the SubArray file
+        bg_grid:
+            Size of the background grid
+        repeat_removal:
+            Number of times to remove the brightest mask of the image, as in
+            :func:`~pyarchi.utils.image_processing.shape_analysis.shape_analysis`
+        numbers:
+            Numbers of the images that will be detected, in the order in which they are used
+        processes:
+            Number of processes in the pool
+        depth:
+            Maximum number of images detected ahead of the loop. Defaults to twice the number of processes
+        step:
+            Distance, in the file, between consecutive images (see
+            :meth:`~pyarchi.data_objects.Frames.Frames.decimated`)
+    """
+
+    def __init__(self, path, bg_grid, repeat_removal, numbers, processes, depth=None, step=1):
+        self._pool = Pool(processes, initializer=_init_worker, initargs=(path, bg_grid, repeat_removal, step))
+        self._numbers = iter(numbers)
+        self._pending = deque()
+        self._depth = depth or 2 * processes
+
+        for _ in range(self._depth):
+            self._submit()
+
+    def _submit(self):
+        """
+        Sends the next image, if any, to the pool
+        """
+        number = next(self._numbers, None)
+        if number is not None:
+            self._pending.append((number, self._pool.apply_async(_detect, (number,))))
+
+    def get(self, number):
+        """
+        Returns the centers of the contours of the given image, waiting for its detection if needed. Afterwards, the
+        next image is sent to the pool
+
+        Parameters
+        ----------
+        number: int
+            Image number
+
+        Returns
+        -------
+        centers:
+            List with the center of each contour, as returned by
+            :func:`~pyarchi.utils.image_processing.shape_analysis.shape_analysis`
+        """
+        if not self._pending or self._pending[0][0] != number:
+            raise ValueError("Image {} was not the next one in the detection pipeline".format(number))
+
+        _, result = self._pending.popleft()
+        self._submit()
+
+        return result.get()
+
+    def close(self):
+        """
+        Stops all processes, discarding the detections that were not used
+        """
+        self._pool.terminate()
+        self._pool.join()
+        self._pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def detection_pipeline(Data_fits, **kwargs):
+    """
+    Creates the :class:`DetectionPipeline` for the *dynam* tracking, if it's in use, searches the entire image and
+    more than one detection process was chosen. Otherwise, returns an empty context, so that each image is detected
+    inside the main loop. No pipeline is needed if the positions of the stars were kept from a previous run.
+
+    Parameters
+    ----------
+    Data_fits:
+         :class:`pyarchi.main.initial_loads.Data` object.
+    kwargs
+
+    Returns
+    -------
+        Context manager that gives the pipeline or None
+    """
+    processes = kwargs.get("detection_processes", 1)
+
+    if (
+        processes < 2
+        or Data_fits.is_tracked
+        or "dynam" not in kwargs["detect_mode"].split("+")
+        or kwargs.get("dynam_window", 0)
+    ):
+        return nullcontext()
+
+    return DetectionPipeline(
+        Data_fits.subarray_path,
+        Data_fits.bg_grid,
+        kwargs["repeat_removal"],
+        range(1, min(Data_fits.image_number, len(Data_fits.roll_ang))),
+        processes,
+        step=Data_fits.frame_step,
+    )
@@ -3,7 +3,7 @@ from .offset_centers import offsets_method
 from .static_method import static_method
 
 
-def star_tracking_handler(Data_fits, index, **kwargs):
+def star_tracking_handler(Data_fits, index, detections=None, **kwargs):
     """
     Handles the detection mode for the target star and the ones around it. Allows to have two different modes of
     detection active at the same time.
@@ -14,6 +14,8 @@ def star_tracking_handler(Data_fits, index, **kwargs):
          :class:`pyarchi.main.initial_loads.Data` object.
     index:
         Image number
+    detections:
+        :class:`~pyarchi.star_track.pipelined_detection.DetectionPipeline` used by the *dynam* tracking, if any
     kwargs
 
     Returns
@@ -34,7 +36,9 @@ def star_tracking_handler(Data_fits, index, **kwargs):
     if results == -1:
         return -1
 
-    results = dynam_method(Data_fits, index, primary, secondary, kwargs['repeat_removal'])
+    results = dynam_method(
+        Data_fits, index, primary, secondary, kwargs['repeat_removal'], kwargs.get("dynam_window", 0), detections
+    )
 
     if results == -1:
         return -1
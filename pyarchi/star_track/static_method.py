@@ -1,11 +1,16 @@
 import numpy as np
 
+from pyarchi.utils import rotate_positions
+
 
 def static_method(Data_fits, img_number, primary, secondary):
     """
     Rotates the points in the last know position by the corresponding rotation angle (difference between current angle
      and the  one from the last image).
 
+    Since the roll angles of all images are known, the positions of all the following images are calculated in the
+    first call, with all the rotation matrices created at once. The next calls find the positions already stored.
+
     Parameters
     ----------
     Data_fits:
@@ -32,25 +37,18 @@ def static_method(Data_fits, img_number, primary, secondary):
         to_calculate += [star.number for star in Data_fits.stars[1:]]
 
     if img_number + 1 < len(Data_fits.roll_ang):
-        # FIXME:  no need to go get the rotation matrix from the Data class -> get from utils package
-        rot_mat = Data_fits.get_rot_mat(
-            ((Data_fits.roll_ang[img_number + 1] - Data_fits.roll_ang[0]) * np.pi / 180),
-            clockwise=True,
-        )
+        angles = (np.asarray(Data_fits.roll_ang, dtype=float) - Data_fits.roll_ang[0]) * np.pi / 180
 
         scaling_factor = Data_fits.bg_grid / 200 if Data_fits.bg_grid != 0 else 1
         delta_pos = [100, 100]
         delta_pos = np.multiply(delta_pos, scaling_factor) + np.floor(scaling_factor / 2)
 
         for star in Data_fits.stars:
+            if star.number not in to_calculate or len(star.positions) > img_number + 1:
+                continue
 
-            pair = star.positions[0].copy()
-
-            coords = np.dot(rot_mat, [[pair[0] - delta_pos[0]], [pair[1] - delta_pos[1]]])
-            x = coords[0][0] + delta_pos[0]
-            y = coords[1][0] + delta_pos[1]
-
-            if star.number in to_calculate:
-                star.positions.append([x, y])
+            start = len(star.positions)
+            star.positions.reserve(angles.size)
+            star.positions.extend(rotate_positions(star.positions[0], delta_pos, angles[start:], clockwise=True))
 
     return 0
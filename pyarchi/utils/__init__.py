@@ -8,6 +8,7 @@ from .misc.timer import my_timer
 from .misc.path_searcher import path_finder
 from .misc.create_gif import create_gif
 from .misc.parameters_validator import parameters_validator
+from .misc.rotation_mats import rotate_positions
 
 from .noise_metrics.CDPP import CDPP
 
@@ -17,4 +18,4 @@ from .data_export.export_photo_info import photo_SaveInfo
 from .data_export.folder_handler import handle_folders
 
 
-from .image_processing import  shape_analysis, calculate_moments, shape_increase
\ No newline at end of file
+from .image_processing import  shape_analysis, calculate_moments, shape_increase, shape_layers, get_contours, label_sources
\ No newline at end of file
@@ -2,7 +2,6 @@ from astropy.io import fits
 import os
 
 from pyarchi.utils import create_logger
-from pyarchi.utils import path_finder
 
 logger = create_logger("util")
 
@@ -19,7 +18,7 @@ def create_fits(master_folder, data_fits, **kwargs):
         master_folder:
             Path in which the data shall be stored
         data_fits
-            :class:`~pyarchi.data_objects.Data.Data` object.
+            :class:`~pyarchi.data_objects.Data.Data` object. The DRP information is read from its metadata
         kwargs
 
 
@@ -43,16 +42,12 @@ def create_fits(master_folder, data_fits, **kwargs):
 
     logger.info("Extracting data to FITS file")
     hdus = []
-    default_path = path_finder(mode="default", **kwargs)
     try:
-        hdulist = fits.open(default_path)
-    except IOError:
-        logger.fatal("File does not exist")
+        roll_ang = data_fits.metadata.roll_ang
+        mjd_time = data_fits.metadata.mjd_time
+    except (AttributeError, KeyError):
+        logger.fatal("DRP information does not exist")
         return -1
-    else:
-        with hdulist:
-            roll_ang = hdulist[1].data["ROLL_ANGLE"]
-            mjd_time = hdulist[1].data["MJD_TIME"]
 
     col1 = fits.Column(name="MJD_TIME", format="E", array=mjd_time)
     col2 = fits.Column(name="Rotation", unit="deg", format="E", array=roll_ang)
@@ -36,4 +36,4 @@ def photo_SaveInfo(path, data_fits):
         file.write("Star \t Cv \t Factors \n")
 
         for j in data_fits.stars:
-            file.write("{} \t {} \t {}\n".format(j.number, j.calculate_cdpp(data_fits.mjd_time)[0], j.mask_factor))
+            file.write("{} \t {} \t {}\n".format(j.number, j.calculate_cdpp(data_fits.metadata.mjd_time)[0], j.mask_factor))
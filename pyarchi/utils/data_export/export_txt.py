@@ -1,9 +1,7 @@
-from astropy.io import fits
 import numpy as np
 import os
 
 from pyarchi.utils import get_optimized_mask, create_logger
-from pyarchi.utils import path_finder
 
 logger = create_logger("util")
 
@@ -16,7 +14,7 @@ def export_txt(Data_fits, path, **kwargs):
     Parameters
     ----------
     Data_fits
-        :class:`~pyarchi.data_objects.Data.Data` object. 
+        :class:`~pyarchi.data_objects.Data.Data` object. The DRP information is read from its metadata
     path:
         Path in which the file shall be stored
     kwargs
@@ -27,25 +25,19 @@ def export_txt(Data_fits, path, **kwargs):
 
     """
 
-    default_path = path_finder(mode="default", **kwargs)
     file_name = "/" + kwargs["base_folder"].split("/")[-2].split("/")[-1]
+
+    metadata = Data_fits.metadata
     try:
-        hdulist = fits.open(default_path)
-    except IOError:
-        logger.error("Lightcurve-Default file not found", exc_info=True)
+        roll_ang = metadata.roll_ang
+        mjd_time = metadata.mjd_time
+        default_lightcurve = metadata.flux
+        default_err = metadata.flux_err
+    except (AttributeError, KeyError):
+        logger.error("Lightcurve-Default information not found", exc_info=True)
         return -1
-    except Exception as e:
-        logger.fatal("Unspecified error. Refer to previous log messages", exc_info=True)
-    else:
-        with hdulist:
-            roll_ang = hdulist[1].data["ROLL_ANGLE"]
-            mjd_time = hdulist[1].data["MJD_TIME"]
-
-    off_curve = default_path.split("-")[-1].split("_")[0]
-
-    with fits.open(default_path) as hdulist:
-        default_lightcurve = hdulist[1].data["flux"]
-        default_err = hdulist[1].data["FLUXERR"]
+
+    off_curve = metadata.curve_name
 
     header = "mjd_time; roll_ang; {} lightcurve".format(off_curve)
     np.savetxt(
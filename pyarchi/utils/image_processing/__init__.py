@@ -1,3 +1,4 @@
-from .shape_increase import shape_increase
-from .shape_analysis import shape_analysis
-from .calculate_moments import calculate_moments
\ No newline at end of file
+from .shape_increase import shape_increase, shape_layers, chessboard_distance
+from .shape_analysis import shape_analysis, get_contours
+from .calculate_moments import calculate_moments
+from .sources import Source, SourceMap, label_sources
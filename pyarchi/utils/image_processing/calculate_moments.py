@@ -1,6 +1,8 @@
 import numpy as np
 from cv2 import moments
 
+from .sources import Source
+
 
 def calculate_moments(contours, bg_grid):
     """
@@ -10,7 +12,8 @@ def calculate_moments(contours, bg_grid):
     Parameters
     ----------
     contours : list
-        List with calculated masks
+        List with calculated masks. It can also hold :class:`~.sources.Source` objects, whose centers were already
+        found when the image was labelled
     
     bg_grid : int
         Size of the background grid
@@ -32,9 +35,12 @@ def calculate_moments(contours, bg_grid):
     centers = []
     distances = []
     for j in range(len(contours)):
-        M = moments(contours[j])
-        cY = M["m10"] / M["m00"]
-        cX = M["m01"] / M["m00"]
+        if isinstance(contours[j], Source):
+            cX, cY = contours[j].center
+        else:
+            M = moments(contours[j])
+            cY = M["m10"] / M["m00"]
+            cX = M["m01"] / M["m00"]
 
         centers.append([cX, cY])
         distances.append(np.sqrt((cX - center[0]) ** 2 + (cY - center[1]) ** 2))
@@ -1,16 +1,20 @@
 import numpy as np 
-import cv2 
 from .calculate_moments import calculate_moments
-from .shape_increase import shape_increase
-import matplotlib.pyplot as plt 
-def get_contours(image, scaling_factor):
+from .sources import SourceMap, label_sources
+
+
+def get_contours(image, scaling_factor, maximum=None):
     """
-     This functions pre-processes the image before calculating the moments, so that it conforms to OPenCv's input data types.
+    Finds the regions of the image above the detection threshold, with :func:`~.sources.label_sources`, and creates a
+    full size mask for each one of them.
     Removes masks with less than 50 pixels inside it
     Parameters
     ----------
     image : np.ndarray
         Image to study
+    maximum : float
+        Value used to normalize the image. If it's None, the maximum of the image is used. When only a window of the
+        image is studied, the maximum of the entire image must be passed, to keep the same threshold
     
 
     Returns
@@ -20,42 +24,9 @@ def get_contours(image, scaling_factor):
     brightness
         Maximum flux value within the contours
     """
+    sources = label_sources(image, scaling_factor, maximum)
 
-    im = image.copy()
-    im /= np.nanmax(image)
-    im *= 255
-    with np.errstate(invalid='ignore'): # avoid warnigns from the NaNs
-        im[im > 255] = 255
-        im[im <0] = 0
-    im = np.uint8(im)
-
-    # TODO: change this threshold
-    _, thresh = cv2.threshold(im, 10, 255, 0)
-    contours, _ = cv2.findContours(thresh, 1, 2)
-
-    to_remove = []
-    for j in range(len(contours)):  # removes small contours (under 50 points)
-        #print(cv2.contourArea(cont))
-
-        if cv2.contourArea(contours[j]) <= 50*scaling_factor:
-            to_remove.append(j)
-    for rm in reversed(to_remove):
-        contours.pop(rm)
-
-    found_masks = []
-    brightness = [] 
-
-    for cont in contours:
-        mask = np.zeros(im.shape)
-        cv2.drawContours(
-            mask, [cont], -1, (255, 255, 255), -1
-        )  # fills the contour with data
-
-        mask[np.where(mask != 0)] = 1  # makes sure that we have binary mask
-        found_masks.append(mask)
-        brightness.append(np.nanmax(mask*image))
-
-    return found_masks, brightness
+    return [source.full_mask(image.shape) for source in sources], [source.brightness for source in sources]
 
 
 def shape_analysis(image, bg_grid, repeat_removal = 0):
@@ -69,7 +40,8 @@ def shape_analysis(image, bg_grid, repeat_removal = 0):
     Returns
     -------
     masks_to_keep
-        found stars
+        found stars, as :class:`~.sources.Source` objects. The full size masks are created with
+        :meth:`~.sources.Source.full_mask`
     masks_locs
         location of masks
     distances
@@ -80,29 +52,27 @@ def shape_analysis(image, bg_grid, repeat_removal = 0):
     masks_to_keep = []
     masks_locs = []
     distances = []
-    all_masks, brightness = get_contours(image, scaling_factor)
+    source_map = SourceMap(image, scaling_factor)
 
+    sorted_vals = np.argsort([source.brightness for source in source_map.sources])[::-1]
+    all_sources = [source_map.sources[index] for index in sorted_vals]  # to get sorted from max to min
 
-    sorted_vals = np.argsort(brightness)[::-1]
-    all_masks = np.asarray(all_masks)[sorted_vals] # to get sorted from max to min
-
-    im = image
     for index in range(repeat_removal):
 
-        maximum_mask = all_masks[index]
-        masks_to_keep.append(maximum_mask.copy())
-        centers, dists = calculate_moments([maximum_mask], bg_grid)
+        maximum_source = all_sources[index]
+        masks_to_keep.append(maximum_source)
+        centers, dists = calculate_moments([maximum_source], bg_grid)
         masks_locs.append(centers[0])
         distances.append(dists)
 
-        maximum_mask = shape_increase(maximum_mask, 7*scaling_factor)  # remove a larger area around the brigthest star
-        im[np.where( maximum_mask == 1 )] = np.nan 
+        source_map.remove(maximum_source, 7*scaling_factor)  # remove a larger area around the brigthest star
 
-    all_masks, brightness = get_contours(im, scaling_factor)
+    # only the parts of the image that changed are searched again
+    all_sources = source_map.update() if repeat_removal else source_map.sources
 
     scaling_factor = 1
-    for mask in all_masks:
-        locs, dists = calculate_moments([mask], bg_grid)
+    for source in all_sources:
+        locs, dists = calculate_moments([source], bg_grid)
         use = True
 
         locs = locs[0]
@@ -111,9 +81,7 @@ def shape_analysis(image, bg_grid, repeat_removal = 0):
                 use = False 
         
         if use:
-            masks_to_keep.append(mask)
+            masks_to_keep.append(source)
             masks_locs.append(locs)
             distances.append(dists)
     return masks_to_keep, masks_locs, distances
-
-
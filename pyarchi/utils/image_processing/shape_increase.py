@@ -1,19 +1,40 @@
-import numpy as np 
+import numpy as np
+from scipy.ndimage import distance_transform_cdt
 
 
-def shape_increase(data, factor, fac=1):
+def chessboard_distance(data):
     """
-    Increases the boundary of the mask by one pixel. i.e., adds one layer of pixels around the mask present in the data
-    passed in.
+    Calculates, for each point of the array, the number of one pixel layers that must be added around the mask until
+    that point is reached, i.e. the chessboard distance to the closest point of the mask. The points of the mask have
+    a distance of zero.
+
+    Parameters
+    ----------
+    data:
+        Array with the original shape
+
+    Returns
+    -------
+        numpy array:
+            Distance of each point to the mask. If the mask is empty, all distances are infinite
+    """
+    if not np.any(data):
+        return np.full(data.shape, np.inf)
+
+    return distance_transform_cdt(data == 0, metric="chessboard")
+
+
+def shape_increase(data, factor):
+    """
+    Increases the boundary of the mask by a number of pixels. i.e., adds that many layers of pixels around the mask
+    present in the data passed in.
 
     Parameters
     --------------
     data:
         Array with the original shape that we wish to expand
     factor:
-        number of pixels that we wish to increase
-    fac:
-        Used internally
+        number of pixels that we wish to increase. Non-integer factors are rounded up
 
     Returns
     -------
@@ -22,51 +43,35 @@ def shape_increase(data, factor, fac=1):
     Notes
     -----
 
-        This is a recursive function to expand by a number of pixels (factor) our image inside the data array. The shape increase
-        avoids boundary issues, by avoiding leaving the image edges. 
-        This function muss be refactored since it's inefficient. However, for the time being, the overhead that it introduces
-        is not enough to justify optimizing it.
+        Each layer adds the 8 neighbours of every point of the mask, so all layers are given at once by the
+        chessboard distance to the mask, with :func:`chessboard_distance`. The image edges are never breached.
     """
-    # ToDO: refactor this. IN other words: prettify this
-    if factor < 1:
-        return data
-
-    positions = np.where(data != 0)  # array positions that we wish to increase
-
-    new = np.zeros(data.shape)
+    return shape_layers(data, [factor])[0]
 
-    cases = [[0, 0], [0, 1], [1, 0], [1, 1], [0, -1], [-1, 0], [-1, -1], [1, -1], [-1, 1]]
 
-    max_pos_x = data.shape[0]
-    max_pos_y = data.shape[1]
-
-    for pos in zip(positions[0], positions[1]):
-
-        for j in cases:
-
-            val_x = j[0]
-            val_y = j[1]
-
-            # avoid breaching image edges
-            if pos[0] + val_x < 0:
-                val_x = -pos[0]
-
-            elif pos[0] + val_x >= max_pos_x:
-                val_x = max_pos - pos[0] - 1
+def shape_layers(data, factors):
+    """
+    Increases the mask by each one of the factors, from a single calculation of the distance to the mask. Gives the
+    same results as calling :func:`shape_increase` for each factor.
 
-            if pos[1] + val_y < 0:
-                val_y = -pos[1]
+    Parameters
+    --------------
+    data:
+        Array with the original shape that we wish to expand
+    factors:
+        List with the number of pixels of each increase
 
-            elif pos[1] + val_y >= max_pos_y:
-                val_y = max_pos - pos[1] - 1
+    Returns
+    -------
+        list:
+            Increased image for each factor
+    """
+    if all(factor < 1 for factor in factors):
+        return [data for _ in factors]
 
-            new[pos[0] + val_x, pos[1] + val_y] = 1
+    distance = chessboard_distance(data)
 
-    if fac >= factor:
-        return new
-    elif fac > 1000:
-        # Cap of 1000 iterations
-        logger.fatal("Iteration cap was reached. Problems increasing the mask")
-        return -1
-    else:
-        return shape_increase(new, factor, fac + 1)
+    return [
+        data if factor < 1 else (distance <= np.ceil(factor)).astype(np.float64)
+        for factor in factors
+    ]
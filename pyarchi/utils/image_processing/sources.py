@@ -0,0 +1,289 @@
+import cv2
+import numpy as np
+from scipy.ndimage import binary_fill_holes
+
+from .shape_increase import shape_increase
+
+
+class Source:
+    """
+        Region of the image found by :func:`label_sources`. Only the bounding box of the region is stored, as a boolean
+        stencil, so that the full size mask is only created when needed.
+
+        Parameters
+        ---------------
+        corner:
+            Row and column of the first point of the bounding box
+        stencil:
+            Boolean array, with the size of the bounding box, with the points of the region
+        image:
+            Image where the region was found, used to find its brightness
+    """
+
+    def __init__(self, corner, stencil, image):
+        self.corner = corner
+        self.stencil = stencil
+
+        rows, cols = np.nonzero(stencil)
+        self.area = rows.size
+
+        # the sums of the coordinates are exact, so the center is the same as the one from the image moments
+        self.center = [
+            float((rows.sum() + corner[0] * self.area) / self.area),
+            float((cols.sum() + corner[1] * self.area) / self.area),
+        ]
+
+        row_slice, col_slice = self.slices
+        self.brightness = np.nanmax(image[row_slice, col_slice][stencil])
+
+    @property
+    def slices(self):
+        """
+        Slices of the image that hold the bounding box
+        """
+        return (
+            slice(self.corner[0], self.corner[0] + self.stencil.shape[0]),
+            slice(self.corner[1], self.corner[1] + self.stencil.shape[1]),
+        )
+
+    @property
+    def first_point(self):
+        """
+        First point of the region, when the image is read row by row. Gives the order in which the regions are labelled
+        """
+        return self.corner[0], self.corner[1] + int(np.argmax(self.stencil[0]))
+
+    def contains(self, position):
+        """
+        Checks if the point, in the image, closest to the given position is inside the region
+        """
+        row, col = int(round(position[0])) - self.corner[0], int(round(position[1])) - self.corner[1]
+
+        if not (0 <= row < self.stencil.shape[0] and 0 <= col < self.stencil.shape[1]):
+            return False
+        return bool(self.stencil[row, col])
+
+    def full_mask(self, shape):
+        """
+        Creates the mask of the region, with the size of the image, where the points of the region are set to 1
+        """
+        mask = np.zeros(shape)
+        mask[self.slices] = self.stencil
+        return mask
+
+
+def contour_area(stencil):
+    """
+    Area enclosed by the outer contour of a region, as given by cv2.contourArea. It's smaller than the number of
+    points of the region, since the contour passes through the centers of the points of its border
+
+    Parameters
+    ----------
+    stencil:
+        Boolean array with the points of a single region
+
+    Returns
+    -------
+        Area of the region
+    """
+    padded = np.pad(stencil, 1).astype(np.uint8)  # regions touching the edges are closed, as in the full image
+    contours, _ = cv2.findContours(padded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return max(cv2.contourArea(contour) for contour in contours)
+
+
+def threshold_image(image, maximum=None):
+    """
+    Creates the binary image with the points above the detection threshold, i.e. brighter than 10/255 of the maximum
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image to study
+    maximum : float
+        Value used to normalize the image. If it's None, the maximum of the image is used
+
+    Returns
+    -------
+    thresh:
+        Image with 255 in the points above the threshold and 0 otherwise
+    """
+    im = image.copy()
+    im /= np.nanmax(image) if maximum is None else maximum
+    im *= 255
+    with np.errstate(invalid='ignore'):  # avoid warnigns from the NaNs
+        im[im > 255] = 255
+        im[im < 0] = 0
+    im = np.uint8(im)
+
+    # TODO: change this threshold
+    _, thresh = cv2.threshold(im, 10, 255, 0)
+    return thresh
+
+
+class SourceMap:
+    """
+        Regions of an image above the detection threshold, found by labelling the connected points. Each region is
+        filled, so that it also holds any hole inside it, and the ones whose contour encloses an area of 50 points
+        (times the scaling factor) or less are removed (see :func:`contour_area`).
+
+        Regions can be removed from the image, with :meth:`remove`, to search for fainter ones. Afterwards,
+        :meth:`update` finds the regions of the changed image. Only the points whose state changed, and the regions
+        touching them, are labelled again; all others regions are kept. The results are the same as labelling the
+        changed image from scratch.
+
+        Parameters
+        ---------------
+        image:
+            Image to study. It's never changed, a copy is made before the first removal
+        scaling_factor:
+            Ratio between the size of the image and the original one
+        maximum:
+            Value used to normalize the image. If it's None, the maximum of the (changed) image is used
+    """
+
+    def __init__(self, image, scaling_factor, maximum=None):
+        self.image = image
+        self.scaling_factor = scaling_factor
+        self._maximum = maximum
+        self._changed_image = False
+
+        self._thresh = threshold_image(image, maximum)
+        self._labels = np.zeros(image.shape, dtype=np.int32)
+        self.sources, self._source_labels = self._label(self._thresh, (0, 0), 0)
+
+    def _label(self, thresh, corner, first_label):
+        """
+        Labels a region of the image and creates the sources inside it. The labels are stored, counting from the
+        given one, so that the regions can be found later on.
+
+        Returns
+        -------
+        sources:
+            List of :class:`Source`, sorted with :meth:`_sorted`
+        source_labels:
+            Label of each source
+        """
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(thresh, connectivity=8)
+
+        labelled = labels != 0
+        row_slice = slice(corner[0], corner[0] + thresh.shape[0])
+        col_slice = slice(corner[1], corner[1] + thresh.shape[1])
+        self._labels[row_slice, col_slice][labelled] = labels[labelled] + first_label
+
+        found = []
+        for label in range(1, count):
+            # the area of the contour is always below the number of points, so only the larger regions are measured
+            if stats[label, cv2.CC_STAT_AREA] <= 50 * self.scaling_factor:
+                continue
+
+            row, col = stats[label, cv2.CC_STAT_TOP], stats[label, cv2.CC_STAT_LEFT]
+            height, width = stats[label, cv2.CC_STAT_HEIGHT], stats[label, cv2.CC_STAT_WIDTH]
+
+            region = labels[row: row + height, col: col + width] == label
+            if contour_area(region) <= 50 * self.scaling_factor:
+                continue
+
+            stencil = binary_fill_holes(region)
+            found.append((Source((int(row) + corner[0], int(col) + corner[1]), stencil, self.image), label + first_label))
+
+        return self._sorted(found)
+
+    @staticmethod
+    def _sorted(found):
+        """
+        Sorts the sources, and their labels, in the same order as the contours of cv2.findContours: the opposite of the
+        order in which their first points are read
+        """
+        found = sorted(found, key=lambda pair: pair[0].first_point, reverse=True)
+        return [source for source, _ in found], [label for _, label in found]
+
+    def remove(self, source, size):
+        """
+        Removes a region from the image, by setting to NaN the points of the region and the ones around it, up to the
+        given number of points. The area around the region is found with
+        :func:`~pyarchi.utils.image_processing.shape_increase.shape_increase`, only inside its bounding box.
+
+        Parameters
+        ----------
+        source:
+            :class:`Source` to remove
+        size:
+            Number of pixels, around the region, that are also removed
+        """
+        if not self._changed_image:
+            self.image = self.image.copy()  # the images handed out by the Data object are read-only
+            self._changed_image = True
+
+        pad = int(np.ceil(size))
+        height, width = self.image.shape
+        row_start, col_start = max(source.corner[0] - pad, 0), max(source.corner[1] - pad, 0)
+        row_end = min(source.corner[0] + source.stencil.shape[0] + pad, height)
+        col_end = min(source.corner[1] + source.stencil.shape[1] + pad, width)
+
+        box = np.zeros((row_end - row_start, col_end - col_start))
+        row, col = source.corner[0] - row_start, source.corner[1] - col_start
+        box[row: row + source.stencil.shape[0], col: col + source.stencil.shape[1]] = source.stencil
+
+        self.image[row_start:row_end, col_start:col_end][shape_increase(box, size) == 1] = np.nan
+
+    def update(self):
+        """
+        Finds the regions of the image after the removals. The image is thresholded again, since its maximum may have
+        changed, but only the points that changed and the regions touching them are labelled again.
+
+        Returns
+        -------
+        sources:
+            List of :class:`Source`, in the same order as the contours of cv2.findContours
+        """
+        thresh = threshold_image(self.image, self._maximum)
+
+        changed = np.uint8(thresh != self._thresh)
+        if not changed.any():
+            return self.sources
+
+        # the regions that touch a changed point can grow, shrink, split or merge
+        near = cv2.dilate(changed, np.ones((3, 3), np.uint8)).astype(bool)
+        affected = np.unique(self._labels[near])
+        affected = affected[affected != 0]
+
+        stale = np.isin(self._labels, affected)
+        to_label = (thresh != 0) & (near | stale)
+        self._labels[stale] = 0
+
+        kept = [
+            (source, label) for source, label in zip(self.sources, self._source_labels) if label not in set(affected)
+        ]
+        new_sources, new_labels = [], []
+
+        rows, cols = np.nonzero(to_label.any(axis=1))[0], np.nonzero(to_label.any(axis=0))[0]
+        if rows.size:
+            corner = (int(rows[0]), int(cols[0]))
+            window = np.where(to_label, thresh, 0)[rows[0]: rows[-1] + 1, cols[0]: cols[-1] + 1]
+            new_sources, new_labels = self._label(window, corner, int(self._labels.max()))
+
+        self.sources, self._source_labels = self._sorted(kept + list(zip(new_sources, new_labels)))
+        self._thresh = thresh
+
+        return self.sources
+
+
+def label_sources(image, scaling_factor, maximum=None):
+    """
+    Finds all regions of the image above the detection threshold, with a :class:`SourceMap`
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image to study
+    scaling_factor:
+        Ratio between the size of the image and the original one
+    maximum : float
+        Value used to normalize the image. If it's None, the maximum of the image is used
+
+    Returns
+    -------
+    sources:
+        List of :class:`Source`
+    """
+    return SourceMap(image, scaling_factor, maximum).sources
@@ -62,6 +62,23 @@ def parameters_validator(**kwargs):
             else:
                 warnings.append("val_range")
 
+    if kwargs.get("optimization_strategy", "grid") not in ["grid", "bracket"]:
+        wrong_params.append("optimization_strategy")
+
+    if kwargs.get("bracket_coarse_points", 11) < 2:
+        wrong_params.append("bracket_coarse_points")
+
+    for key in ["cache_frames", "cache_memory", "optim_timeout", "optim_retries"]:
+        if kwargs.get(key, 0) < 0:
+            wrong_params.append(key)
+
+    for key in ["photometry_processes", "detection_processes", "halving_decimation"]:
+        if kwargs.get(key, 1) < 1:
+            wrong_params.append(key)
+
+    if not 0 < kwargs.get("halving_keep", 0.5) <= 1:
+        wrong_params.append("halving_keep")
+
     if (kwargs["grid_bg"] / 200) % 2 != 1 and kwargs["grid_bg"] != 0:
         wrong_params.append("grid_bg")
 
@@ -1,15 +1,192 @@
 import glob
+import json
 import re
-import os 
+import os
 
 from pyarchi.utils import create_logger
 
 logger = create_logger("utils")
 
+# Location of the DRP outputs, inside the base folder, for the simulated data (CHEOPSim). The real data is searched
+# with the same pattern for all modes
+SIMULATED_FOLDERS = {
+    "subarray": r"*eduction*/COR/**",
+    "default": r"*eduction*/PHE/**",
+    "stars": r"CH_*/data/**",
+}
+REAL_FOLDERS = r"**/**"
+
+OFFICIAL_CURVES = ["DEFAULT", "OPTIMAL", "RSUP", "RINF"]
+
+INDEX_NAME = ".pyarchi_index.json"
+
+_visit_indexes = {}
+
+
+class VisitIndex:
+    """
+    Catalogue of the DRP outputs inside one base folder. The folder is only scanned once and each output (SubArray,
+    official light curves and StarCatalogue) is classified by type, so that later searches are a dictionary lookup.
+    If an output is missing, the folder is scanned once more, in case it was created after the first scan; after
+    that, the missing outputs are also a dictionary lookup.
+
+    Parameters
+    ----------
+    base_folder:
+        Folder in which all the fits files are located
+    data_type:
+        real or simulated, to use the file structure of the DRP or of CHEOPSim
+    persist:
+        If True, the classified paths are stored in a json file inside the base folder and re-used by later runs
+    """
+
+    def __init__(self, base_folder, data_type, persist=False):
+        self.base_folder = base_folder
+        self.data_type = data_type
+        self.persist = persist
+
+        self._listings = {}
+        self._paths = {}
+        self._rescanned = False
+
+        if persist:
+            self._load_persisted()
+
+    @staticmethod
+    def _key(mode, curve=None):
+        return mode if mode != "default" else "{}-{}".format(mode, curve)
+
+    def _listing(self, mode):
+        """
+        Files inside the folder where the outputs of this mode are located. Each folder is only listed once per scan
+        """
+        extension_to_base = SIMULATED_FOLDERS[mode] if self.data_type != "real" else REAL_FOLDERS
+
+        if extension_to_base not in self._listings:
+            self._listings[extension_to_base] = glob.glob(os.path.join(self.base_folder, extension_to_base))
+
+        return self._listings[extension_to_base]
+
+    def _search(self, mode, curve=None):
+        if mode == "subarray":
+            regex_patern = re.compile(r"\S+_Sub\S+.fits")
+        elif mode == "default":
+            regex_patern = re.compile(r"\S+{}\S+.fits".format(curve))
+        elif mode == "stars":
+            regex_patern = re.compile(r"\S+Star\S+.fits")
+
+        matches = list(filter(regex_patern.findall, self._listing(mode)))
+        return matches[0] if matches else None
+
+    def scan(self):
+        """
+        Classifies all the DRP outputs of the visit, in a new listing of the folder. Afterwards, the folder can be
+        scanned once more if an output is missing (see :meth:`find`)
+        """
+        self._rescanned = False
+        self._classify()
+
+    def _classify(self):
+        """
+        Lists the folder again and classifies all the DRP outputs
+        """
+        self._listings = {}
+        for mode in ["subarray", "stars"]:
+            self._paths[self._key(mode)] = self._search(mode)
+
+        for curve in OFFICIAL_CURVES:
+            self._paths[self._key("default", curve)] = self._search("default", curve)
+
+        if self.persist:
+            self._store_persisted()
+
+    def find(self, mode, curve=None):
+        """
+        Returns the path of the desired DRP output or None if it does not exist. The first time that an output is
+        missing, the folder is scanned again, so that files created after the first scan are found. The outputs that
+        are still missing are not searched again, until a new :meth:`scan`
+        """
+        key = self._key(mode, curve)
+        if key not in self._paths:
+            if not self._paths:
+                self.scan()
+            if key not in self._paths:  # e.g. a curve that is not one of the official ones
+                self._paths[key] = self._search(mode, curve)
+
+        if self._paths[key] is None and not self._rescanned:
+            self._rescanned = True
+            self._classify()
+            if self._paths.get(key) is None:
+                self._paths[key] = self._search(mode, curve)
+
+        return self._paths[key]
+
+    @property
+    def index_path(self):
+        return os.path.join(self.base_folder, INDEX_NAME)
+
+    def _load_persisted(self):
+        """
+        Loads the paths from a previous run. If any of the stored files no longer exists, the folder is scanned again.
+        The outputs that were missing are not loaded, so that they are searched again
+        """
+        if not os.path.exists(self.index_path):
+            return
+
+        try:
+            with open(self.index_path, "r") as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            logger.warning("Could not read the stored index of the DRP outputs", exc_info=True)
+            return
+
+        if stored.get("data_type") != self.data_type:
+            return
+
+        paths = {key: path for key, path in stored.get("paths", {}).items() if path is not None}
+        if all(os.path.exists(path) for path in paths.values()):
+            self._paths = paths
+
+    def _store_persisted(self):
+        try:
+            with open(self.index_path, "w") as file:
+                json.dump({"data_type": self.data_type, "paths": self._paths}, file, indent=4)
+        except OSError:
+            logger.warning("Could not store the index of the DRP outputs inside the base folder", exc_info=True)
+
+
+def get_visit_index(base_folder, data_type, persist=False):
+    """
+    Returns the :class:`VisitIndex` of the base folder, creating it in the first call
+
+    Parameters
+    ----------
+    base_folder:
+        Folder in which all the fits files are located
+    data_type:
+        real or simulated
+    persist:
+        Store the index inside the base folder
+    """
+    key = (os.path.abspath(base_folder), data_type)
+
+    if key not in _visit_indexes:
+        _visit_indexes[key] = VisitIndex(base_folder, data_type, persist)
+
+    return _visit_indexes[key]
+
+
+def clear_visit_indexes():
+    """
+    Forgets all the indexed folders, forcing a new search on the next call of :func:`path_finder`
+    """
+    _visit_indexes.clear()
+
 
 def path_finder(mode, off_curve=None, **kwargs):
     """
-    Searches inside the base folder for the desired files
+    Searches inside the base folder for the desired files. The base folder is only scanned in the first search; the
+    following ones use the :class:`VisitIndex` of that folder.
 
     Parameters
     ----------
@@ -24,39 +201,21 @@ def path_finder(mode, off_curve=None, **kwargs):
     -------
 
     """
-    searching_for_real = False 
-    if kwargs['data_type'] == 'real':
-        searching_for_real = True 
-
-    if mode == "subarray":
-        
-        extension_to_base = r"*eduction*/COR/**" if not searching_for_real else r"**/**"
-        possible_paths = glob.glob(os.path.join(kwargs["base_folder"], extension_to_base))
-        regex_patern = re.compile(r"\S+_Sub\S+.fits")
+    visit_index = get_visit_index(kwargs["base_folder"], kwargs["data_type"], kwargs.get("persist_index", 0))
 
-    elif mode == "default":
-        extension_to_base = r"*eduction*/PHE/**" if not searching_for_real else r"**/**"
-
-        possible_paths = glob.glob(os.path.join(kwargs["base_folder"], extension_to_base))
+    curve_2_search = None
+    if mode == "default":
         curve_2_search = kwargs["official_curve"] if not off_curve else off_curve
-        regex_patern = re.compile(r"\S+{}\S+.fits".format(curve_2_search))
-
-    elif mode == "stars":
-        extension_to_base = r"CH_*/data/**" if not searching_for_real else r"**/**"
 
-        possible_paths = glob.glob(os.path.join(kwargs["base_folder"],extension_to_base))
+    path = visit_index.find(mode, curve_2_search)
 
-        regex_patern = re.compile(r"\S+Star\S+.fits")
-        
-    try:
-        return list(filter(regex_patern.findall, possible_paths))[0]
-    except IndexError:
+    if path is None:
         extra_info = '' if mode != 'default' else curve_2_search
         logger.critical("Failed to find DRP {} output".format(mode +' - '+ extra_info))
-        raise Exception("Missing the correct DRP output. Please verify the input folder") 
-
+        raise Exception("Missing the correct DRP output. Please verify the input folder")
 
+    return path
 
 
 if __name__ == '__main__':
-    print(path_finder('default', **{'data_type':'real', 'base_folder':'/home/amiguel/archi/data_files/cheopsDownload', 'official_curve':'OPTIMAL'}))
\ No newline at end of file
+    print(path_finder('default', **{'data_type':'real', 'base_folder':'/home/amiguel/archi/data_files/cheopsDownload', 'official_curve':'OPTIMAL'}))
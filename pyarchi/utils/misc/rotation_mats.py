@@ -24,5 +24,28 @@ def matrix_clockwise(angle):
     return np.array([[np.cos(angle), np.sin(angle)], [-np.sin(angle), np.cos(angle)]])
 
 
+def rotate_positions(point, center, angles, clockwise=True):
+    """
+    Rotates a point around a center, by each one of the angles. All rotation matrices are created as a single array,
+    instead of one matrix for each angle.
+
+    :param point: row and column of the point to rotate.
+    :param center: row and column of the rotation center.
+    :param angles: array with the rotation angles, in radians.
+    :param clockwise: True for a clockwise rotation and False for a counter clockwise rotation.
+    :return: array with the number of angles as rows and the rotated row and column as columns.
+    """
+    angles = np.asarray(angles, dtype=float)
+    rot_mats = matrix_clockwise(angles) if clockwise else matrix_cnter_clock(angles)
+
+    delta_x = point[0] - center[0]
+    delta_y = point[1] - center[1]
+
+    x = rot_mats[0][0] * delta_x + rot_mats[0][1] * delta_y + center[0]
+    y = rot_mats[1][0] * delta_x + rot_mats[1][1] * delta_y + center[1]
+
+    return np.column_stack([x, y])
+
+
 if __name__ == "__main__":
     pass
@@ -0,0 +1,510 @@
+import numpy as np
+
+from pyarchi.utils import create_logger
+from .optimizer import evaluate_factors, evaluate_star_factors, write_factors
+from .circular_fine_tune import evaluate_radii
+
+logger = create_logger("utils")
+
+GOLDEN_FRACTION = (3 - np.sqrt(5)) / 2  # position of the golden section point, as a fraction of the interval
+GOLDEN_RATIO = (1 + np.sqrt(5)) / 2
+
+
+class BracketSearch:
+    """
+        Golden-section search for the minimum of the noise of a single star, over the points of a grid. Starts with a
+        bracket that covers the given range; if the minimum is on one of its edges, the bracket is expanded in that
+        direction, with steps that grow with the golden ratio, until the noise increases again or the limit is
+        reached. Afterwards, the bracket is reduced with golden sections until the neighbours of the best point were
+        calculated.
+
+        The search only finds a local minimum. To avoid the wrong one, when the noise has more than one, the bracket can
+        start around the best point of a coarse grid over all points that the search can reach (see :meth:`coarse_grid`
+        and :meth:`start_from`). Even so, minima narrower than the spacing of the coarse grid can be missed, in which
+        case the search ends with a larger noise than the grid strategy.
+
+        The search does not calculate anything: :meth:`ask` returns the points whose noise is needed to continue, which
+        must be sent back with :meth:`tell`. Any other point can also be told, e.g. the ones calculated for the other
+        stars, and they are used whenever the search needs them. Points with NaN noise (e.g. out of bounds) are taken
+        as the worst possible ones.
+
+        Parameters
+        ---------------
+        low, high:
+            Initial range of the search
+        resolution:
+            Distance between the points of the grid
+        lower_limit, upper_limit:
+            Limits of the expansion of the bracket. If they are None, the bracket is not expanded in that direction
+    """
+
+    def __init__(self, low, high, resolution, lower_limit=None, upper_limit=None):
+        self.origin = low
+        self.resolution = resolution
+
+        self._lower = self._index(low if lower_limit is None else min(lower_limit, low))
+        self._upper = self._index(high if upper_limit is None else max(upper_limit, high))
+
+        self._noise = {}  # index in the grid -> noise
+        # the bracket starts with at least three points, if the limits allow it
+        self._bracket = [0, None, min(max(self._index(high), 2), self._upper)]
+        self._probe = None  # golden section point, inside the bracket
+
+        if self._bracket[2] - self._bracket[0] >= 2:
+            self._bracket[1] = self._golden_point(self._bracket[0], self._bracket[2])
+
+        self.done = False
+
+    def _index(self, factor):
+        return int(round((factor - self.origin) / self.resolution))
+
+    def factor(self, index):
+        """
+        Value of the point of the grid with the given index
+        """
+        value = self.origin + index * self.resolution
+        if isinstance(self.origin, (int, np.integer)) and isinstance(self.resolution, (int, np.integer)):
+            return int(value)
+        return round(float(value), 10)
+
+    @staticmethod
+    def _golden_point(start, end):
+        """
+        Point of the grid, strictly between start and end, at the golden section of the interval from the start
+        """
+        point = start + int(round(GOLDEN_FRACTION * (end - start)))
+        return min(max(point, start + 1), end - 1)
+
+    def coarse_grid(self, number):
+        """
+        Points of the grid, evenly spaced from the lower to the upper limit of the search, e.g. to start the search
+        with :meth:`start_from`
+
+        Parameters
+        ----------
+        number:
+            Number of points, including both limits. If it's larger than the number of points between the limits, all
+            of them are returned
+        """
+        indexes = np.unique(np.round(np.linspace(self._lower, self._upper, max(int(number), 2))).astype(int))
+        return [self.factor(index) for index in indexes]
+
+    def start_from(self, points):
+        """
+        Moves the bracket to the best of the given points, whose noise must already be known, with its neighbours in
+        the list as the edges. If the best is the last point, the bracket goes above it, so that it can still be
+        expanded while the noise decreases
+
+        Parameters
+        ----------
+        points:
+            Points of the grid, e.g. from :meth:`coarse_grid`
+        """
+        indexes = sorted({self._index(point) for point in points})
+        best = min(indexes, key=lambda index: (self._noise[index], index))
+        position = indexes.index(best)
+
+        start = indexes[position - 1] if position > 0 else best
+        if position < len(indexes) - 1:
+            end = indexes[position + 1]
+        else:
+            end = min(best + max(best - start, 1), self._upper)
+
+        if start < best < end:
+            self._bracket = [start, best, end]
+        else:
+            self._bracket = [start, self._golden_point(start, end) if end - start >= 2 else None, end]
+        self._probe = None
+        self.done = False
+
+    def tell(self, factor, noise):
+        """
+        Stores the noise of a point. Points outside of the grid, or of the limits of the search, are ignored
+        """
+        index = self._index(factor)
+        if not np.isclose(self.factor(index), factor) or not self._lower <= index <= self._upper:
+            return
+
+        self._noise[index] = np.inf if np.isnan(noise) else noise
+
+    def ask(self):
+        """
+        Advances the search as much as possible with the known points
+
+        Returns
+        -------
+            List with the points whose noise is needed to continue. If it's empty, the search is done
+        """
+        while not self.done:
+            needed = {
+                index: None for index in self._bracket + [self._probe] if index is not None and index not in self._noise
+            }
+            if needed:
+                return [self.factor(index) for index in needed]
+
+            self._advance()
+
+        return []
+
+    def _advance(self):
+        """
+        Changes the bracket, after the noise of all of its points is known
+        """
+        start, middle, end = self._bracket
+        if middle is None:  # the range only has one or two points
+            self.done = True
+            return
+
+        if self._probe is not None:
+            probe, self._probe = self._probe, None
+            better = self._noise[probe] < self._noise[middle]
+
+            if probe > middle:
+                self._bracket = [middle, probe, end] if better else [start, middle, probe]
+            else:
+                self._bracket = [start, probe, middle] if better else [probe, middle, end]
+            return
+
+        noise = [self._noise[index] for index in self._bracket]
+
+        if noise[2] < noise[1]:  # the minimum is above the bracket
+            if end == self._upper:  # it can't be expanded, the minimum is between the middle and the limit
+                if end - middle <= 1:
+                    self.done = True
+                else:
+                    self._bracket = [middle, middle + end - self._golden_point(middle, end), end]
+                return
+            new_end = min(end + max(int(round(GOLDEN_RATIO * (end - middle))), 1), self._upper)
+            self._bracket = [middle, end, new_end]
+            return
+
+        if noise[0] < noise[1]:  # the minimum is below the bracket
+            if start == self._lower:  # it can't be expanded, the minimum is between the limit and the middle
+                if middle - start <= 1:
+                    self.done = True
+                else:
+                    self._bracket = [start, self._golden_point(start, middle), middle]
+                return
+            new_start = max(start - max(int(round(GOLDEN_RATIO * (middle - start))), 1), self._lower)
+            self._bracket = [new_start, start, middle]
+            return
+
+        if end - start <= 2:  # both neighbours of the best point are known
+            self.done = True
+            return
+
+        # golden section of the largest side of the bracket
+        if end - middle >= middle - start:
+            self._probe = self._golden_point(middle, end)
+        else:
+            self._probe = 2 * middle - self._golden_point(middle, 2 * middle - start)
+
+    @property
+    def best(self):
+        """
+        Point with the lowest noise, among all known ones, and its noise. If no point has a valid noise, returns
+        (None, NaN)
+        """
+        valid = {index: noise for index, noise in self._noise.items() if np.isfinite(noise)}
+        if not valid:
+            return None, float("nan")
+
+        index = min(valid, key=lambda key: (valid[key], key))
+        return self.factor(index), valid[index]
+
+    @property
+    def bracket(self):
+        """
+        Factors of the start, middle and end of the current bracket. The middle is None if the range only has one or
+        two points
+        """
+        return [None if index is None else self.factor(index) for index in self._bracket]
+
+    @property
+    def largest(self):
+        """
+        Largest point whose noise is known, or None
+        """
+        return self.factor(max(self._noise)) if self._noise else None
+
+    @property
+    def evaluations(self):
+        """
+        Number of points whose noise is known
+        """
+        return len(self._noise)
+
+
+def run_searches(searches, evaluate, report=None):
+    """
+    Runs the searches of all stars together: in each round, the points asked by every star are calculated in a single
+    call to the evaluate function, until all searches are done.
+
+    Parameters
+    ----------
+    searches:
+        Dictionary with the :class:`BracketSearch` of each star
+    evaluate:
+        Function that receives a dictionary with the points asked by each star and returns, for each one of those
+        stars, a dictionary with the noise of the calculated points
+    report:
+        Function called with the number of rounds after each one, e.g. to store the state of the searches
+
+    Returns
+    -------
+        Number of rounds
+    """
+    rounds = 0
+    while True:
+        asked = {star: search.ask() for star, search in searches.items()}
+        asked = {star: points for star, points in asked.items() if points}
+        if not asked:
+            return rounds
+
+        results = evaluate(asked)
+        for star, points in asked.items():
+            star_results = results.get(star, {})
+            for point, noise in star_results.items():
+                searches[star].tell(point, noise)
+
+            # points that were not calculated (e.g. the star was lost) can't be asked again
+            for point in points:
+                if point not in star_results:
+                    searches[star].tell(point, float("nan"))
+
+        rounds += 1
+        if report is not None:
+            report(rounds)
+
+
+def start_searches(searches, evaluate, number):
+    """
+    Starts each search around the best point of a coarse grid over its range (see :meth:`BracketSearch.coarse_grid`).
+    The points of all stars are calculated in a single call to the evaluate function, with the same format as in
+    :func:`run_searches`
+    """
+    asked = {star: search.coarse_grid(number) for star, search in searches.items()}
+    results = evaluate(asked)
+
+    for star, points in asked.items():
+        star_results = results.get(star, {})
+        for point in points:
+            searches[star].tell(point, star_results.get(point, float("nan")))
+        searches[star].start_from(points)
+
+
+def write_star_factors(file_path, noise):
+    """
+    Writes to the .txt file the noise of the factors calculated for each star, one line per star
+    """
+    with open(file_path, mode="a") as file:
+        for star, star_noise in noise.items():
+            values = " ".join("{}:{}".format(factor, value) for factor, value in star_noise.items())
+            file.write("Star {} \t {} \n".format(star, values))
+
+
+def _search_state(searches, to_disable=[]):
+    """
+    State of the searches, stored in the checkpoint of the optimization: bracket and best point of each star, and the
+    stars that are not calculated anymore
+    """
+    return {
+        "disabled": sorted(set(to_disable) | {star for star, search in searches.items() if search.done}),
+        "brackets": {star: search.bracket for star, search in searches.items()},
+        "best": {star: search.best for star, search in searches.items()},
+    }
+
+
+def _search_results(searches, stars, default_factor):
+    """
+    Parses the best point of each search, in the same format as :func:`~pyarchi.utils.optimization.optimizer.optimizer`
+    """
+    min_cvs, optimized_dict = {}, {}
+    for star in stars:
+        factor, noise = searches[star].best if star in searches else (None, float("nan"))
+
+        if factor is None:
+            optimized_dict[str(star)] = default_factor
+            min_cvs[star] = 2e7
+            continue
+
+        min_cvs[star] = noise
+        optimized_dict[str(star)] = factor
+
+    return min_cvs, optimized_dict
+
+
+def bracket_optimizer(max_process, func, data_f, file_path, to_disable=[], pool=None, cache=None, **kwargs):
+    """
+    Finds the best factor of each star with a :class:`BracketSearch`, instead of calculating all factors of the range.
+    First, bracket_coarse_points factors, evenly spaced from the start of the val_range up to the factors that the
+    optimization_extensions of the grid strategy would reach, are calculated for all stars. The search of each star
+    starts between the neighbours of its best one. Each round calculates, in a single call to
+    :func:`~pyarchi.utils.optimization.optimizer.evaluate_star_factors`, the factors asked by each star, so that
+    different stars test different factors in the same run; the stars whose search is done are disabled. Writes to
+    the .txt file the noise of all calculated factors.
+
+    The searches only calculate a few factors, so the result can be worse than the one of the grid strategy: if the
+    noise of a star has more than one minimum, the ones narrower than the spacing of the coarse factors can be missed.
+
+    Parameters
+    ----------
+    max_process:
+        Maximum number of processes that can be launched during this routine
+    func:
+        function that launches the photometric process
+    data_f:
+        :class:`pyarchi.main.initial_loads.Data`  object with all the stars information inside
+    file_path:
+        Path in which run time information shall be stored
+    to_disable:
+        Stars that are not optimized
+    pool:
+        :class:`~pyarchi.utils.optimization.worker_pool.WorkerPool` used to run the photometry
+    cache:
+        :class:`~pyarchi.utils.optimization.evaluation_cache.EvaluationCache` with the results of previous
+        calculations. The state of the searches is recorded after each round
+    kwargs
+
+    Returns
+    -------
+    min_cvs:
+        list with the minimum noise found
+
+    optimized_dict:
+        Dictionary in which the keys are the star numbers and the values are the optimal factors
+
+    max_factor:
+        Largest factor that was calculated
+    """
+    low, high = kwargs["val_range"]
+    step = kwargs["step"]
+
+    # the same factors that the extensions of the grid strategy can reach
+    upper_limit = high + (kwargs["optimization_extensions"] + 1) * max(high - low - 2 * step, step)
+
+    # the number of stars is only known after the first calculation, the coarse grid, which is the same for all stars
+    coarse_search = BracketSearch(low, high, step, upper_limit=upper_limit)
+    coarse = coarse_search.coarse_grid(kwargs.get("bracket_coarse_points", 11))
+    factors, cvs = evaluate_factors(np.array(coarse), max_process, func, data_f, to_disable, pool, cache, **kwargs)
+    write_factors(file_path, factors, cvs)
+
+    number_stars = len(cvs)
+    searches = {
+        star: BracketSearch(low, high, step, upper_limit=upper_limit)
+        for star in range(number_stars)
+        if star not in to_disable
+    }
+    for star, search in searches.items():
+        for point, noise in zip(factors.tolist(), cvs[star]):
+            search.tell(point, noise)
+        search.start_from(coarse)
+
+    def mask_factor(star):
+        # factor of the mask of a star that is not calculated
+        best = searches[star].best[0] if star in searches else None
+        return low if best is None else best
+
+    def evaluate(asked):
+        # each star only calculates its own factors; the others keep a mask, but are disabled
+        star_factors = [asked.get(star, [mask_factor(star)]) for star in range(number_stars)]
+        disabled = sorted(set(range(number_stars)) - set(asked))
+
+        noise = evaluate_star_factors(star_factors, max_process, func, data_f, disabled, pool, cache, **kwargs)
+        write_star_factors(file_path, noise)
+
+        return noise
+
+    def report(rounds):
+        if cache is not None:
+            cache.record_state(stage="bracket", round=rounds, **_search_state(searches, to_disable))
+
+    report(0)
+    rounds = run_searches(searches, evaluate, report) + 1
+    logger.info(
+        "Bracket search done after {} rounds, with {} factors per star".format(
+            rounds, [search.evaluations for search in searches.values()]
+        )
+    )
+
+    largest = [search.largest for search in searches.values() if search.largest is not None]
+    return (*_search_results(searches, range(number_stars), 1), max(largest + [max(coarse)]))
+
+
+def bracket_tuner(best_values, max_process, func, data_f, file_path, to_disable=[], pool=None, cache=None, **kwargs):
+    """
+    Fine tuning of the circular masks with a :class:`BracketSearch` for each star, over the same radii as
+    :func:`~pyarchi.utils.optimization.circular_fine_tune.circular_tuner`: from one below to one above the best
+    factor, with a step of 0.1. The search of each star starts around the best of bracket_coarse_points radii, evenly
+    spaced over its range. Each round calculates the radii asked by all stars, where each set of radii has a
+    different radius for each star. As in :func:`bracket_optimizer`, the result can be worse than the one of the
+    circular_tuner.
+
+    Parameters
+    ----------
+    best_values:
+        Best factor of each star
+    max_process:
+        Maximum number of processes that can be launched during this routine
+    func:
+        function that launches the photometric process
+    data_f:
+        :class:`pyarchi.main.initial_loads.Data`  object with all the stars information inside
+    file_path:
+        Path in which run time information shall be stored
+    to_disable:
+        Stars that are not tuned
+    pool:
+        :class:`~pyarchi.utils.optimization.worker_pool.WorkerPool` used to run the photometry
+    cache:
+        :class:`~pyarchi.utils.optimization.evaluation_cache.EvaluationCache` with the results of previous
+        calculations. The state of the searches is recorded after each round
+    kwargs
+
+    Returns
+    -------
+    min_cvs:
+        list with the minimum noise found
+
+    optimized_dict:
+        Dictionary in which the keys are the star numbers and the values are the optimal factors
+    """
+    best_values = [int(value) for value in best_values]
+    searches = {
+        star: BracketSearch(value - 1, value + 1, 0.1)
+        for star, value in enumerate(best_values)
+        if star not in to_disable
+    }
+
+    def evaluate(asked):
+        # each set has the next radius asked by each star; the other stars repeat their last one
+        rows = max(len(points) for points in asked.values())
+        value_range = np.array(
+            [
+                [
+                    asked[star][min(row, len(asked[star]) - 1)] if star in asked else value
+                    for star, value in enumerate(best_values)
+                ]
+                for row in range(rows)
+            ]
+        )
+
+        disabled = sorted(set(range(len(best_values))) - set(asked))
+        factors, cvs = evaluate_radii(value_range, max_process, func, data_f, disabled, pool, cache, **kwargs)
+
+        return {star: dict(zip(factors[star], cvs[star])) for star in asked}
+
+    def report(rounds):
+        if cache is not None:
+            cache.record_state(stage="tuner", round=rounds, **_search_state(searches, to_disable))
+
+    start_searches(searches, evaluate, kwargs.get("bracket_coarse_points", 11))
+    report(0)
+    rounds = run_searches(searches, evaluate, report) + 1
+    logger.info(
+        "Bracket tuning done after {} rounds, with {} radii per star".format(
+            rounds, [search.evaluations for search in searches.values()]
+        )
+    )
+
+    return _search_results(searches, range(len(best_values)), 0)
@@ -0,0 +1,109 @@
+import json
+import os
+
+from pyarchi.utils import create_logger
+from .evaluation_cache import CACHE_VERSION, EvaluationCache, config_inputs, visit_digest
+
+logger = create_logger("utils")
+
+CHECKPOINT_NAME = "optimization_checkpoint.json"
+
+
+def _to_builtin(value):
+    """
+    Converts the numpy values of the state to python ones, so that they can be stored in json
+    """
+    if hasattr(value, "item"):
+        return value.item()
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError("Can't store {} in the checkpoint".format(type(value)))
+
+
+class OptimizationCheckpoint(EvaluationCache):
+    """
+        State of an optimization, stored in the folder of the job after every calculation, so that it can be resumed
+        if the run is stopped (e.g. a crash or a preemption of the job). It holds the noise of each star for all
+        factors (and radii) that were calculated and the state of the search: the stage, the round of the extensions
+        or of the bracket search, the disabled stars and the best factors found so far.
+
+        The search of the optimization is deterministic, so resuming runs it again from the start, with the noise of
+        the known factors read from the checkpoint: the state, and the optimization_info.txt file, are the same as
+        the ones of an uninterrupted run and only the missing factors are calculated.
+
+        Results of the :class:`~pyarchi.utils.optimization.evaluation_cache.EvaluationCache` are also used, if one is
+        given, and all new results are stored in both.
+
+        Parameters
+        ---------------
+        folder:
+            Folder of the job, where the checkpoint is stored
+        resume:
+            If True, loads the checkpoint of the previous run. Otherwise, the optimization starts from scratch
+        cache:
+            :class:`~pyarchi.utils.optimization.evaluation_cache.EvaluationCache` shared by all runs, or None
+        visit:
+            Digest of the DRP outputs, if it was already calculated
+        kwargs:
+            Configuration values. The checkpoint is only used by runs of the same visit, with the same values of the
+            options that change the noise. As in the evaluation cache, the visit is identified by its DRP outputs
+            (see :func:`~pyarchi.utils.optimization.evaluation_cache.visit_digest`), so that a checkpoint is not used
+            after they are replaced
+    """
+
+    # the checkpoint belongs to a single job and a new run replaces it
+    shared = False
+
+    def __init__(self, folder, resume=False, cache=None, visit=None, **kwargs):
+        self._cache = cache
+        self.inputs = {"base_folder": kwargs.get("base_folder"), **config_inputs(**kwargs)}
+        self.inputs["version"] = CACHE_VERSION
+        try:
+            self.inputs["visit"] = visit if visit is not None else visit_digest(**kwargs)
+        except Exception:
+            logger.warning("Could not identify the DRP outputs of the visit in the checkpoint", exc_info=True)
+            self.inputs["visit"] = None
+        self.state = {}
+
+        super().__init__(folder, os.path.splitext(CHECKPOINT_NAME)[0], load=resume)
+
+        if self.number_stars is None and cache is not None:
+            self.number_stars = cache.number_stars
+
+        if resume and self.state:
+            logger.info(
+                "Resuming the optimization from the {} stage, round {}, with {} known results".format(
+                    self.state.get("stage"),
+                    self.state.get("round"),
+                    sum(len(factors) for entries in self._entries.values() for factors in entries.values()),
+                )
+            )
+
+    def _restore(self, stored):
+        if stored.get("inputs") != self.inputs:
+            logger.warning("The optimization checkpoint belongs to another visit or configuration. Starting over")
+            return
+
+        super()._restore(stored)
+        self.state = stored.get("state", {})
+
+    def _contents(self):
+        return {**super()._contents(), "inputs": self.inputs, "state": self.state}
+
+    def get(self, kind, star, factor):
+        noise = super().get(kind, star, factor)
+        if noise is None and self._cache is not None:
+            return self._cache.get(kind, star, factor)
+        return noise
+
+    def add(self, kind, noise, out_bounds, number_stars=None):
+        if self._cache is not None:
+            self._cache.add(kind, noise, out_bounds, number_stars)
+        super().add(kind, noise, out_bounds, number_stars)
+
+    def record_state(self, **state):
+        """
+        Stores the current state of the search, e.g. stage, round, disabled stars, and best factors
+        """
+        self.state = json.loads(json.dumps(state, default=_to_builtin))
+        self.store()
@@ -1,14 +1,19 @@
 import numpy as np
-from multiprocessing import Process, Queue
+from contextlib import nullcontext
 
 from pyarchi.utils import create_logger
+from .worker_pool import map_tasks
+from .evaluation_cache import cache_kind
 
 logger = create_logger("utils")
 
 
 def run_function(queue, func, factors, data_f, to_disable=[], **kwargs):
     """
-    Run each interaction of the function and  returns the results ordered on a dictionary
+    Run each interaction of the function and  returns the results ordered on a dictionary. If the radial_profile
+    option is active, the curve of growth of each star is calculated and the function is only run once.
+    Unless the optimization_session option is disabled, the data is only loaded once by this process, inside a
+    :meth:`~pyarchi.data_objects.Data.Data.optimization_session`.
 
     Parameters
     ----------
@@ -18,7 +23,8 @@ def run_function(queue, func, factors, data_f, to_disable=[], **kwargs):
 
     Returns
     -------
-
+        Puts in the queue two dictionaries, with the noise of each star for each radius (NaN if its mask was out of
+        bounds) and with the out of bounds flag of each one
     """
     kwargs_optim = kwargs.copy()
 
@@ -33,13 +39,38 @@ def run_function(queue, func, factors, data_f, to_disable=[], **kwargs):
     kwargs_optim["low_memory"] = 1
     kwargs_optim["uncertainties"] = 0
 
+    # inside the session, the data is only loaded once and each factor only creates the masks again
+    session = data_f.optimization_session() if kwargs.get("optimization_session", 1) else nullcontext()
+
+    with session:
+        if kwargs.get("radial_profile", 1):
+            return run_profile(queue, func, factors, data_f, to_disable, **kwargs_optim)
+
+        return run_factors(queue, func, factors, data_f, to_disable, **kwargs_optim)
+
+
+def run_factors(queue, func, factors, data_f, to_disable=[], **kwargs):
+    """
+    Runs the function once for each set of radii and returns the results ordered on a dictionary
+
+    Parameters
+    ----------
+    queue
+    func
+    factors
+
+    Returns
+    -------
+
+    """
     try:
         results_dict = {i: {} for i in range(len(factors[0]))}
     except:
         print("oh no")
         return
+    out_bounds_dict = {i: {} for i in range(len(factors[0]))}
     vals_dict = {str(i): val for i, val in enumerate(factors[0])}
-    data_f.load_parameters(vals_dict, **kwargs_optim)
+    data_f.load_parameters(vals_dict, **kwargs)
 
     for star_ind in to_disable:
         data_f.disable_star(star_ind)
@@ -49,9 +80,9 @@ def run_function(queue, func, factors, data_f, to_disable=[], **kwargs):
         if index != 0:
             vals_dict = {str(i): val for i, val in enumerate(fac)}
 
-            data_f.load_parameters(vals_dict, **kwargs_optim)
+            data_f.load_parameters(vals_dict, **kwargs)
 
-        data_fits = func(DataFits=data_f, factor=vals_dict, **kwargs_optim)
+        data_fits = func(DataFits=data_f, factor=vals_dict, **kwargs)
 
         for ind, star in enumerate(data_fits.stars):
 
@@ -60,49 +91,70 @@ def run_function(queue, func, factors, data_f, to_disable=[], **kwargs):
                 star_noise = float("nan")
 
             results_dict[ind][star.mask_factor] = star_noise
+            out_bounds_dict[ind][star.mask_factor] = bool(star.out_bound)
 
-    queue.put(results_dict)
+    queue.put((results_dict, out_bounds_dict))
     return
 
 
-def circular_tuner(
-    best_values, max_process, func, data_f, file_path, to_disable=[], **kwargs
-):
+def run_profile(queue, func, factors, data_f, to_disable=[], **kwargs):
     """
-    Decides which factors will be used in each process that it spawns. After the processes are done, extracts the
-    resulting data from the Queue and parses it, in order to find the noise values and mask factors. Writes to a .txt
-    file the resulting values for each factor. Take note that the values are not guaranteed to be in order, since they
-    are saved in the order "imposed" by the processes.
+    Runs the function a single time, with the curve of growth of each star, and returns the results of all radii
+    ordered on a dictionary, in the same way as :func:`run_function`
+
     Parameters
     ----------
-    value_range:
-        Lower and upper limit of the values to be tested
-    max_process:
-        Maximum number of processes that can be launched during this routine
-    func:
-        function that launches the photometric process
-    data_f:
-        :class:`pyarchi.main.initial_loads.Data`  object with all the stars information inside
-    file_path:
-        Path in which run time information shall be stored
-    kwargs
+    queue
+    func
+    factors
 
     Returns
     -------
-    min_cvs:
-        list with the minimum noise found
 
-    optimized_dict:
-        Dictionary in which the keys are the star numbers and the values are the optimal factors
     """
+    factors = np.asarray(factors)
+    radii_dict = {str(i): factors[:, i] for i in range(factors.shape[1])}
 
-    vals = [np.linspace(int(i) - 1, int(i) + 1, num=21) for i in best_values]
-    value_range = np.asarray(list(zip(*vals)))
+    data_f.load_parameters(radii_dict, **kwargs)
 
-    comms_queue = Queue()
+    for star_ind in to_disable:
+        data_f.disable_star(star_ind)
+
+    data_fits = func(DataFits=data_f, factor=radii_dict, **kwargs)
+
+    results_dict = {i: {} for i in range(factors.shape[1])}
+    out_bounds_dict = {i: {} for i in range(factors.shape[1])}
+    for ind, star in enumerate(data_fits.stars):
+        curves = star.factor_curves
+        out_bounds = star.factor_out_bounds
+
+        for radius in radii_dict[str(ind)]:
+            out_bounds_dict[ind][radius] = bool(out_bounds.get(radius, False))
+            if not star.is_active:  # the same noise as in run_factors
+                results_dict[ind][radius] = star.calculate_cdpp(data_fits.mjd_time)[0]
+                continue
+
+            if radius not in curves or out_bounds[radius]:
+                results_dict[ind][radius] = float("nan")
+                continue
+
+            results_dict[ind][radius] = star.calculate_cdpp(data_fits.mjd_time, flux=curves[radius])[0]
+
+    queue.put((results_dict, out_bounds_dict))
+    return
+
+
+def _calculate_radii(value_range, max_process, func, data_f, to_disable=[], pool=None, on_result=None, **kwargs):
+    """
+    Calculates the noise of every star for each set of radii, with the arguments of :func:`evaluate_radii`. Also
+    returns, with the same layout as the noise, the out of bounds flag of each star. The on_result function gets the
+    result of each task as soon as it finishes
+    """
     process_to_spawn = (
         max_process if value_range.shape[0] >= max_process else value_range.shape[0]
     )
+    if kwargs.get("radial_profile", 1):  # all radii are calculated in a single run
+        process_to_spawn = 1
 
     logger.info(
         "Optimizer going to spawn {} processes, for values: {}".format(
@@ -112,30 +164,143 @@ def circular_tuner(
     # Divide into equal lists the factors to be used
     splitted_values = np.array_split(value_range, process_to_spawn)
 
-    for k in range(process_to_spawn):
-        p = Process(
-            target=run_function,
-            args=(comms_queue, func, splitted_values[k], data_f, to_disable),
-            kwargs=kwargs,
-        )
-        p.start()
+    results = map_tasks(pool, run_function, splitted_values, func, data_f, to_disable, on_result, **kwargs)
 
     factors = []
     cvs = []
+    out_bounds = []
 
-    for ii in range(process_to_spawn):
+    for ii, result in enumerate(results):
 
-        data = comms_queue.get()
+        if result == -1:
+            logger.fatal("Error in the worker. Shutting down optimization process")
+            raise Exception("Errors in the optimization routine")
+        data, flags = result
         if (
             ii == 0
         ):  # For the first run, create list with list for each star, in which the noise values will be stored
             cvs = [[] for _ in range(len(data.keys()))]
             factors = [[] for _ in range(len(data.keys()))]
+            out_bounds = [[] for _ in range(len(data.keys()))]
 
         for star, star_dict in data.items():
             for fac, noise in star_dict.items():
                 factors[star].append(fac)
                 cvs[star].append(noise)
+                out_bounds[star].append(flags[star][fac])
+
+    return factors, cvs, out_bounds
+
+
+def evaluate_radii(value_range, max_process, func, data_f, to_disable=[], pool=None, cache=None, **kwargs):
+    """
+    Calculates the noise of every star for each set of radii, where each set has one radius for each star. The sets are
+    split between the processes of the pool or, with the radial_profile option, all of them are calculated in a single
+    run. If an evaluation cache is given, each star only calculates the radii that it doesn't hold, the stars without
+    new radii are disabled and the results of each process are added to it as soon as they finish.
+
+    Parameters
+    ----------
+    value_range:
+        Array with a set of radii in each row
+    max_process:
+        Maximum number of processes that can be launched during this routine
+    func:
+        function that launches the photometric process
+    data_f:
+        :class:`pyarchi.main.initial_loads.Data`  object with all the stars information inside
+    to_disable:
+        Stars that are not calculated
+    pool:
+        :class:`~pyarchi.utils.optimization.worker_pool.WorkerPool` used to run the photometry. If it's None, a new
+        one is created
+    cache:
+        :class:`~pyarchi.utils.optimization.evaluation_cache.EvaluationCache` with the results of previous
+        calculations. The disabled stars get a noise of 2e7, as when they are calculated
+    kwargs
+
+    Returns
+    -------
+    factors:
+        For each star, list with the tested radii
+    cvs:
+        For each star, list with the noise of each radius
+    """
+    if cache is None:
+        return _calculate_radii(value_range, max_process, func, data_f, to_disable, pool, **kwargs)[:2]
+
+    kind = cache_kind("radii", **kwargs)
+    number_stars = value_range.shape[1]
+    factors = [list(dict.fromkeys(value_range[:, star].tolist())) for star in range(number_stars)]
+
+    disabled = list(to_disable)
+    star_radii = []
+    for star, radii in enumerate(factors):
+        missing = cache.missing(kind, [star], radii) if star not in to_disable else radii
+        if not missing:  # keeps its radii, to create its mask
+            disabled.append(star)
+        star_radii.append(missing or radii)
+
+    if len(disabled) < number_stars:
+        # each set has the next radius of each star; the ones with fewer radii repeat their last one
+        rows = max(len(radii) for radii in star_radii)
+        to_calculate = np.array(
+            [[radii[min(row, len(radii) - 1)] for radii in star_radii] for row in range(rows)]
+        )
+        stars = [star for star in range(number_stars) if star not in disabled]
+
+        def store(task_id, result):
+            noise, out_bounds = result
+            noise = {star: noise[star] for star in stars}
+            cache.add(kind, noise, {star: out_bounds[star] for star in stars}, number_stars)
+
+        _calculate_radii(to_calculate, max_process, func, data_f, disabled, pool, store, **kwargs)
+
+    stars = [star for star in range(number_stars) if star not in to_disable]
+    return factors, cache.table(kind, factors, stars)
+
+
+def circular_tuner(
+    best_values, max_process, func, data_f, file_path, to_disable=[], pool=None, cache=None, **kwargs
+):
+    """
+    Decides which factors will be used in each process. After the processes are done, parses their results in order to
+    find the noise values and mask factors. The processes are the ones of the given
+    :class:`~pyarchi.utils.optimization.worker_pool.WorkerPool`, which keep the data loaded between calls, or new ones
+    if no pool is given.
+    Parameters
+    ----------
+    value_range:
+        Lower and upper limit of the values to be tested
+    max_process:
+        Maximum number of processes that can be launched during this routine
+    func:
+        function that launches the photometric process
+    data_f:
+        :class:`pyarchi.main.initial_loads.Data`  object with all the stars information inside
+    file_path:
+        Path in which run time information shall be stored
+    pool:
+        :class:`~pyarchi.utils.optimization.worker_pool.WorkerPool` used to run the photometry. If it's None, a new
+        one is created
+    cache:
+        :class:`~pyarchi.utils.optimization.evaluation_cache.EvaluationCache` with the results of previous
+        calculations. If it's None, all radii are calculated
+    kwargs
+
+    Returns
+    -------
+    min_cvs:
+        list with the minimum noise found
+
+    optimized_dict:
+        Dictionary in which the keys are the star numbers and the values are the optimal factors
+    """
+
+    vals = [np.linspace(int(i) - 1, int(i) + 1, num=21) for i in best_values]
+    value_range = np.asarray(list(zip(*vals)))
+
+    factors, cvs = evaluate_radii(value_range, max_process, func, data_f, to_disable, pool, cache, **kwargs)
 
     factors = np.array(factors)
     optimized_dict = {}
@@ -0,0 +1,341 @@
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+from astropy.io import fits
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, where the cache file is not locked
+    fcntl = None
+
+from pyarchi.utils import create_logger
+from pyarchi.utils.misc.path_searcher import OFFICIAL_CURVES, get_visit_index
+
+logger = create_logger("utils")
+
+# configuration values that change the noise of a factor, besides the DRP outputs
+CACHE_KEYS = [
+    "method",
+    "detect_mode",
+    "initial_detect",
+    "grid_bg",
+    "repeat_removal",
+    "dynam_window",
+    "official_curve",
+    "data_type",
+    "CDPP_type",
+]
+
+CACHE_VERSION = 2
+
+# noise of the stars that are disabled, the same as :meth:`~pyarchi.data_objects.Star_class.Star.calculate_cdpp`
+DISABLED_NOISE = 2e7
+
+
+def config_inputs(**kwargs):
+    """
+    Values of the configuration options that change the noise (:data:`CACHE_KEYS`), in a form that can be stored in
+    json. A custom noise metric (a function as CDPP_type) is identified by its module and qualified name, so a changed
+    function must be renamed to not use the results of the old one
+
+    Returns
+    -------
+        Dictionary with the value of each option
+    """
+    inputs = {}
+    for key in CACHE_KEYS:
+        value = kwargs.get(key)
+        if callable(value):
+            value = "{}.{}".format(getattr(value, "__module__", None), getattr(value, "__qualname__", repr(value)))
+        inputs[key] = value
+
+    return inputs
+
+
+def cache_kind(kind, **kwargs):
+    """
+    Name under which the results are stored: the noise calculated with decimated images (frame_decimation) is stored
+    apart from the one of all images
+    """
+    step = kwargs.get("frame_decimation", 1)
+    return kind if step == 1 else "{}-decimated-{}".format(kind, step)
+
+
+def file_digest(path):
+    """
+    sha256 that identifies a fits file without reading its data: its size, modification time and the headers of all
+    of its HDUs (which hold the CHECKSUM and DATASUM keywords written by the DRP). The data of large SubArray files is
+    never read
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha256("{} {}".format(stat.st_size, stat.st_mtime_ns).encode())
+
+    with fits.open(path, memmap=True) as hdulist:
+        for hdu in hdulist:
+            digest.update(hdu.header.tostring().encode())
+
+    return digest.hexdigest()
+
+
+def visit_digest(**kwargs):
+    """
+    Hash that identifies the DRP outputs of the visit: SubArray, StarCatalogue and the official light curves (see
+    :func:`file_digest`). Moving or renaming the files does not change it, but replacing or changing any of them does
+
+    Returns
+    -------
+        Dictionary with the digest of each DRP output that exists
+    """
+    visit_index = get_visit_index(kwargs["base_folder"], kwargs["data_type"], kwargs.get("persist_index", 0))
+
+    outputs = [("subarray", None), ("stars", None)] + [("default", curve) for curve in OFFICIAL_CURVES]
+    digests = {}
+    for mode, curve in outputs:
+        path = visit_index.find(mode, curve)
+        if path is not None:
+            digests[mode if curve is None else curve] = file_digest(path)
+
+    return digests
+
+
+class EvaluationCache:
+    """
+        Noise of each star, for the factors that were already calculated, stored on disk so that repeated or extended
+        optimizations only calculate the new factors. The file is named after a hash of the DRP outputs and of the
+        configuration values that change the noise (:data:`CACHE_KEYS`), so that a different visit or configuration
+        never uses the results of another one.
+
+        The factors of the optimization and the radii of the fine tuning are stored apart ("factors" and "radii"
+        kinds), as well as the results with decimated images (see :func:`cache_kind`). Each entry holds the noise of
+        the star (None if it's not a number) and if its mask was out of bounds, as given by the photometry: an out of
+        bounds star always gets NaN noise, but a NaN noise (e.g. a lost star) does not mean that it was out of bounds.
+
+        Several jobs can use the same cache at once, e.g. an array of jobs over different val_range: the file is
+        locked while it's written and the results stored by the other jobs are merged with the new ones.
+
+        Parameters
+        ---------------
+        folder:
+            Folder where the cache files are stored
+        key:
+            Hash that identifies the inputs of the optimization
+        load:
+            If False, the stored results are ignored and replaced by the new ones
+    """
+
+    # the file can be written by several jobs at once, so the stored results are merged with the new ones
+    shared = True
+
+    def __init__(self, folder, key, load=True):
+        self.path = os.path.join(folder, "{}.json".format(key))
+        self.number_stars = None
+
+        self._entries = {}  # kind -> star -> factor -> [noise, out of bounds]
+
+        if load and os.path.exists(self.path):
+            self._load()
+
+    @classmethod
+    def from_config(cls, visit=None, **kwargs):
+        """
+        Creates the cache of the configured folder (evaluation_cache option)
+
+        Parameters
+        ----------
+        visit:
+            Digest of the DRP outputs (see :func:`visit_digest`), if it was already calculated
+        kwargs
+
+        Returns
+        -------
+            :class:`EvaluationCache` or None if the cache is disabled or can't be used
+        """
+        folder = kwargs.get("evaluation_cache", "")
+        if not folder:
+            return None
+
+        try:
+            os.makedirs(folder, exist_ok=True)
+            inputs = {
+                "version": CACHE_VERSION,
+                "visit": visit if visit is not None else visit_digest(**kwargs),
+                "config": config_inputs(**kwargs),
+            }
+            key = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+        except Exception:
+            logger.warning("Could not create the evaluation cache. All factors will be calculated", exc_info=True)
+            return None
+
+        return cls(folder, key)
+
+    @staticmethod
+    def _factor_key(factor):
+        return repr(float(factor))
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            logger.warning("Could not read {}".format(self.path), exc_info=True)
+            return
+
+        self._restore(stored)
+
+    def _restore(self, stored):
+        """
+        Uses the contents of the file
+        """
+        self.number_stars = stored.get("stars")
+        self._entries = stored.get("noise", {})
+
+    def _contents(self):
+        """
+        Dictionary that is stored in the file
+        """
+        return {"stars": self.number_stars, "noise": self._entries}
+
+    @contextmanager
+    def _locked(self):
+        """
+        Holds an exclusive lock on the file, through a sidecar file, so that only one job writes it at a time
+        """
+        if fcntl is None:
+            yield
+            return
+
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _merge_stored(self):
+        """
+        Adds the results stored by other jobs, after this one was loaded. The results of this job are kept
+        """
+        try:
+            with open(self.path, "r") as file:
+                stored = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.warning("Could not read {}".format(self.path), exc_info=True)
+            return
+
+        for kind, stars in stored.get("noise", {}).items():
+            for star, entries in stars.items():
+                merged = dict(entries)
+                merged.update(self._entries.get(kind, {}).get(star, {}))
+                self._entries.setdefault(kind, {})[star] = merged
+
+        if self.number_stars is None:
+            self.number_stars = stored.get("stars")
+
+    def store(self):
+        """
+        Writes the cache to disk. The file is replaced at once, so that an interrupted write never corrupts it. If the
+        file is shared, the results stored by other jobs are merged first
+        """
+        temp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            with self._locked():
+                if self.shared:
+                    self._merge_stored()
+
+                with open(temp_path, "w") as file:
+                    json.dump(self._contents(), file)
+                os.replace(temp_path, self.path)
+        except (OSError, TypeError, ValueError):
+            logger.warning("Could not store {}".format(self.path), exc_info=True)
+
+    def active_stars(self, to_disable=[]):
+        """
+        Stars that are not disabled, or None if the number of stars is not yet known
+        """
+        if self.number_stars is None:
+            return None
+        return [star for star in range(self.number_stars) if star not in to_disable]
+
+    def get(self, kind, star, factor):
+        """
+        Noise of a star for one factor
+
+        Returns
+        -------
+            Noise (NaN if the mask was out of bounds) or None if it was never calculated
+        """
+        entry = self._entries.get(kind, {}).get(str(star), {}).get(self._factor_key(factor))
+        if entry is None:
+            return None
+
+        noise, out_bounds = entry
+        return float("nan") if out_bounds or noise is None else noise
+
+    def missing(self, kind, stars, factors):
+        """
+        Factors, from the given ones, that were never calculated for at least one of the stars
+        """
+        return [factor for factor in factors if any(self.get(kind, star, factor) is None for star in stars)]
+
+    def add(self, kind, noise, out_bounds, number_stars=None):
+        """
+        Stores new results and writes the cache to disk
+
+        Parameters
+        ----------
+        kind:
+            factors or radii, see :func:`cache_kind`
+        noise:
+            Dictionary with, for each star, a dictionary with the noise of each factor
+        out_bounds:
+            Dictionary with the same layout as the noise, with the out of bounds flag of each factor
+        number_stars:
+            Number of stars of the visit, if it's known
+        """
+        if number_stars is not None:
+            self.number_stars = number_stars
+
+        for star, star_noise in noise.items():
+            entries = self._entries.setdefault(kind, {}).setdefault(str(star), {})
+            for factor, value in star_noise.items():
+                value = None if np.isnan(value) else float(value)
+                entries[self._factor_key(factor)] = [value, bool(out_bounds[star][factor])]
+
+        self.store()
+
+    def record_state(self, **state):
+        """
+        Stores the state of the search. Only used by the
+        :class:`~pyarchi.utils.optimization.checkpoint.OptimizationCheckpoint`, the cache only holds the noise
+        """
+
+    def table(self, kind, star_factors, stars):
+        """
+        Noise of each star for each one of its factors, in the same layout as the results of the optimization. The
+        stars that are not in the list get the noise of a disabled star (:data:`DISABLED_NOISE`), as in the photometry,
+        and the factors that were not calculated get NaN
+
+        Parameters
+        ----------
+        kind:
+            factors or radii, see :func:`cache_kind`
+        star_factors:
+            List with the factors of each star
+        stars:
+            Stars whose noise is returned
+        """
+        table = []
+        for star, factors in enumerate(star_factors):
+            if star not in stars:
+                table.append([DISABLED_NOISE] * len(factors))
+                continue
+
+            noise = [self.get(kind, star, factor) for factor in factors]
+            table.append([float("nan") if value is None else value for value in noise])
+
+        return table
@@ -1,14 +1,19 @@
 import numpy as np
-from multiprocessing import Process, Queue
+from contextlib import nullcontext
 
 from pyarchi.utils import create_logger
+from .worker_pool import map_tasks
+from .evaluation_cache import cache_kind
 
 logger = create_logger("utils")
 
 
 def run_function(queue, func, factors, data_f, to_disable=[], **kwargs):
     """
-    Run each interaction of the function and  returns the results ordered on a dictionary
+    Run each interaction of the function and  returns the results ordered on a dictionary. If the multi_aperture
+    option is active, the masks of all factors are created as concentric layers and the function is only run once.
+    Unless the optimization_session option is disabled, the data is only loaded once by this process, inside a
+    :meth:`~pyarchi.data_objects.Data.Data.optimization_session`.
 
     Parameters
     ----------
@@ -18,7 +23,8 @@ def run_function(queue, func, factors, data_f, to_disable=[], **kwargs):
 
     Returns
     -------
-
+        Puts in the queue two dictionaries, with the noise of each star for each factor (NaN if its mask was out of
+        bounds) and with the out of bounds flag of each one
     """
 
     kwargs_optim = kwargs.copy()
@@ -34,8 +40,34 @@ def run_function(queue, func, factors, data_f, to_disable=[], **kwargs):
     kwargs_optim["low_memory"] = 1
     kwargs_optim["uncertainties"] = 0
 
+    # inside the session, the data is only loaded once and each factor only creates the masks again
+    session = data_f.optimization_session() if kwargs.get("optimization_session", 1) else nullcontext()
+
+    with session:
+        if kwargs.get("multi_aperture", 1):
+            return run_layers(queue, func, factors, data_f, to_disable, **kwargs_optim)
+
+        return run_factors(queue, func, factors, data_f, to_disable, **kwargs_optim)
+
+
+def run_factors(queue, func, factors, data_f, to_disable=[], **kwargs):
+    """
+    Runs the function once for each factor and returns the results ordered on a dictionary. Each factor can also be a
+    dictionary with a different factor for each star
+
+    Parameters
+    ----------
+    queue
+    func
+    factors
+
+    Returns
+    -------
+
+    """
     results_dict = {}
-    data_f.load_parameters(factors[0], **kwargs_optim)
+    out_bounds_dict = {}
+    data_f.load_parameters(factors[0], **kwargs)
 
     for star_ind in to_disable:
         data_f.disable_star(star_ind)
@@ -43,59 +75,115 @@ def run_function(queue, func, factors, data_f, to_disable=[], **kwargs):
     for index, fac in enumerate(factors):
 
         if index != 0:
-            data_f.load_parameters(fac, **kwargs_optim)
+            data_f.load_parameters(fac, **kwargs)
         
         if data_f.abort_process:
             queue.put(-1)
             return -1 
-        data_fits = func(DataFits=data_f, factor=fac, **kwargs_optim)
+        data_fits = func(DataFits=data_f, factor=fac, **kwargs)
 
-        star_results = {}
         for ind, star in enumerate(data_fits.stars):
+            star_factor = fac[str(ind)] if isinstance(fac, dict) else fac
+            star_results = results_dict.setdefault(star_factor, {})
+
             star_results[ind] = star.calculate_cdpp(data_fits.mjd_time)[0]
+            out_bounds_dict.setdefault(star_factor, {})[ind] = bool(star.out_bound)
 
             if star.out_bound:
                 star_results[ind] = float("nan")
 
-        results_dict[fac] = star_results
-
-    queue.put(results_dict)
+    queue.put((results_dict, out_bounds_dict))
     return
 
 
-def optimizer(value_range, max_process, func, data_f, file_path, to_disable=[], **kwargs):
+def run_layers(queue, func, factors, data_f, to_disable=[], **kwargs):
     """
-    Decides which factors will be used in each process that it spawns. After the processes are done, extracts the
-    resulting data from the Queue and parses it, in order to find the noise values and mask factors. Writes to a .txt
-    file the resulting values for each factor. Take note that the values are not guaranteed to be in order, since they
-    are saved in the order "imposed" by the processes.
+    Runs the function a single time, with the masks of all factors, and returns the results of each factor ordered on
+    a dictionary, in the same way as :func:`run_function`. The factors can also be a dictionary with the list of
+    factors of each star
+
     Parameters
     ----------
-    value_range:
-        Lower and upper limit of the values to be tested
-    max_process:
-        Maximum number of processes that can be launched during this routine
-    func:
-        function that launches the photometric process
-    data_f:
-        :class:`pyarchi.main.initial_loads.Data`  object with all the stars information inside
-    file_path:
-        Path in which run time information shall be stored
-    kwargs
+    queue
+    func
+    factors
 
     Returns
     -------
-    min_cvs:
-        list with the minimum noise found
 
-    optimized_dict:
-        Dictionary in which the keys are the star numbers and the values are the optimal factors
     """
+    per_star = isinstance(factors, dict)
+    if not per_star:
+        factors = list(factors)
+    data_f.load_parameters(factors, **kwargs)
+
+    for star_ind in to_disable:
+        data_f.disable_star(star_ind)
+
+    if data_f.abort_process:
+        queue.put(-1)
+        return -1
+    data_fits = func(DataFits=data_f, factor=factors, **kwargs)
+
+    results_dict = {} if per_star else {fac: {} for fac in factors}
+    out_bounds_dict = {}
+    for ind, star in enumerate(data_fits.stars):
+        curves = star.factor_curves
+        out_bounds = star.factor_out_bounds
+
+        for fac in factors[str(ind)] if per_star else factors:
+            results_dict.setdefault(fac, {})
+            out_bounds_dict.setdefault(fac, {})[ind] = bool(out_bounds.get(fac, False))
+            if not star.is_active:  # the same noise as in run_factors
+                results_dict[fac][ind] = star.calculate_cdpp(data_fits.mjd_time)[0]
+                continue
+
+            if fac not in curves or out_bounds[fac]:
+                results_dict[fac][ind] = float("nan")
+                continue
+
+            results_dict[fac][ind] = star.calculate_cdpp(data_fits.mjd_time, flux=curves[fac])[0]
+
+    queue.put((results_dict, out_bounds_dict))
+    return
+
+
+def task_results(result):
+    """
+    Parses the result of a task of :func:`run_function`
 
-    comms_queue = Queue()
+    Returns
+    -------
+    noise:
+        For each star, dictionary with the noise of each factor
+    out_bounds:
+        For each star, dictionary with the out of bounds flag of each factor
+    """
+    if result == -1:
+        logger.fatal("Error in the worker. Shutting down optimization process")
+        raise Exception("Errors in the optimization routine")
+
+    data, flags = result
+    noise, out_bounds = {}, {}
+    for factor, stars_dict in data.items():
+        for star, CV in stars_dict.items():
+            noise.setdefault(star, {})[factor] = CV
+            out_bounds.setdefault(star, {})[factor] = flags[factor][star]
+
+    return noise, out_bounds
+
+
+def _calculate_factors(value_range, max_process, func, data_f, to_disable=[], pool=None, on_result=None, **kwargs):
+    """
+    Calculates the noise of every star for each one of the factors, with the arguments of :func:`evaluate_factors`.
+    Also returns, with the same layout as the noise, the out of bounds flag of each star. The on_result function gets
+    the result of each task as soon as it finishes
+    """
     process_to_spawn = (
         max_process if value_range.shape[0] >= max_process else value_range.shape[0]
     )
+    if kwargs.get("multi_aperture", 1):  # all factors are calculated in a single run
+        process_to_spawn = 1
 
     logger.info(
         "Optimizer going to spawn {} processes, for values: {}".format(
@@ -109,40 +197,213 @@ def optimizer(value_range, max_process, func, data_f, file_path, to_disable=[],
     # elements not inside the sublists
 
     logger.debug(splitted_values)
-    
-    workers = []
-    for k in range(process_to_spawn):
-        p = Process(
-            target=run_function,
-            args=(comms_queue, func, splitted_values[k], data_f, to_disable),
-            kwargs=kwargs,
-        )
-        p.start()
-        workers.append(p)
+
+    results = map_tasks(pool, run_function, splitted_values, func, data_f, to_disable, on_result, **kwargs)
 
     factors = []
     cvs = []
+    out_bounds = []
 
-    for ii in range(process_to_spawn):
-
-        data = comms_queue.get()
-        if data == -1:
-            logger.fatal("Error in the worker. Shutting down optimization process")
-            comms_queue.close()
-            [p.terminate() for p in workers]
-            raise Exception("Errors in the optimization routine")
+    for ii, result in enumerate(results):
+        noise, flags = task_results(result)
         if (
             ii == 0
         ):  # For the first run, create list with list for each star, in which the noise values will be stored
-            cvs = [[] for _ in range(len(data[list(data.keys())[0]]))]
+            cvs = [[] for _ in range(len(noise))]
+            out_bounds = [[] for _ in range(len(noise))]
+
+        factors.extend(noise[0])
+        for key in noise:
+            cvs[key].extend(noise[key].values())
+            out_bounds[key].extend(flags[key].values())
+
+    return np.array(factors), cvs, out_bounds
+
+
+def evaluate_factors(value_range, max_process, func, data_f, to_disable=[], pool=None, cache=None, **kwargs):
+    """
+    Calculates the noise of every star for each one of the factors. The factors are split between the processes of the
+    pool or, with the multi_aperture option, all of them are calculated in a single run.
+    If an evaluation cache is given, only the factors that it doesn't hold are calculated, and the results of each
+    process are added to it as soon as they finish.
+
+    Parameters
+    ----------
+    value_range:
+        Array with the factors to be tested
+    max_process:
+        Maximum number of processes that can be launched during this routine
+    func:
+        function that launches the photometric process
+    data_f:
+        :class:`pyarchi.main.initial_loads.Data`  object with all the stars information inside
+    to_disable:
+        Stars that are not calculated
+    pool:
+        :class:`~pyarchi.utils.optimization.worker_pool.WorkerPool` used to run the photometry. If it's None, a new
+        one is created
+    cache:
+        :class:`~pyarchi.utils.optimization.evaluation_cache.EvaluationCache` with the results of previous
+        calculations. The disabled stars get a noise of 2e7, as when they are calculated
+    kwargs
+
+    Returns
+    -------
+    factors:
+        Array with the factors, in the order in which they were calculated
+    cvs:
+        For each star, list with the noise of each factor
+    """
+    if cache is None:
+        return _calculate_factors(value_range, max_process, func, data_f, to_disable, pool, **kwargs)[:2]
+
+    kind = cache_kind("factors", **kwargs)
 
-        for factor, stars_dict in data.items():
-            factors.append(factor)
+    # until the first calculation, the number of stars is not known
+    stars = cache.active_stars(to_disable)
+    to_calculate = value_range if stars is None else cache.missing(kind, stars, value_range)
 
-            for key, CV in stars_dict.items():
-                cvs[key].append(CV)
+    def store(task_id, result):
+        noise, out_bounds = task_results(result)
+        stars = [star for star in noise if star not in to_disable]
+        cache.add(kind, {star: noise[star] for star in stars}, {star: out_bounds[star] for star in stars}, len(noise))
 
-    factors = np.array(factors)
+    if len(to_calculate):
+        _calculate_factors(np.asarray(to_calculate), max_process, func, data_f, to_disable, pool, store, **kwargs)
+
+    logger.info(
+        "{} of {} factors were in the evaluation cache".format(len(value_range) - len(to_calculate), len(value_range))
+    )
+    star_factors = [value_range] * cache.number_stars
+    return np.asarray(value_range), cache.table(kind, star_factors, cache.active_stars(to_disable))
+
+
+def evaluate_star_factors(star_factors, max_process, func, data_f, to_disable=[], pool=None, cache=None, **kwargs):
+    """
+    Calculates the noise of each star for its own factors, so that different stars test different factors in the same
+    run. With the multi_aperture option, every star gets the masks of all of its factors, in a single run. Otherwise,
+    each run gives the next factor to each star (the ones with fewer factors repeat their last one) and the runs are
+    split between the processes of the pool. If an evaluation cache is given, each star only calculates the factors
+    that it doesn't hold, the stars without new factors are disabled and the results of each process are added to it
+    as soon as they finish.
+
+    Parameters
+    ----------
+    star_factors:
+        List with the factors of each star. The disabled stars must also have one, which is used to create their mask
+    max_process:
+        Maximum number of processes that can be launched during this routine
+    func:
+        function that launches the photometric process
+    data_f:
+        :class:`pyarchi.main.initial_loads.Data`  object with all the stars information inside
+    to_disable:
+        Stars that are not calculated
+    pool:
+        :class:`~pyarchi.utils.optimization.worker_pool.WorkerPool` used to run the photometry. If it's None, a new
+        one is created
+    cache:
+        :class:`~pyarchi.utils.optimization.evaluation_cache.EvaluationCache` with the results of previous
+        calculations
+    kwargs
+
+    Returns
+    -------
+        Dictionary with, for each star that is not disabled, a dictionary with the noise of each one of its factors
+    """
+    star_factors = [sorted(set(np.atleast_1d(factors).tolist())) for factors in star_factors]
+
+    noise = {star: {} for star in range(len(star_factors)) if star not in to_disable}
+    to_disable = list(to_disable)
+
+    kind = cache_kind("factors", **kwargs)
+
+    if cache is not None and cache.active_stars() is not None:
+        for star in noise:
+            missing = cache.missing(kind, [star], star_factors[star])
+            noise[star] = {
+                factor: cache.get(kind, star, factor) for factor in star_factors[star] if factor not in missing
+            }
+
+            if missing:
+                star_factors[star] = missing
+            else:  # keeps its factors, to create its mask
+                to_disable.append(star)
+
+        if len(to_disable) == len(star_factors):
+            return noise
+
+    if kwargs.get("multi_aperture", 1):  # all factors are calculated in a single run
+        batches = [{str(star): factors for star, factors in enumerate(star_factors)}]
+    else:
+        runs = [
+            {str(star): factors[min(index, len(factors) - 1)] for star, factors in enumerate(star_factors)}
+            for index in range(max(len(factors) for factors in star_factors))
+        ]
+        batches = [
+            [runs[index] for index in indexes]
+            for indexes in np.array_split(np.arange(len(runs)), min(max_process, len(runs)))
+        ]
+
+    logger.info("Optimizer going to spawn {} processes, for values: {}".format(len(batches), star_factors))
+
+    calculated = {star: {} for star in noise if star not in to_disable}
+
+    def store(task_id, result):
+        task_noise, task_flags = task_results(result)
+        stars = [star for star in calculated if star in task_noise]
+        task_noise = {star: task_noise[star] for star in stars}
+        cache.add(kind, task_noise, {star: task_flags[star] for star in stars}, len(star_factors))
+
+    results = map_tasks(
+        pool, run_function, batches, func, data_f, to_disable, store if cache is not None else None, **kwargs
+    )
+
+    for result in results:
+        task_noise = task_results(result)[0]
+        for star in calculated:
+            calculated[star].update(task_noise.get(star, {}))
+
+    for star, star_noise in calculated.items():
+        noise[star].update(star_noise)
+
+    return noise
+
+
+def write_factors(file_path, factors, cvs):
+    """
+    Writes to the .txt file the noise of all stars for each factor
+    """
+    with open(file_path, mode="a") as file:
+
+        for index, fac in enumerate(factors):
+            cdpps = ""
+            for star_list in cvs:
+                cdpps += str(star_list[index]) + " "
+
+            file.write("{} \t {} \n".format(fac, cdpps))
+
+
+def best_factors(factors, cvs):
+    """
+    Finds the factor with the lowest noise of each star. The stars without a valid noise get the factor 1 and a noise
+    of 2e7
+
+    Parameters
+    ----------
+    factors:
+        Array with the factors
+    cvs:
+        For each star, list with the noise of each factor
+
+    Returns
+    -------
+    min_cvs:
+        list with the minimum noise found
+
+    optimized_dict:
+        Dictionary in which the keys are the star numbers and the values are the optimal factors
+    """
     optimized_dict = {}
 
     min_cvs = {}
@@ -160,13 +421,47 @@ def optimizer(value_range, max_process, func, data_f, file_path, to_disable=[],
 
         optimized_dict[str(index)] = int(optimal_factor[0])
 
-    with open(file_path, mode="a") as file:
+    return min_cvs, optimized_dict
 
-        for index, fac in enumerate(factors):
-            cdpps = ""
-            for star_list in cvs:
-                cdpps += str(star_list[index]) + " "
 
-            file.write("{} \t {} \n".format(fac, cdpps))
+def optimizer(value_range, max_process, func, data_f, file_path, to_disable=[], pool=None, cache=None, **kwargs):
+    """
+    Decides which factors will be used in each process. After the processes are done, parses their results in order to
+    find the noise values and mask factors. Writes to a .txt file the resulting values for each factor. The processes
+    are the ones of the given :class:`~pyarchi.utils.optimization.worker_pool.WorkerPool`, which keep the data loaded
+    between calls, or new ones if no pool is given.
+    Parameters
+    ----------
+    value_range:
+        Lower and upper limit of the values to be tested
+    max_process:
+        Maximum number of processes that can be launched during this routine
+    func:
+        function that launches the photometric process
+    data_f:
+        :class:`pyarchi.main.initial_loads.Data`  object with all the stars information inside
+    file_path:
+        Path in which run time information shall be stored
+    pool:
+        :class:`~pyarchi.utils.optimization.worker_pool.WorkerPool` used to run the photometry. If it's None, a new
+        one is created
+    cache:
+        :class:`~pyarchi.utils.optimization.evaluation_cache.EvaluationCache` with the results of previous
+        calculations. If it's None, all factors are calculated
+    kwargs
+
+    Returns
+    -------
+    min_cvs:
+        list with the minimum noise found
+
+    optimized_dict:
+        Dictionary in which the keys are the star numbers and the values are the optimal factors
+    """
+
+    factors, cvs = evaluate_factors(value_range, max_process, func, data_f, to_disable, pool, cache, **kwargs)
+
+    min_cvs, optimized_dict = best_factors(factors, cvs)
+    write_factors(file_path, factors, cvs)
 
     return min_cvs, optimized_dict
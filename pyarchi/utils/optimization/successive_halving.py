@@ -0,0 +1,233 @@
+import warnings
+
+from astropy.io import fits
+import numpy as np
+from scipy.stats import spearmanr
+
+from pyarchi.utils import create_logger
+from pyarchi.utils.misc.path_searcher import path_finder
+from .optimizer import best_factors, evaluate_factors, evaluate_star_factors, write_factors
+
+logger = create_logger("utils")
+
+# the K2 CDPP is calculated over windows of 30 images: a shorter light curve gives no meaningful noise
+MIN_RUNG_IMAGES = 30
+
+
+def halving_rungs(decimation, number_images=None):
+    """
+    Decimation of each rung of the successive halving: starts with the given one and is halved until all images are
+    used, e.g. 4 -> [4, 2, 1] and 3 -> [3, 1]. If the number of images of the visit is given, the first decimation is
+    halved until its rung keeps at least :data:`MIN_RUNG_IMAGES` images
+    """
+    decimation = max(int(decimation), 1)
+    if number_images is not None:
+        while decimation > 1 and -(-number_images // decimation) < MIN_RUNG_IMAGES:
+            decimation //= 2
+
+    rungs = [decimation]
+    while rungs[-1] > 1:
+        rungs.append(rungs[-1] // 2)
+
+    return rungs
+
+
+def _rung_kwargs(kwargs, decimation):
+    """
+    Configuration of a rung. With all images, it's the original one, so that the optimization sessions of the
+    processes keep their data for the following calculations
+    """
+    return kwargs if decimation == 1 else dict(kwargs, frame_decimation=decimation)
+
+
+def _ranked(star_noise):
+    """
+    Factors of a star, from the lowest to the highest noise. The factors with NaN noise are the last ones
+    """
+    return sorted(
+        star_noise, key=lambda factor: (np.isnan(star_noise[factor]), np.nan_to_num(star_noise[factor]), factor)
+    )
+
+
+def survivors(star_noise, keep):
+    """
+    Best factors of a star, which are calculated in the next rung
+
+    Parameters
+    ----------
+    star_noise:
+        Dictionary with the noise of each factor
+    keep:
+        Fraction of the factors that is kept. At least one factor is always kept
+
+    Returns
+    -------
+        List with the kept factors
+    """
+    ranked = _ranked(star_noise)
+    return ranked[: max(int(np.ceil(keep * len(ranked))), 1)]
+
+
+def rank_agreement(coarse, fine):
+    """
+    Compares the rankings of the factors of a star in two rungs
+
+    Parameters
+    ----------
+    coarse, fine:
+        Dictionaries with the noise of each factor, with more and fewer decimated images, respectively
+
+    Returns
+    -------
+    rho:
+        Spearman correlation between the noise of the factors calculated in both rungs. NaN if there are fewer than
+        three of them
+    rank:
+        Position of the best factor of the fine rung in the coarse ranking, where 1 is the best. None if the fine rung
+        has no valid noise
+    """
+    common = [
+        factor for factor in fine if factor in coarse and np.isfinite(fine[factor]) and np.isfinite(coarse[factor])
+    ]
+
+    rho = float("nan")
+    if len(common) >= 3:
+        with warnings.catch_warnings():  # constant noise has no correlation
+            warnings.simplefilter("ignore")
+            rho = spearmanr([coarse[factor] for factor in common], [fine[factor] for factor in common])[0]
+
+    ranked = _ranked(fine)
+    if not ranked or np.isnan(fine[ranked[0]]) or ranked[0] not in coarse:
+        return rho, None
+
+    return rho, _ranked(coarse).index(ranked[0]) + 1
+
+
+def write_agreement(file_path, rungs, history):
+    """
+    Writes to the .txt file how the ranking of the factors of each star agrees between consecutive rungs: the factors
+    of a rung are the ones kept from the previous, more decimated, one. The summary of each pair of rungs holds the
+    number of stars whose best factor is the same in both and the mean rank correlation, which show if the decimation
+    can be increased (or must be lowered)
+    """
+    with open(file_path, mode="a") as file:
+        for index in range(1, len(rungs)):
+            coarse, fine = history[index - 1], history[index]
+            file.write(
+                "Successive halving - one of every {} images vs one of every {} images: \n".format(
+                    rungs[index - 1], rungs[index]
+                )
+            )
+
+            agreement = {star: rank_agreement(coarse[star], star_noise) for star, star_noise in fine.items()}
+            for star, (rho, rank) in agreement.items():
+                file.write(
+                    "Star {} \t rank correlation: {} over {} factors \t best factor ranked {} of {} \n".format(
+                        star, rho, len(fine[star]), rank, len(coarse[star])
+                    )
+                )
+
+            correlations = [rho for rho, _ in agreement.values() if np.isfinite(rho)]
+            file.write(
+                "Same best factor for {} of {} stars \t mean rank correlation: {} \n".format(
+                    sum(rank == 1 for _, rank in agreement.values()),
+                    len(agreement),
+                    np.mean(correlations) if correlations else float("nan"),
+                )
+            )
+
+
+def halving_optimizer(
+    value_range, max_process, func, data_f, file_path, to_disable=[], pool=None, cache=None, **kwargs
+):
+    """
+    Successive halving of the factors of the grid strategy. All factors are first calculated with only one of every
+    halving_decimation images, which is much faster. For each star, only the best factors (halving_keep fraction) are
+    calculated in the next rung, with half of the decimation, until the last rung uses all images. Each rung after the
+    first calculates, in the same run, the factors kept by each star, with
+    :func:`~pyarchi.utils.optimization.optimizer.evaluate_star_factors`.
+
+    The best factor of each star is the one with the lowest noise in the last rung. Writes to the .txt file the noise of
+    each rung and how the rankings of consecutive rungs agree (see :func:`write_agreement`).
+
+    Parameters
+    ----------
+    value_range:
+        Array with the factors to be tested
+    max_process:
+        Maximum number of processes that can be launched during this routine
+    func:
+        function that launches the photometric process
+    data_f:
+        :class:`pyarchi.main.initial_loads.Data`  object with all the stars information inside
+    file_path:
+        Path in which run time information shall be stored
+    to_disable:
+        Stars that are not calculated
+    pool:
+        :class:`~pyarchi.utils.optimization.worker_pool.WorkerPool` used to run the photometry
+    cache:
+        :class:`~pyarchi.utils.optimization.evaluation_cache.EvaluationCache` with the results of previous
+        calculations. The state of the halving is recorded after each rung
+    kwargs
+
+    Returns
+    -------
+    min_cvs:
+        list with the minimum noise found
+
+    optimized_dict:
+        Dictionary in which the keys are the star numbers and the values are the optimal factors
+    """
+    decimation = kwargs.get("halving_decimation", 1)
+    number_images = fits.getheader(path_finder(mode="subarray", **kwargs), 1)["NAXIS3"]
+    rungs = halving_rungs(decimation, number_images)
+    if rungs[0] != decimation:
+        logger.warning(
+            "The visit only has {} images: the successive halving starts with one of every {} images, "
+            "instead of {}".format(number_images, rungs[0], decimation)
+        )
+    keep = kwargs.get("halving_keep", 0.5)
+
+    factors, cvs = evaluate_factors(
+        value_range, max_process, func, data_f, to_disable, pool, cache, **_rung_kwargs(kwargs, rungs[0])
+    )
+    factor_list = factors.tolist()
+    number_stars = len(cvs)
+    stars = [star for star in range(number_stars) if star not in to_disable]
+
+    history = [{star: dict(zip(factor_list, cvs[star])) for star in stars}]
+    for index, decimation in enumerate(rungs[1:], start=1):
+        kept = {star: survivors(history[-1][star], keep) for star in stars}
+        if cache is not None:
+            cache.record_state(stage="halving", round=index, decimation=decimation, disabled=to_disable, kept=kept)
+
+        # the disabled stars also need a factor, for their masks
+        star_factors = [kept.get(star, factor_list[:1]) for star in range(number_stars)]
+        history.append(
+            evaluate_star_factors(
+                star_factors, max_process, func, data_f, to_disable, pool, cache, **_rung_kwargs(kwargs, decimation)
+            )
+        )
+
+    def table(rung_noise):
+        # the factors that were not kept have no noise in the following rungs
+        return [
+            [rung_noise.get(star, {}).get(factor, float("nan")) for factor in factor_list]
+            for star in range(number_stars)
+        ]
+
+    for decimation, rung_noise in zip(rungs, history):
+        with open(file_path, mode="a") as file:
+            file.write("Successive halving - noise with one of every {} images: \n".format(decimation))
+        write_factors(file_path, factors, table(rung_noise))
+
+    write_agreement(file_path, rungs, history)
+
+    logger.info(
+        "Successive halving with rungs {}: {} of {} factors calculated with all images, for each star".format(
+            rungs, [len(history[-1][star]) for star in stars], len(factor_list)
+        )
+    )
+
+    return best_factors(factors, table(history[-1]))
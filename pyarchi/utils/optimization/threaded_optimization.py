@@ -4,13 +4,18 @@ import logging
 
 from .optimizer import optimizer
 from .circular_fine_tune import circular_tuner
+from .worker_pool import WorkerPool
+from .bracket_search import bracket_optimizer, bracket_tuner
+from .evaluation_cache import EvaluationCache, visit_digest
+from .checkpoint import OptimizationCheckpoint
+from .successive_halving import halving_optimizer
 
 from pyarchi.utils import create_logger
 
 logger = create_logger("utils")
 
 
-def general_optimizer(func, data_f, job_number, max_process, **kwargs):
+def general_optimizer(func, data_f, job_number, max_process, resume=False, **kwargs):
     """
     Responsible for setting up the variables used during the optimization process.
 
@@ -18,6 +23,18 @@ def general_optimizer(func, data_f, job_number, max_process, **kwargs):
     search for minimum noise starts. If the determined factor is inside a "safe" distance away from the highest possible
     value then the star is disabled and no further studies are made on it.
 
+    With the "bracket" optimization_strategy, the factors are not all calculated: the best factor of each star is
+    found with a golden-section search (see :func:`~pyarchi.utils.optimization.bracket_search.bracket_optimizer`),
+    which starts from a coarse grid and expands its bracket on its own. It calculates fewer factors, but can miss the
+    best one of the grid strategy. With the grid strategy and a halving_decimation above one, the factors of
+    each range are pruned with decimated images, by successive halving (see
+    :func:`~pyarchi.utils.optimization.successive_halving.halving_optimizer`).
+
+    If the evaluation_cache option is set, the noise of the factors that were calculated before, for the same visit and
+    configuration, is read from the :class:`~pyarchi.utils.optimization.evaluation_cache.EvaluationCache`. Unless the
+    optimization_checkpoint option is disabled, the state of the optimization is stored after every calculation, in an
+    :class:`~pyarchi.utils.optimization.checkpoint.OptimizationCheckpoint`, so that a stopped run can be resumed.
+
     Also responsible for creating .txt files with all the relevant information
     Parameters
     ----------
@@ -28,7 +45,10 @@ def general_optimizer(func, data_f, job_number, max_process, **kwargs):
     job_number:
         JOb number assigned by the SLURM workload manager
     max_process:
-        Maximum number of processes that can be launched during this routine
+        Maximum number of processes that can be launched during this routine. The processes are kept alive, with the
+        data loaded, during the entire optimization, and the images are shared between them (shared_frames option)
+    resume:
+        If True, continues the optimization stored in the checkpoint of the job, only calculating the missing factors
     Returns
     -------
     optimized_dict:
@@ -38,7 +58,6 @@ def general_optimizer(func, data_f, job_number, max_process, **kwargs):
 
     low, high = kwargs["val_range"]
     step = kwargs["step"]
-    logging.disable(logging.INFO)
 
     value_range = np.arange(low, high + step, step)
     path = os.path.join(kwargs["results_folder"], str(job_number))
@@ -54,78 +73,139 @@ def general_optimizer(func, data_f, job_number, max_process, **kwargs):
         file.write("Background grid - {}\n".format(kwargs["grid_bg"]))
         file.write("Factors Stars: -> \n")
 
-    try:
-        min_cvs, optimized_dict = optimizer(
-            value_range, max_process, func, data_f, file_path, **kwargs
-        )
-    except:
-        logger.fatal("Problem on the optimization routine. Refer to logs")
-        return -1
-
-    increase = high - low
-    iterations = 0
-    to_disable = []
-
-    while len(to_disable) != len(optimized_dict.values()):
-        to_disable = []
+    # the processes, and the images, are kept during all calls to the optimizer and the tuner
+    shared = data_f.shared_frames(kwargs.get("shared_frames", 1), **kwargs)
+    pool = WorkerPool(
+        max_process,
+        func,
+        data_f,
+        timeout=kwargs.get("optim_timeout", 0),
+        retries=kwargs.get("optim_retries", 1),
+        session=kwargs.get("optimization_session", 1),
+    )
+    # the DRP outputs are identified once, for both the evaluation cache and the checkpoint
+    use_checkpoint = resume or kwargs.get("optimization_checkpoint", 1)
+    visit = None
+    if use_checkpoint or kwargs.get("evaluation_cache", ""):
+        try:
+            visit = visit_digest(**kwargs)
+        except Exception:
+            logger.warning("Could not identify the DRP outputs of the visit", exc_info=True)
+
+    # factors that were calculated before, for the same visit and configuration, are not calculated again
+    cache = EvaluationCache.from_config(visit, **kwargs)
+    if use_checkpoint:
+        cache = OptimizationCheckpoint(path, resume, cache, visit, **kwargs)
+
+    def checkpoint(**state):
+        if cache is not None:
+            cache.record_state(**state)
 
-        for key, val in optimized_dict.items():
-            if val < high - 2 * step:  # allow for some tolerance near the border
-                to_disable.append(int(key))
+    logging.disable(logging.INFO)
 
-        print(
-            "DISABLING: {} - Last run in the interval: {} <-> {}".format(
-                to_disable, low, high
+    with shared, pool:
+        bracket = kwargs.get("optimization_strategy", "grid") == "bracket"
+        grid_optimizer = halving_optimizer if kwargs.get("halving_decimation", 1) > 1 else optimizer
+
+        if bracket:
+            try:
+                min_cvs, optimized_dict, high = bracket_optimizer(
+                    max_process, func, data_f, file_path, pool=pool, cache=cache, **kwargs
+                )
+            except:
+                logger.fatal("Problem on the optimization routine. Refer to logs")
+                return -1
+        else:
+            try:
+                min_cvs, optimized_dict = grid_optimizer(
+                    value_range, max_process, func, data_f, file_path, pool=pool, cache=cache, **kwargs
+                )
+            except:
+                logger.fatal("Problem on the optimization routine. Refer to logs")
+                return -1
+
+            checkpoint(
+                stage="grid", round=0, interval=[low, high], disabled=[], min_cvs=min_cvs, optimized=optimized_dict
             )
-        )
-        if len(to_disable) == len(optimized_dict):
-            logger.fatal("All stars were disabled")
-            break
-
-        low, high = high - 2 * step, high + increase - 2 * step
-        value_range = np.arange(low, high + step, step)
-        min_cvs_tmp, optimized_dict_tmp = optimizer(
-            value_range, max_process, func, data_f, file_path, to_disable, **kwargs
-        )
-
-        for (star,cdpp,) in min_cvs_tmp.items():  # update old values if the new ones are better
-
-            if cdpp < min_cvs[star]:
-                min_cvs[star] = cdpp
-                optimized_dict[str(star)] = optimized_dict_tmp[str(star)]
-
-        iterations += 1
-        if iterations > kwargs["optimization_extensions"]:
-            logger.fatal("Reached max iters. Last values: {} {}".format(low, high))
-            break
 
-    if kwargs["fine_tune_circle"] and "circle" in kwargs["method"]:
-        vals = kwargs["method"].split("+")
+            increase = high - low
+            iterations = 0
+            to_disable = []
 
-        to_disable = []
+            while len(to_disable) != len(optimized_dict.values()):
+                to_disable = []
+
+                for key, val in optimized_dict.items():
+                    if val < high - 2 * step:  # allow for some tolerance near the border
+                        to_disable.append(int(key))
+
+                print(
+                    "DISABLING: {} - Last run in the interval: {} <-> {}".format(
+                        to_disable, low, high
+                    )
+                )
+                if len(to_disable) == len(optimized_dict):
+                    logger.fatal("All stars were disabled")
+                    break
+
+                low, high = high - 2 * step, high + increase - 2 * step
+                value_range = np.arange(low, high + step, step)
+                min_cvs_tmp, optimized_dict_tmp = grid_optimizer(
+                    value_range, max_process, func, data_f, file_path, to_disable, pool=pool, cache=cache, **kwargs
+                )
+
+                for (star,cdpp,) in min_cvs_tmp.items():  # update old values if the new ones are better
+
+                    if cdpp < min_cvs[star]:
+                        min_cvs[star] = cdpp
+                        optimized_dict[str(star)] = optimized_dict_tmp[str(star)]
+
+                iterations += 1
+                checkpoint(
+                    stage="grid",
+                    round=iterations,
+                    interval=[low, high],
+                    disabled=to_disable,
+                    min_cvs=min_cvs,
+                    optimized=optimized_dict,
+                )
+                if iterations > kwargs["optimization_extensions"]:
+                    logger.fatal("Reached max iters. Last values: {} {}".format(low, high))
+                    break
+
+        if kwargs["fine_tune_circle"] and "circle" in kwargs["method"]:
+            vals = kwargs["method"].split("+")
 
-        if len(vals) == 1 and vals[0] == "circle":
             to_disable = []
 
-        elif vals[0] == "circle":
-            to_disable = [i for i in data_f.stars[1:].number]
-        elif len(vals) != 1 and vals[1] == "circle":
-            to_disable = [0]
-
-        min_cvs_tmp, optimized_dict_tmp = circular_tuner(
-            best_values = optimized_dict.values(),
-            max_process = max_process,
-            func = func,
-            data_f = data_f,
-            file_path = file_path,
-            to_disable = to_disable,
-            **kwargs
-        )
+            if len(vals) == 1 and vals[0] == "circle":
+                to_disable = []
+
+            elif vals[0] == "circle":
+                to_disable = [i for i in data_f.stars[1:].number]
+            elif len(vals) != 1 and vals[1] == "circle":
+                to_disable = [0]
+
+            checkpoint(stage="tuner", round=0, disabled=to_disable, min_cvs=min_cvs, optimized=optimized_dict)
+            tuner = bracket_tuner if bracket else circular_tuner
+            min_cvs_tmp, optimized_dict_tmp = tuner(
+                best_values = optimized_dict.values(),
+                max_process = max_process,
+                func = func,
+                data_f = data_f,
+                file_path = file_path,
+                to_disable = to_disable,
+                pool = pool,
+                cache = cache,
+                **kwargs
+            )
+
+            for (star, cdpp,) in min_cvs_tmp.items():  # update old values if the new ones are better
+                if cdpp < min_cvs[star]:
+                    min_cvs[star] = cdpp
+                    optimized_dict[str(star)] = optimized_dict_tmp[str(star)]
 
-        for (star, cdpp,) in min_cvs_tmp.items():  # update old values if the new ones are better
-            if cdpp < min_cvs[star]:
-                min_cvs[star] = cdpp
-                optimized_dict[str(star)] = optimized_dict_tmp[str(star)]
+        checkpoint(stage="done", min_cvs=min_cvs, optimized=optimized_dict)
 
     logging.disable(logging.NOTSET)
 
@@ -0,0 +1,227 @@
+import queue
+import time
+from collections import deque
+from contextlib import nullcontext
+from multiprocessing import Process, Queue
+
+from pyarchi.utils import create_logger
+
+logger = create_logger("utils")
+
+
+def _worker_loop(tasks, results, index, func, data_f, session):
+    """
+    Main loop of a worker process of the :class:`WorkerPool`. The same data object is used for all tasks. If the
+    session is enabled, they run inside an optimization session, so the data is only loaded once by each process.
+
+    Each task is a function with the same arguments as
+    :func:`~pyarchi.utils.optimization.optimizer.run_function`, which puts its result in the given queue.
+    """
+    with data_f.optimization_session() if session else nullcontext():
+        for task_id, target, factors, to_disable, kwargs in iter(tasks.get, None):
+            data_f.enable_stars()  # each task decides which stars are disabled
+
+            collector = queue.SimpleQueue()
+            try:
+                target(collector, func, factors, data_f, to_disable, **kwargs)
+            except Exception:
+                logger.exception("Error in task {} of the optimization worker {}".format(task_id, index))
+
+            results.put((index, task_id, collector.get() if not collector.empty() else -1))
+
+
+class WorkerPool:
+    """
+        Pool of processes that are kept alive during the entire optimization, so that each one only loads the data
+        once. Each process has its own queue of tasks, which allows to know the task that each one is running: if a
+        process dies, or a task takes longer than the timeout, the process is replaced and the task is sent again,
+        up to a number of retries.
+
+        The processes are started when needed, up to the given number, and are not daemonic, so that they can start
+        their own processes (e.g. with the photometry_processes option).
+
+        Parameters
+        ---------------
+        processes:
+            Maximum number of processes
+        func:
+            function that launches the photometric process
+        data_f:
+            :class:`pyarchi.main.initial_loads.Data` object, copied to each process
+        timeout:
+            Maximum number of seconds that a task can take. If it's zero, there is no limit
+        retries:
+            Number of times that a task is sent again after its process dies or times out
+        session:
+            If True, each process keeps its data loaded in a
+            :meth:`~pyarchi.data_objects.Data.Data.optimization_session`
+    """
+
+    def __init__(self, processes, func, data_f, timeout=0, retries=1, session=True):
+        self.processes = max(int(processes), 1)
+        self.timeout = timeout
+        self.retries = retries
+        self.session = session
+
+        self._func = func
+        self._data_f = data_f
+
+        self._results = Queue()
+        self._workers = []
+        self._tasks = []
+        self._round = 0  # results of previous calls to map, from processes that timed out, are discarded
+
+    def _start_worker(self, index):
+        """
+        Starts the process with the given index, replacing the previous one if it exists
+        """
+        tasks = Queue()
+        worker = Process(
+            target=_worker_loop, args=(tasks, self._results, index, self._func, self._data_f, self.session)
+        )
+        worker.start()
+
+        if index < len(self._workers):
+            self._workers[index] = worker
+            self._tasks[index] = tasks
+        else:
+            self._workers.append(worker)
+            self._tasks.append(tasks)
+
+    def map(self, target, factor_batches, to_disable, on_result=None, **kwargs):
+        """
+        Runs the target function once for each batch of factors, on the processes of the pool
+
+        Parameters
+        ----------
+        target:
+            Function with the same arguments as :func:`~pyarchi.utils.optimization.optimizer.run_function`
+        factor_batches:
+            List with the factors of each task
+        to_disable:
+            Stars to disable in all tasks
+        on_result:
+            Function called with the index and the result of each task, as soon as it finishes, e.g. to store it
+            before the other tasks are done. It's not called for the tasks that failed
+        kwargs
+
+        Returns
+        -------
+            List with the result of each task, in the same order as the batches. A task that failed returns -1
+
+        Raises
+        ------
+            Exception if a task failed more times than the allowed retries
+        """
+        for index in range(len(self._workers), min(self.processes, len(factor_batches))):
+            self._start_worker(index)
+
+        self._round += 1
+        pending = deque(range(len(factor_batches)))
+        running = {}  # index of the process -> (task, start time)
+        attempts = [0] * len(factor_batches)
+        results = [None] * len(factor_batches)
+
+        while pending or running:
+            for index in range(len(self._workers)):
+                if pending and index not in running:
+                    task_id = pending.popleft()
+                    self._tasks[index].put(
+                        ((self._round, task_id), target, factor_batches[task_id], to_disable, kwargs)
+                    )
+                    running[index] = (task_id, time.time())
+
+            try:
+                index, (round_number, task_id), result = self._results.get(timeout=0.5)
+            except queue.Empty:
+                pass
+            else:
+                if round_number == self._round and running.get(index, (None,))[0] == task_id:
+                    del running[index]
+                    results[task_id] = result
+                    if on_result is not None and result != -1:
+                        on_result(task_id, result)
+
+            for index, (task_id, start) in list(running.items()):
+                dead = not self._workers[index].is_alive()
+                late = self.timeout and time.time() - start > self.timeout
+                if not (dead or late):
+                    continue
+
+                logger.warning(
+                    "Optimization worker {} {} while running task {}".format(
+                        index, "died" if dead else "timed out", task_id
+                    )
+                )
+                self._workers[index].terminate()
+                self._workers[index].join()
+                self._start_worker(index)
+                del running[index]
+
+                attempts[task_id] += 1
+                if attempts[task_id] > self.retries:
+                    raise Exception("Task {} of the optimization failed {} times".format(task_id, attempts[task_id]))
+                pending.appendleft(task_id)
+
+        return results
+
+    def close(self):
+        """
+        Stops all processes
+        """
+        for tasks in self._tasks:
+            tasks.put(None)
+
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+
+        self._workers = []
+        self._tasks = []
+
+    def terminate(self):
+        """
+        Stops all processes, without waiting for the current tasks
+        """
+        for worker in self._workers:
+            worker.terminate()
+            worker.join()
+
+        self._workers = []
+        self._tasks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+
+def map_tasks(pool, target, factor_batches, func, data_f, to_disable=[], on_result=None, **kwargs):
+    """
+    Runs the target function once for each batch of factors, on the given pool. If no pool is given, a temporary one is
+    created, with one process for each batch, following the optim_timeout, optim_retries and optimization_session
+    options. The on_result function is called with each result as soon as its task finishes (see
+    :meth:`WorkerPool.map`).
+
+    Returns
+    -------
+        List with the result of each task, in the same order as the batches
+    """
+    if pool is not None:
+        return pool.map(target, factor_batches, to_disable, on_result, **kwargs)
+
+    with WorkerPool(
+        len(factor_batches),
+        func,
+        data_f,
+        timeout=kwargs.get("optim_timeout", 0),
+        retries=kwargs.get("optim_retries", 1),
+        session=kwargs.get("optimization_session", 1),
+    ) as pool:
+        return pool.map(target, factor_batches, to_disable, on_result, **kwargs)
@@ -0,0 +1,178 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from pyarchi.data_objects import Data
+from pyarchi.routines import photometry
+from pyarchi.utils.misc.path_searcher import clear_visit_indexes
+
+# position of each star, in pixels, relative to the central one, and its peak flux. The last star is close to the
+# bottom edge of the image, so that its masks reach it
+STARS = np.array([[0, 0], [40, 10], [-30, 45], [20, -55], [92, 0]], dtype=float)
+PEAKS = [50000, 30000, 20000, 15000, 15000]
+
+CONFIGURATION = dict(
+    official_curve="OPTIMAL", data_type="real", method="shape", initial_detect="fits", detect_mode="static",
+    uncertainties=1, grid_bg=0, repeat_removal=0, optimize=1, optimization_extensions=2, optim_processes=2,
+    fine_tune_circle=0, val_range=[1, 4], step=1, headless=1, low_memory=0, CDPP_type="K2", debug=0,
+    show_results=0, plot_realtime=0, save_gif=0, report_pictures=0, export_text=0, export_fit=0,
+)
+
+
+def synthetic_images(number_images, rng):
+    """
+    Images of a visit, with gaussian stars that rotate around the central one, as the roll angle changes, and NaNs
+    outside the circular field of view
+
+    Returns
+    -------
+    cube:
+        Images
+    roll:
+        Roll angle of each image
+    centroids:
+        Position of the central star in each image
+    """
+    roll = (10 + 1.8 * np.arange(number_images)) % 360
+    centroids = 512 + rng.normal(0, 0.3, (number_images, 2))
+
+    rows, cols = np.mgrid[:200, :200]
+    cube = np.zeros((number_images, 200, 200), np.float32)
+    for index in range(number_images):
+        angle = np.deg2rad(roll[index] - roll[0])
+        rotation = np.array([[np.cos(angle), np.sin(angle)], [-np.sin(angle), np.cos(angle)]])
+
+        image = rng.normal(20, 3, (200, 200))
+        for star, (position, peak) in enumerate(zip(STARS, PEAKS)):
+            position = rotation @ position if star else np.zeros(2)
+            row = 100 + position[0] + centroids[index, 1] - 512
+            col = 100 + position[1] + centroids[index, 0] - 512
+            image += peak * np.exp(-((rows - row) ** 2 + (cols - col) ** 2) / (2 * 3.0 ** 2))
+
+        image[(rows - 100) ** 2 + (cols - 100) ** 2 > 99 ** 2] = np.nan
+        cube[index] = image
+
+    return cube, roll, centroids
+
+
+def write_visit(folder, number_images=12):
+    """
+    Writes the DRP outputs of a synthetic visit: SubArray, official light curves and StarCatalogue
+    """
+    rng = np.random.default_rng(1)
+    cube, roll, centroids = synthetic_images(number_images, rng)
+    time = 59000 + np.arange(number_images) / (24 * 60 * 2)
+
+    ron = fits.BinTableHDU.from_columns([fits.Column(name="RON", format="E", array=np.full(number_images, 5.0))])
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(cube), ron]).writeto(
+        str(folder / "CH_PR_SCI_COR_SubArray_V0100.fits")
+    )
+
+    for curve, radius in [("DEFAULT", 25), ("OPTIMAL", 20), ("RSUP", 30), ("RINF", 15)]:
+        columns = {
+            "ROLL_ANGLE": roll, "MJD_TIME": time, "CENTROID_X": centroids[:, 0], "CENTROID_Y": centroids[:, 1],
+            "LOCATION_X": np.full(number_images, 512.0), "LOCATION_Y": np.full(number_images, 512.0),
+            "BACKGROUND": np.full(number_images, 100.0), "DARK": np.full(number_images, 10.0),
+            "FLUX": rng.normal(1e6, 100, number_images), "FLUXERR": np.full(number_images, 100.0),
+        }
+        table = fits.BinTableHDU.from_columns(
+            [fits.Column(name=name, format="D", array=values) for name, values in columns.items()]
+        )
+        table.header["AP_RADI"] = radius
+        table.header["EXPTIME"] = 30.0
+        table.header["NEXP"] = 1
+        fits.HDUList([fits.PrimaryHDU(), table]).writeto(
+            str(folder / "CH_PR_SCI_RAW_Lightcurve-{}_V0100.fits".format(curve))
+        )
+
+    # sky coordinates that the fits initial detection places at the positions of the first image
+    ra_center, dec_center = 100.0, 20.0
+    angle = np.deg2rad(360 - roll[0])
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    ras, decs = [ra_center], [dec_center]
+    for position in STARS[1:]:
+        ra_offset, dec_offset = np.linalg.solve(rotation, [position[1], -position[0]])
+        ras.append(ra_center - ra_offset / 3600 / np.cos(np.deg2rad(dec_center)))
+        decs.append(dec_center - dec_offset / 3600)
+
+    catalogue = fits.BinTableHDU.from_columns(
+        [
+            fits.Column(name="RA", format="D", array=ras),
+            fits.Column(name="DEC", format="D", array=decs),
+            fits.Column(name="MAG_CHEOPS", format="D", array=9 + np.arange(len(STARS))),
+        ]
+    )
+    catalogue.header["CENT_RA"] = ra_center
+    catalogue.header["CENT_DEC"] = dec_center
+    fits.HDUList([fits.PrimaryHDU(), catalogue]).writeto(str(folder / "CH_PR_EXT_StarCatalogue_V0100.fits"))
+
+
+@pytest.fixture(scope="session")
+def synthetic_cube():
+    """
+    Images of the synthetic visit
+    """
+    return synthetic_images(12, np.random.default_rng(1))[0]
+
+
+@pytest.fixture(scope="session")
+def visit_config(tmp_path_factory):
+    """
+    Configuration values of a run over the synthetic visit
+    """
+    folder = tmp_path_factory.mktemp("visit")
+    (folder / "data").mkdir()
+    write_visit(folder / "data")
+
+    results = tmp_path_factory.mktemp("results")
+    return dict(CONFIGURATION, base_folder=str(folder) + "/", optimized_factors=str(results), results_folder=str(results))
+
+
+@pytest.fixture
+def run_photometry(visit_config):
+    """
+    Runs the photometry of the synthetic visit, with the given changes to the configuration and mask factor
+
+    Returns
+    -------
+        Function that returns the light curves, uncertainties, out of bounds flags and last positions of the stars
+    """
+    def run(factor=3, **changes):
+        config = dict(visit_config, **changes)
+        clear_visit_indexes()
+
+        data = Data(config["base_folder"])
+        assert data.load_parameters(factor, **config) == 0
+        data = photometry(data_fits=data, save_folder=config["results_folder"], **config)
+        assert data != -1
+
+        return {
+            "curves": np.asarray(data.all_curves, dtype=float),
+            "uncertainties": np.asarray(data.all_uncertainties, dtype=float),
+            "out_bounds": [star.out_bound for star in data.stars],
+            "positions": np.array([np.asarray(star.positions, dtype=float)[-1] for star in data.stars]),
+            "factor_curves": [star.factor_curves for star in data.stars],
+            "factor_out_bounds": [star.factor_out_bounds for star in data.stars],
+        }
+
+    return run
+
+
+@pytest.fixture
+def assert_same_photometry():
+    """
+    Checks that two results of the run_photometry fixture are the same, apart from the rounding of the sums
+    """
+    def compare(results, expected):
+        np.testing.assert_allclose(results["curves"], expected["curves"], rtol=1e-9)
+        np.testing.assert_allclose(results["uncertainties"], expected["uncertainties"], rtol=1e-9)
+        np.testing.assert_array_equal(results["positions"], expected["positions"])
+        assert results["out_bounds"] == expected["out_bounds"]
+        assert results["factor_out_bounds"] == expected["factor_out_bounds"]
+
+        for star_curves, expected_curves in zip(results["factor_curves"], expected["factor_curves"]):
+            assert star_curves.keys() == expected_curves.keys()
+            for factor, curve in star_curves.items():
+                np.testing.assert_allclose(curve, expected_curves[factor], rtol=1e-9)
+
+    return compare
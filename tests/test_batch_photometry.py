@@ -0,0 +1,48 @@
+import pytest
+
+# the last star of the synthetic visit is close to the image edge: its shape masks, and the largest circular ones
+# without a background grid, reach the last row of the image and overlap the NaNs outside the field of view
+MASKS = [("shape", 3), ("shape", 8), ("circle", 12)]
+
+
+@pytest.mark.parametrize("low_memory", [0, 1])
+@pytest.mark.parametrize("grid_bg", [0, 600])
+@pytest.mark.parametrize("detect_mode", ["static", "offsets"])
+@pytest.mark.parametrize("method, factor", MASKS)
+def test_batch_matches_image_by_image(run_photometry, assert_same_photometry, method, factor, detect_mode, grid_bg,
+                                      low_memory):
+    config = dict(method=method, detect_mode=detect_mode, grid_bg=grid_bg, low_memory=low_memory)
+
+    expected = run_photometry(factor, batch_photometry=0, **config)
+    results = run_photometry(factor, batch_photometry=1, **config)
+
+    if method == "shape":
+        assert expected["out_bounds"][-1]
+    assert_same_photometry(results, expected)
+
+
+@pytest.mark.parametrize("grid_bg", [0, 600])
+def test_batch_matches_image_by_image_with_virtual_grid(run_photometry, assert_same_photometry, grid_bg):
+    expected = run_photometry(3, batch_photometry=0, grid_bg=grid_bg, virtual_grid=1)
+    results = run_photometry(3, batch_photometry=1, grid_bg=grid_bg, virtual_grid=1)
+
+    assert_same_photometry(results, expected)
+
+
+@pytest.mark.parametrize("grid_bg", [0, 600])
+def test_batch_matches_image_by_image_with_layers(run_photometry, assert_same_photometry, grid_bg):
+    expected = run_photometry([2, 3, 8], batch_photometry=0, grid_bg=grid_bg)
+    results = run_photometry([2, 3, 8], batch_photometry=1, grid_bg=grid_bg)
+
+    assert expected["factor_curves"][0]
+    assert_same_photometry(results, expected)
+
+
+@pytest.mark.parametrize("grid_bg", [0, 600])
+def test_batch_matches_image_by_image_with_curve_of_growth(run_photometry, assert_same_photometry, grid_bg):
+    radii = {str(star): [6, 9, 12] for star in range(5)}
+    expected = run_photometry(radii, batch_photometry=0, method="circle", grid_bg=grid_bg)
+    results = run_photometry(radii, batch_photometry=1, method="circle", grid_bg=grid_bg)
+
+    assert expected["factor_curves"][0]
+    assert_same_photometry(results, expected)
@@ -0,0 +1,40 @@
+import pytest
+
+RADII = {str(star): [6, 9, 12] for star in range(5)}
+
+
+@pytest.mark.parametrize("low_memory", [0, 1])
+@pytest.mark.parametrize("grid_bg", [0, 600])
+@pytest.mark.parametrize("processes, batch_frames", [(1, 5), (2, 256), (3, 5)])
+@pytest.mark.parametrize("method, factor", [("shape", 3), ("circle", 12)])
+def test_chunks_match_image_by_image(run_photometry, assert_same_photometry, method, factor, processes,
+                                     batch_frames, grid_bg, low_memory):
+    config = dict(method=method, grid_bg=grid_bg, low_memory=low_memory)
+
+    expected = run_photometry(factor, batch_photometry=0, **config)
+    results = run_photometry(
+        factor, batch_photometry=1, photometry_processes=processes, batch_frames=batch_frames, **config
+    )
+
+    assert_same_photometry(results, expected)
+
+
+@pytest.mark.parametrize("processes, batch_frames", [(1, 5), (3, 5)])
+@pytest.mark.parametrize("method, factor", [("shape", [2, 3, 8]), ("circle", RADII)])
+def test_chunks_match_image_by_image_with_layers(run_photometry, assert_same_photometry, method, factor, processes,
+                                                 batch_frames):
+    expected = run_photometry(factor, batch_photometry=0, method=method, grid_bg=600)
+    results = run_photometry(
+        factor, batch_photometry=1, photometry_processes=processes, batch_frames=batch_frames, method=method,
+        grid_bg=600,
+    )
+
+    assert expected["factor_curves"][0]
+    assert_same_photometry(results, expected)
+
+
+def test_chunks_match_image_by_image_with_offsets(run_photometry, assert_same_photometry):
+    expected = run_photometry(3, batch_photometry=0, detect_mode="offsets")
+    results = run_photometry(3, batch_photometry=1, detect_mode="offsets", photometry_processes=3, batch_frames=5)
+
+    assert_same_photometry(results, expected)
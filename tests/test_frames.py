@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from pyarchi.data_objects.Frames import Frames, SharedFrames
+
+
+def write_cube(path, raw, **scaling):
+    """
+    Writes the raw cube to the first extension of a fits file, with the given BSCALE/BZERO keywords
+    """
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(raw)]).writeto(path)
+    with fits.open(path, mode="update", do_not_scale_image_data=True) as hdulist:
+        for key, value in scaling.items():
+            hdulist[1].header[key] = value
+
+
+def random_cube(dtype, shape=(4, 6, 5)):
+    rng = np.random.default_rng(1)
+    if np.dtype(dtype).kind == "f":
+        return rng.normal(size=shape).astype(dtype)
+
+    limits = np.iinfo(dtype)
+    cube = rng.integers(limits.min, limits.max, size=shape, endpoint=True).astype(dtype)
+    cube[0, 0, :2] = limits.min, limits.max
+    return cube
+
+
+CASES = {
+    "uint16": (np.int16, {"BZERO": 32768}),
+    "uint32": (np.int32, {"BZERO": 2147483648}),
+    "int8": (np.uint8, {"BZERO": -128}),
+    "int16_float_scaling": (np.int16, {"BSCALE": 0.5, "BZERO": 10.0}),
+    "int32_float_scaling": (np.int32, {"BSCALE": 0.5, "BZERO": 10.0}),
+    "float32_scaling": (np.float32, {"BSCALE": 2.0, "BZERO": 1.0}),
+    "not_scaled": (np.int32, {}),
+}
+
+
+@pytest.fixture(params=sorted(CASES))
+def cube_file(request, tmp_path):
+    raw_dtype, scaling = CASES[request.param]
+    path = str(tmp_path / "{}.fits".format(request.param))
+    write_cube(path, random_cube(raw_dtype), **scaling)
+    return path
+
+
+def test_images_match_astropy(cube_file):
+    expected = fits.getdata(cube_file, 1)
+    frames = Frames(cube_file)
+
+    assert len(frames) == expected.shape[0]
+    assert frames.shape == expected.shape[1:]
+    for index in range(len(frames)):
+        image = frames[index]
+        assert image.dtype.newbyteorder("=") == expected.dtype.newbyteorder("=")
+        assert np.array_equal(image, expected[index])
+        assert not image.flags.writeable
+
+
+def test_decimated_images_match_astropy(cube_file):
+    expected = fits.getdata(cube_file, 1)[::2]
+    frames = Frames(cube_file).decimated(2)
+
+    assert len(frames) == expected.shape[0]
+    for index in range(len(frames)):
+        assert np.array_equal(frames[index], expected[index])
+
+
+def test_shared_images_match_astropy(cube_file):
+    expected = fits.getdata(cube_file, 1)
+    try:
+        frames = SharedFrames(cube_file)
+    except (MemoryError, OSError):
+        pytest.skip("shared memory is not available")
+
+    try:
+        for index in range(len(frames)):
+            assert frames[index].dtype.newbyteorder("=") == expected.dtype.newbyteorder("=")
+            assert np.array_equal(frames[index], expected[index])
+    finally:
+        frames.close()
@@ -0,0 +1,71 @@
+import glob
+
+import pytest
+
+from pyarchi.utils.misc import path_searcher
+from pyarchi.utils.misc.path_searcher import VisitIndex
+
+
+@pytest.fixture
+def visit_folder(tmp_path):
+    folder = tmp_path / "visit" / "data"
+    folder.mkdir(parents=True)
+    for name in ["CH_PR_SCI_COR_SubArray_V0100.fits", "CH_PR_EXT_StarCatalogue_V0100.fits",
+                 "CH_PR_SCI_RAW_Lightcurve-DEFAULT_V0100.fits"]:
+        (folder / name).touch()
+
+    return tmp_path / "visit"
+
+
+@pytest.fixture
+def listings(monkeypatch):
+    """
+    Counts the listings of the base folder
+    """
+    calls = []
+    original_glob = glob.glob
+
+    def counted_glob(pattern, *args, **kwargs):
+        calls.append(pattern)
+        return original_glob(pattern, *args, **kwargs)
+
+    monkeypatch.setattr(path_searcher.glob, "glob", counted_glob)
+    return calls
+
+
+def test_outputs_are_found_with_a_single_listing(visit_folder, listings):
+    visit_index = VisitIndex(str(visit_folder), "real")
+
+    for _ in range(3):
+        assert visit_index.find("subarray").endswith("SubArray_V0100.fits")
+        assert visit_index.find("stars").endswith("StarCatalogue_V0100.fits")
+        assert visit_index.find("default", "DEFAULT").endswith("DEFAULT_V0100.fits")
+
+    assert len(listings) == 1
+
+
+def test_missing_output_is_only_searched_again_once(visit_folder, listings):
+    visit_index = VisitIndex(str(visit_folder), "real")
+
+    for _ in range(3):
+        for curve in path_searcher.OFFICIAL_CURVES[1:]:
+            assert visit_index.find("default", curve) is None
+
+    assert len(listings) == 2
+
+
+def test_output_created_after_the_first_scan_is_found(visit_folder, listings):
+    visit_index = VisitIndex(str(visit_folder), "real")
+    assert visit_index.find("subarray") is not None
+
+    (visit_folder / "data" / "CH_PR_SCI_RAW_Lightcurve-OPTIMAL_V0100.fits").touch()
+    assert visit_index.find("default", "OPTIMAL").endswith("OPTIMAL_V0100.fits")
+    assert len(listings) == 2
+
+    # after the second scan, new outputs are only found by a new scan
+    (visit_folder / "data" / "CH_PR_SCI_RAW_Lightcurve-RSUP_V0100.fits").touch()
+    assert visit_index.find("default", "RSUP") is None
+
+    visit_index.scan()
+    assert visit_index.find("default", "RSUP").endswith("RSUP_V0100.fits")
+    assert len(listings) == 3
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from pyarchi.utils.image_processing import shape_increase, shape_layers
+
+
+def recursive_shape_increase(data, factor, fac=1):
+    """
+    Recursive, pixel by pixel, increase of the mask that was used before the distance transform. The points outside
+    the last row and column are clipped to the edge, as for the first ones (the old code referred to an undefined
+    name there)
+    """
+    if factor < 1:
+        return data
+
+    positions = np.where(data != 0)
+    new = np.zeros(data.shape)
+    cases = [[0, 0], [0, 1], [1, 0], [1, 1], [0, -1], [-1, 0], [-1, -1], [1, -1], [-1, 1]]
+
+    for pos in zip(positions[0], positions[1]):
+        for val_x, val_y in cases:
+            if pos[0] + val_x < 0:
+                val_x = -pos[0]
+            elif pos[0] + val_x >= data.shape[0]:
+                val_x = data.shape[0] - pos[0] - 1
+
+            if pos[1] + val_y < 0:
+                val_y = -pos[1]
+            elif pos[1] + val_y >= data.shape[1]:
+                val_y = data.shape[1] - pos[1] - 1
+
+            new[pos[0] + val_x, pos[1] + val_y] = 1
+
+    if fac >= factor:
+        return new
+    return recursive_shape_increase(new, factor, fac + 1)
+
+
+def random_masks():
+    rng = np.random.default_rng(3)
+    masks = {"empty": np.zeros((30, 40))}
+
+    blob = np.zeros((30, 40))
+    blob[12:17, 15:22] = 1
+    masks["blob"] = blob
+
+    masks["scattered"] = (rng.random((30, 40)) > 0.97).astype(float)
+
+    # masks that touch each one of the image edges and corners
+    edges = np.zeros((30, 40))
+    edges[0, 5:9] = edges[-1, 20] = edges[10:14, 0] = edges[25, -1] = 1
+    masks["edges"] = edges
+
+    corners = np.zeros((30, 40))
+    corners[0, 0] = corners[-1, -1] = corners[0, -1] = corners[-1, 0] = 1
+    masks["corners"] = corners
+    return masks
+
+
+MASKS = random_masks()
+
+
+@pytest.mark.parametrize("factor", [1, 2, 3, 3.5, 7, 21])
+@pytest.mark.parametrize("name", sorted(MASKS))
+def test_matches_recursive_increase(name, factor):
+    increased = shape_increase(MASKS[name], factor)
+    expected = recursive_shape_increase(MASKS[name], factor)
+
+    assert increased.dtype == expected.dtype
+    np.testing.assert_array_equal(increased, expected)
+
+
+def test_factor_below_one_returns_the_mask():
+    mask = MASKS["blob"]
+    assert shape_increase(mask, 0.5) is mask
+    assert shape_increase(mask, 0) is mask
+
+
+@pytest.mark.parametrize("name", sorted(MASKS))
+def test_layers_match_single_increases(name):
+    factors = [0.5, 1, 2.5, 4, 9]
+    layers = shape_layers(MASKS[name], factors)
+
+    assert len(layers) == len(factors)
+    for factor, layer in zip(factors, layers):
+        np.testing.assert_array_equal(layer, shape_increase(MASKS[name], factor))
@@ -0,0 +1,105 @@
+import cv2
+import numpy as np
+import pytest
+
+from pyarchi.masks_creation.grid_conversion import change_grid
+from pyarchi.utils.image_processing import calculate_moments, get_contours, label_sources, shape_analysis
+
+
+def contour_masks(image, scaling_factor):
+    """
+    Detection with cv2.findContours that was used before the connected component labelling: the contours of the
+    thresholded image, with an area above 50 points (times the scaling factor), filled with cv2.drawContours
+    """
+    im = image.copy()
+    im /= np.nanmax(image)
+    im *= 255
+    with np.errstate(invalid="ignore"):
+        im[im > 255] = 255
+        im[im < 0] = 0
+    im = np.uint8(im)
+
+    _, thresh = cv2.threshold(im, 10, 255, 0)
+    contours, _ = cv2.findContours(thresh, 1, 2)
+
+    masks, brightness = [], []
+    for contour in contours:
+        if cv2.contourArea(contour) <= 50 * scaling_factor:
+            continue
+
+        mask = np.zeros(im.shape)
+        cv2.drawContours(mask, [contour], -1, (255, 255, 255), -1)
+        mask[np.where(mask != 0)] = 1
+        masks.append(mask)
+        brightness.append(np.nanmax(mask * image))
+
+    return masks, brightness
+
+
+def edge_image():
+    """
+    Image without NaNs, with stars cut by the image edges and corners, and a bright source with fewer than 50 points
+    """
+    rows, cols = np.mgrid[:200, :200]
+    image = np.random.default_rng(5).normal(20, 3, (200, 200))
+    for row, col, peak in [(100, 100, 50000), (1, 60, 30000), (150, 198, 20000), (0, 0, 25000), (199, 120, 15000)]:
+        image += peak * np.exp(-((rows - row) ** 2 + (cols - col) ** 2) / (2 * 3.0 ** 2))
+
+    image[40:43, 150:153] = 40000
+    return image
+
+
+@pytest.fixture(params=["visit_first", "visit_last", "edges"])
+def image(request, synthetic_cube):
+    if request.param == "edges":
+        return edge_image()
+    return np.array(synthetic_cube[0 if request.param == "visit_first" else -1], dtype=np.float64)
+
+
+@pytest.mark.parametrize("scaling_factor", [1, 3])
+def test_labelling_matches_contours(image, scaling_factor):
+    image = change_grid(image, scaling_factor)
+
+    masks, brightness = get_contours(image, scaling_factor)
+    expected_masks, expected_brightness = contour_masks(image, scaling_factor)
+
+    assert len(masks) == len(expected_masks) > 1
+    for mask, expected in zip(masks, expected_masks):
+        np.testing.assert_array_equal(mask, expected)
+    np.testing.assert_array_equal(brightness, expected_brightness)
+
+
+@pytest.mark.parametrize("scaling_factor", [1, 3])
+def test_source_centers_match_moments(image, scaling_factor):
+    image = change_grid(image, scaling_factor)
+    bg_grid = 200 * scaling_factor if scaling_factor != 1 else 0
+
+    sources = label_sources(image, scaling_factor)
+    expected_masks, _ = contour_masks(image, scaling_factor)
+
+    centers, distances = calculate_moments(sources, bg_grid)
+    expected_centers, expected_distances = calculate_moments(expected_masks, bg_grid)
+
+    np.testing.assert_array_equal(centers, expected_centers)
+    np.testing.assert_array_equal(distances, expected_distances)
+
+
+def test_small_sources_are_removed():
+    masks, _ = get_contours(edge_image(), 1)
+    assert not any(mask[41, 151] for mask in masks)
+
+
+def test_shape_analysis_matches_contours(image):
+    sources, centers, distances = shape_analysis(image, 0)
+    expected_masks, _ = contour_masks(image, 1)
+    expected_centers, expected_distances = calculate_moments(expected_masks, 0)
+
+    # sources closer than 15 pixels to a previous one are not kept
+    assert len(sources) <= len(expected_masks)
+    for source, center, distance in zip(sources, centers, distances):
+        index = next(
+            index for index, expected in enumerate(expected_masks)
+            if np.array_equal(source.full_mask(image.shape), expected)
+        )
+        assert center == expected_centers[index]
+        assert distance == expected_distances[index]